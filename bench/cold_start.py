@@ -0,0 +1,55 @@
+"""Measure the cold start of importing the scheduler and tasks in a fresh interpreter.
+
+Usage: `python -m bench.cold_start [--runs 10]`.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENT = "import info_gap.scheduler, info_gap.task.brainstorm"
+
+
+def main():
+    """Print the median and best time of fresh imports, and the slowest modules."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules shown")
+    args = parser.parse_args()
+
+    # The bare interpreter start-up is measured too, the difference is ours
+    timings = {}
+    for label, statement in (("interpreter", "pass"), ("import", STATEMENT)):
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", statement], check=True)
+            samples.append(time.perf_counter() - started)
+        timings[label] = samples
+        print(
+            f"{label:<12} median {statistics.median(samples) * 1000:7.1f} ms  "
+            f"best {min(samples) * 1000:7.1f} ms"
+        )
+
+    # Cumulative import time of top-level modules, from `python -X importtime`
+    report = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STATEMENT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):
+            modules.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"{cumulative / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
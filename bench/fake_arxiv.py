@@ -0,0 +1,202 @@
+"""Fake arXiv API serving a synthetic corpus as Atom feeds."""
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+from info_gap.error import ValidationError
+from info_gap.query import And, Node, Not, Or, Term, parse_query
+
+# Phrases articles are made of, brainstormed queries combine them too
+TOPICS = (
+    "large language model",
+    "multi-agent",
+    "software development",
+    "code generation",
+    "program synthesis",
+    "reinforcement learning",
+    "retrieval augmented generation",
+    "graph neural network",
+    "diffusion model",
+    "abstract syntax tree",
+    "quantum computing",
+    "image generation",
+    "theorem proving",
+    "compiler optimization",
+)
+FILLER = (
+    "We propose a novel approach to",
+    "This paper studies",
+    "We present an empirical study of",
+    "We introduce a benchmark for",
+    "We revisit",
+)
+
+# An article is relevant to the benchmark request if it mentions all of these
+RELEVANT_TOPICS = ("multi-agent", "software development")
+
+Article = Dict[str, str]
+
+
+def make_corpus(size: int, relevant: float, seed: int = 0) -> List[Article]:
+    """Synthetic articles, newest first, a `relevant` fraction of them relevant."""
+    rng = random.Random(seed)
+    newest = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    corpus = []
+    for index in range(size):
+        topics = rng.sample(TOPICS, rng.randint(2, 4))
+        if rng.random() < relevant:
+            topics = [*RELEVANT_TOPICS, *topics]
+        else:
+            topics = [topic for topic in topics if topic != RELEVANT_TOPICS[0]]
+        published = newest - timedelta(hours=index)
+        corpus.append(
+            {
+                "id": f"http://arxiv.org/abs/2406.{size - index:05d}v1",
+                "title": f"On {topics[0].title()} and {topics[-1].title()}",
+                "summary": " ".join(
+                    f"{rng.choice(FILLER)} {topic}." for topic in topics
+                ),
+                "published": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        )
+    return corpus
+
+
+def write_snapshot(corpus: List[Article], path: str):
+    """Write a corpus in the format of the bulk metadata snapshot of arXiv."""
+    with open(path, "w", encoding="UTF-8") as f:
+        for article in corpus:
+            identifier, version = article["id"].rsplit("/", 1)[1].split("v")
+            created = datetime.strptime(article["published"], "%Y-%m-%dT%H:%M:%SZ")
+            record = {
+                "id": identifier,
+                "title": article["title"],
+                "abstract": article["summary"],
+                "categories": "cs.SE cs.AI",
+                "versions": [
+                    {
+                        "version": f"v{version}",
+                        "created": format_datetime(
+                            created.replace(tzinfo=timezone.utc), usegmt=True
+                        ),
+                    }
+                ],
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+def matches(node: Node, text: str) -> bool:
+    """Whether a lower-cased text matches a parsed query."""
+    if isinstance(node, Term):
+        return node.text.lower() in text
+    if isinstance(node, Not):
+        return not matches(node.child, text)
+    if isinstance(node, And):
+        return all(matches(child, text) for child in node.children)
+    if isinstance(node, Or):
+        return any(matches(child, text) for child in node.children)
+    raise TypeError(node)
+
+
+def render_feed(entries: List[Article], total: int, start: int) -> str:
+    """Atom feed of a page of results, as returned by the arXiv API."""
+    body = "".join(f"""
+  <entry>
+    <id>{article["id"]}</id>
+    <updated>{article["published"]}</updated>
+    <published>{article["published"]}</published>
+    <title>{escape(article["title"])}</title>
+    <summary>{escape(article["summary"])}</summary>
+    <author><name>Ada Bench</name></author>
+    <link href="{article["id"]}" rel="alternate" type="text/html"/>
+    <arxiv:primary_category term="cs.SE" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cs.SE" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>""" for article in entries)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"
+      xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title>Fake arXiv query results</title>
+  <id>http://arxiv.org/api/fake</id>
+  <updated>{datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{len(entries)}</opensearch:itemsPerPage>{body}
+</feed>
+"""
+
+
+class FakeArxiv:
+    """Search over a synthetic corpus, with injected latency and errors."""
+
+    results: Dict[str, List[Article]]
+
+    def __init__(
+        self, corpus: List[Article], latency: float, error_rate: float, seed: int
+    ):
+        self.corpus = corpus
+        self.texts = [f"{a['title']} {a['summary']}".lower() for a in corpus]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def search(self, query: str) -> List[Article]:
+        """Articles matching a query, newest first."""
+        with self.lock:
+            if query not in self.results:
+                try:
+                    node = parse_query(query)
+                    self.results[query] = [
+                        article
+                        for article, text in zip(self.corpus, self.texts)
+                        if matches(node, text)
+                    ]
+                except ValidationError:
+                    self.results[query] = []
+            return self.results[query]
+
+    def respond(self, url: str) -> Tuple[int, str]:
+        """Status and body of the response to an API request."""
+        time.sleep(self.latency)
+        with self.lock:
+            failed = self.rng.random() < self.error_rate
+        if failed:
+            return 503, "Service Unavailable"
+        params = parse_qs(urlparse(url).query)
+        results = self.search(params.get("search_query", [""])[0])
+        start = int(params.get("start", ["0"])[0])
+        size = int(params.get("max_results", ["10"])[0])
+        return 200, render_feed(results[start : start + size], len(results), start)
+
+    def serve(self, port: int = 0) -> ThreadingHTTPServer:
+        """Serve the API on localhost in a daemon thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handler of API requests."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Respond with a page of results."""
+                status, body = fake.respond(self.path)
+                data = body.encode("UTF-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/atom+xml")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                """Silence the access log."""
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
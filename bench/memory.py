@@ -0,0 +1,64 @@
+"""Measure the memory held by queued feed tasks.
+
+Usage: `python -m bench.memory [--tasks 5000]`. Articles are parsed from the Atom feed
+of the fake arXiv API, as the arXiv client does, then turned into feed tasks by a
+search; the bytes still allocated once the page is dropped are held by the tasks.
+"""
+
+import argparse
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+
+def main(argv=None) -> int:
+    """Print the bytes allocated per queued feed task."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=5000, help="tasks to queue")
+    parser.add_argument("--batch-size", type=int, default=1, help="articles per task")
+    args = parser.parse_args(argv)
+
+    for key, value in {"DEDUP_PATH": "", "PRERANK_THRESHOLD": ""}.items():
+        os.environ.setdefault(key, value)
+
+    # pylint: disable=import-outside-toplevel
+    import arxiv  # type: ignore
+    import feedparser  # type: ignore
+    from bench.fake_arxiv import make_corpus, render_feed
+    from examples.coding_agent import REQUEST
+    from info_gap.model import Search
+    from info_gap.task.search import SearchTask
+
+    search = SearchTask(
+        requests=[REQUEST], search=Search(query="bench"), batch_size=args.batch_size
+    )
+    corpus = make_corpus(args.tasks + 1, 0.1)
+
+    def parse(articles):
+        # A file object, feedparser would try a string as a URL and cache it
+        data = render_feed(articles, len(articles), 0).encode("UTF-8")
+        feed = feedparser.parse(io.BytesIO(data))
+        # pylint: disable-next=protected-access
+        return [arxiv.Result._from_feed_entry(entry) for entry in feed.entries]
+
+    # Warm up the ranker, the deduplication store and the shared prompts
+    list(search.feed_tasks(REQUEST, parse(corpus[:1])))
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = list(search.feed_tasks(REQUEST, parse(corpus[1:])))
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"tasks              {len(tasks)}")
+    print(f"bytes_per_task     {(after - before) / len(tasks):.0f}")
+    print(f"bytes_per_article  {(after - before) / args.tasks:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Mock OpenAI-compatible chat completion endpoint."""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Tuple, Union
+from bench.fake_arxiv import RELEVANT_TOPICS, TOPICS
+
+ARTICLE_PATTERN = re.compile(r"Title: '(.*?)' Abstract: '(.*?)'", re.DOTALL)
+QUERIES_PATTERN = re.compile(r"Suggest (\d+) different queries")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count of a text."""
+    return max(1, len(text.split()))
+
+
+def judge(title: str, summary: str, structured: bool = False) -> str:
+    """Answer whether an article is relevant, in the format asked by feed tasks."""
+    text = f"{title} {summary}".lower()
+    accepted = all(topic in text for topic in RELEVANT_TOPICS)
+    if accepted:
+        reason = (
+            "The exhaustive list of agents is `Planner, Coder, Tester`. "
+            "The agents communicate by `a shared message pool`. "
+            "The agents are designed for `software development`."
+        )
+    else:
+        reason = (
+            "The paper is not about automatic software development with large "
+            "language models and multi-agent, because `it is about other topics`."
+        )
+    if structured:
+        return json.dumps({"accepted": accepted, "reason": reason})
+    return f"{'Yes!' if accepted else 'No!'} {reason}"
+
+
+def repair(messages: List[Dict[str, str]]) -> str:
+    """Answer a request to rewrite a malformed reply, in the format asked."""
+    instruction = messages[0]["content"]
+    if "search with keyword" in instruction:
+        return f"Sure! I want to search with keyword `{TOPICS[0]}`."
+    if '"queries"' in instruction:
+        return json.dumps({"queries": [f'"{TOPICS[0]}"']})
+    if '"query"' in instruction:
+        return json.dumps({"query": f'"{TOPICS[0]}"'})
+    if '"accepted"' in instruction:
+        return json.dumps({"accepted": False, "reason": "The reply is repaired."})
+    return "No! The reply is repaired."
+
+
+class MockOpenAI:
+    """Chat completions answering the prompts of info-gap tasks.
+
+    Every call takes `latency` seconds plus the completion tokens at `token_rate`
+    tokens per second (0 is instant). A fraction `error_rate` of calls fails with
+    HTTP 429 or 503, and a fraction `malformed_rate` answers in a wrong format.
+    Replies are JSON objects when the request asks for them, and malformed replies
+    sent back for repair are rewritten in the format asked. Streamed replies stop
+    being generated when the client closes the connection.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        latency: float,
+        token_rate: float,
+        error_rate: float,
+        malformed_rate: float,
+        seed: int,
+    ):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def query(self) -> str:
+        """A random query combining topics of the corpus."""
+        with self.lock:
+            topics = self.rng.sample(TOPICS, self.rng.randint(1, 2))
+            operator = self.rng.choice(("AND", "AND", "OR"))
+        return f" {operator} ".join(f'"{topic}"' for topic in topics)
+
+    def reply(  # pylint: disable=too-many-return-statements
+        self, messages: List[Dict[str, str]], structured: bool = False
+    ) -> str:
+        """Content of the reply to a conversation."""
+        with self.lock:
+            malformed = self.rng.random() < self.malformed_rate
+        if malformed:
+            return "I am not sure how to answer that."
+        if messages[0]["content"].startswith("Rewrite the reply below"):
+            return repair(messages)
+        # Brainstorms may ask for several queries at once
+        asked = QUERIES_PATTERN.search(
+            " ".join(m["content"] for m in messages if m["role"] == "system")
+        )
+        queries = [self.query() for _ in range(int(asked.group(1)) if asked else 1)]
+        last = messages[-1]["content"]
+        if messages[-1]["role"] == "assistant" and last.startswith("Sure!"):
+            keywords = ", ".join(f"keyword `{query}`" for query in queries)
+            return f"search with {keywords}."
+        if structured and last.startswith("Can you find me some papers"):
+            if asked:
+                return json.dumps({"queries": queries})
+            return json.dumps({"query": queries[0]})
+        if last.startswith("Please answer the question for these articles:"):
+            return "\n".join(
+                f"{index}. {judge(title, summary)}"
+                for index, (title, summary) in enumerate(
+                    ARTICLE_PATTERN.findall(last), start=1
+                )
+            )
+        if last.startswith("Please answer the question for this article:"):
+            match = ARTICLE_PATTERN.search(last)
+            if match:
+                return judge(match.group(1), match.group(2), structured)
+        return "I am not sure how to answer that."
+
+    def respond(
+        self, request: Dict[str, Any]
+    ) -> Tuple[int, Union[Dict[str, Any], Iterator[Dict[str, Any]]]]:
+        """Status and body of the response to a chat completion request, the chunks
+        of the body if it is streamed."""
+        with self.lock:
+            failed = self.rng.random() < self.error_rate
+            status = self.rng.choice((429, 503))
+        if failed:
+            time.sleep(self.latency)
+            return status, {"error": {"message": "Injected error", "code": status}}
+        messages = request["messages"]
+        response_format = request.get("response_format") or {}
+        # Replies sampled with `n` share the prompt tokens
+        contents = [
+            self.reply(messages, response_format.get("type") == "json_object")
+            for _ in range(request.get("n") or 1)
+        ]
+        content = contents[0]
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        completion_tokens = sum(count_tokens(content) for content in contents)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if request.get("stream"):
+            return 200, self.stream(request, content, usage)
+        time.sleep(
+            self.latency
+            + (completion_tokens / self.token_rate if self.token_rate else 0)
+        )
+        return 200, {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [
+                {
+                    "index": index,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+                for index, content in enumerate(contents)
+            ],
+            "usage": usage,
+        }
+
+    def stream(
+        self, request: Dict[str, Any], content: str, usage: Dict[str, int]
+    ) -> Iterator[Dict[str, Any]]:
+        """Chunks of a streamed reply, a token each, generated at `token_rate`."""
+        time.sleep(self.latency)
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+        }
+        for token in re.findall(r"\s*\S+", content):
+            if self.token_rate:
+                time.sleep(1 / self.token_rate)
+            yield {
+                **chunk,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": token},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+        yield {
+            **chunk,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        if (request.get("stream_options") or {}).get("include_usage"):
+            yield {**chunk, "choices": [], "usage": usage}
+
+    def serve(self, port: int = 0) -> ThreadingHTTPServer:
+        """Serve the endpoint on localhost in a daemon thread."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handler of chat completion requests."""
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """Respond with a completion."""
+                length = int(self.headers.get("Content-Length", "0"))
+                status, body = mock.respond(json.loads(self.rfile.read(length)))
+                if not isinstance(body, dict):
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    try:
+                        for chunk in body:
+                            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                            self.wfile.flush()
+                        self.wfile.write(b"data: [DONE]\n\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client stopped the stream, so does the generation
+                        pass
+                    return
+                data = json.dumps(body).encode("UTF-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                """Silence the access log."""
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
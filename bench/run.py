@@ -0,0 +1,249 @@
+"""Run the scheduler end to end against a mock OpenAI endpoint and a fake arXiv API.
+
+Usage: `python -m bench.run [--tasks 300] [--async] [--snapshot] [--json out.json]`. With
+`--baseline`, the run fails if any figure is worse than the baseline by more than
+`--tolerance`.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+# Figures reported, and whether a higher value is better
+FIGURES = {
+    "tasks_per_second": True,
+    "tokens_per_accepted": False,
+    "first_accepted_seconds": False,
+    "peak_memory_mb": False,
+    "scheduler_overhead_ms": False,
+}
+
+
+def serve(args: argparse.Namespace, connection):
+    """Start the mock servers in a child process and send their URLs."""
+    # pylint: disable=import-outside-toplevel
+    from bench.fake_arxiv import FakeArxiv, make_corpus
+    from bench.mock_openai import MockOpenAI
+
+    llm = MockOpenAI(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    ).serve()
+    arxiv = FakeArxiv(
+        make_corpus(args.articles, args.relevant, args.seed),
+        latency=args.arxiv_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).serve()
+    connection.send(
+        (
+            f"http://127.0.0.1:{llm.server_address[1]}/v1",
+            f"http://127.0.0.1:{arxiv.server_address[1]}/api/query",
+        )
+    )
+    connection.recv()
+
+
+def run(args: argparse.Namespace, llm_url: str, arxiv_url: str) -> Dict[str, Any]:
+    """Run the scheduler against the mock servers and collect figures."""
+    # pylint: disable=import-outside-toplevel
+    for key, value in {
+        "OPENAI_API_URL": llm_url,
+        "OPENAI_API_KEY": "bench",
+        "LLM_MAX_RETRIES": "0",
+        "ARXIV_API_URL": arxiv_url,
+        "ARXIV_DELAY_SECONDS": "0",
+        "COMPLETION_CACHE_PATH": "",
+        "ARXIV_CACHE_PATH": "",
+        "DEDUP_PATH": "",
+        "WATCH_PATH": "",
+        "LOG_DIR": tempfile.mkdtemp(prefix="info-gap-bench-"),
+        "RETRY_BASE_SECONDS": "0.05",
+        "RETRY_MAX_SECONDS": "1",
+        "METRICS_INTERVAL": "3600",
+    }.items():
+        os.environ.setdefault(key, value)
+    if args.snapshot:
+        # The same corpus as the fake API, searched locally
+        from bench.fake_arxiv import make_corpus, write_snapshot
+        from info_gap.snapshot import ingest
+
+        directory = tempfile.mkdtemp(prefix="info-gap-snapshot-")
+        write_snapshot(
+            make_corpus(args.articles, args.relevant, args.seed),
+            f"{directory}/snapshot.json",
+        )
+        ingest(f"{directory}/snapshot.json", directory)
+        os.environ["ARXIV_SNAPSHOT_PATH"] = directory
+
+    # Configuration is read when info_gap is imported
+    from examples.coding_agent import REQUEST
+    from info_gap.scheduler import AsyncScheduler, Scheduler
+    from info_gap.task.brainstorm import BrainStormTask
+
+    started = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.use_async:
+            scheduler = AsyncScheduler()
+            scheduler.add_task(BrainStormTask(request=REQUEST))
+            asyncio.run(scheduler.run(max_tasks=args.tasks))
+        else:
+            scheduler = Scheduler()
+            scheduler.add_task(BrainStormTask(request=REQUEST))
+            scheduler.run(max_tasks=args.tasks)
+    elapsed = time.monotonic() - started
+
+    snapshot = scheduler.context.metrics.snapshot()
+    tasks = snapshot["tasks"].values()
+    runs = sum(task["runs"] for task in tasks)
+    busy = sum(task["latency_seconds"]["sum"] for task in tasks)
+    return {
+        "tasks": runs,
+        "errors": sum(task["errors"] for task in tasks),
+        "retries": sum(task["retries"] for task in tasks),
+        "accepted": snapshot["accepted"],
+        "rejected": snapshot["rejected"],
+        "tokens": snapshot["tokens"],
+        "parse_failure_rate": (
+            round(
+                sum(task["parse_failures"] for task in tasks)
+                / sum(task["responses"] for task in tasks),
+                3,
+            )
+            if any(task["responses"] for task in tasks)
+            else None
+        ),
+        "repair_tokens": sum(
+            task["repair_prompt_tokens"] + task["repair_completion_tokens"]
+            for task in tasks
+        ),
+        "unique_queries": sum(task["unique_queries"] for task in tasks),
+        "unique_queries_per_1k_tokens": (
+            snapshot["tasks"]["BrainStormTask"]["unique_queries_per_1k_tokens"]
+            if "BrainStormTask" in snapshot["tasks"]
+            else None
+        ),
+        "llm_concurrency_limit": snapshot["concurrency_limits"].get("llm"),
+        "elapsed_seconds": round(elapsed, 3),
+        "tasks_per_second": round(runs / elapsed, 3),
+        "tokens_per_accepted": (
+            round(snapshot["tokens"] / snapshot["accepted"], 1)
+            if snapshot["accepted"]
+            else None
+        ),
+        "first_accepted_seconds": snapshot["first_accepted_seconds"],
+        # ru_maxrss is in KiB on Linux
+        "peak_memory_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        # Time outside of tasks, only meaningful when tasks run one at a time
+        "scheduler_overhead_ms": (
+            None if args.use_async else round((elapsed - busy) * 1000 / runs, 3)
+        ),
+    }
+
+
+def regressions(
+    result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> Dict[str, str]:
+    """Figures worse than the baseline by more than `tolerance`, relatively."""
+    worse = {}
+    for figure, higher_is_better in FIGURES.items():
+        value, reference = result.get(figure), baseline.get(figure)
+        if value is None or reference is None:
+            continue
+        change = (value - reference) / reference if reference else 0.0
+        if (-change if higher_is_better else change) > tolerance:
+            worse[figure] = f"{reference} -> {value} ({change:+.0%})"
+    return worse
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Run the benchmark, return the exit code."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=300, help="tasks to run")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--articles", type=int, default=2000, help="corpus size")
+    parser.add_argument(
+        "--relevant", type=float, default=0.1, help="fraction of relevant articles"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="LLM latency in seconds"
+    )
+    parser.add_argument(
+        "--token-rate",
+        type=float,
+        default=0,
+        help="LLM completion tokens per second, 0 is instant",
+    )
+    parser.add_argument(
+        "--arxiv-latency", type=float, default=0.01, help="arXiv latency in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of calls failing"
+    )
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0,
+        help="fraction of LLM replies in a wrong format",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="search a local snapshot of the corpus instead of the fake API",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="write the figures as JSON")
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="fail on regressions against this JSON"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative regression allowed against the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    parent, child = multiprocessing.Pipe()
+    servers = multiprocessing.Process(target=serve, args=(args, child), daemon=True)
+    servers.start()
+    llm_url, arxiv_url = parent.recv()
+    try:
+        result = run(args, llm_url, arxiv_url)
+    finally:
+        parent.send(None)
+        servers.join(timeout=5)
+
+    width = max(len(figure) for figure in result)
+    for figure, value in result.items():
+        print(f"{figure:<{width}}  {value}")
+    if args.json:
+        with open(args.json, "w", encoding="UTF-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="UTF-8") as f:
+            worse = regressions(result, json.load(f), args.tolerance)
+        for figure, change in worse.items():
+            print(f"❌ Regression of {figure}: {change}")
+        if worse:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ from info_gap.model import Example, Request
 
 # Run application
 REQUEST = Request(
+    name="coding_agent",
     this_paper_should_be="about automatic software development with large language models and multi-agent",
     accepted_reason_format="The exhaustive list of agents is `your_agents`. The agents communicate by `your_method`. The agents are designed for `your_purpose`.",
     unaccepted_reason_format="The paper is not about automatic software development with large language models and multi-agent, because `your_reason`.",
@@ -0,0 +1,47 @@
+"""Compact record of an article waiting to be judged."""
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict
+
+if TYPE_CHECKING:
+    import arxiv  # type: ignore
+
+
+class Article:
+    """Fields of an arXiv result that feed tasks use.
+
+    Queued tasks keep this instead of the `arxiv.Result`, whose authors, links and
+    categories are never read, so the result can be freed with its page.
+    """
+
+    __slots__ = ("entry_id", "title", "summary", "published")
+
+    def __init__(self, entry_id: str, title: str, summary: str, published: datetime):
+        self.entry_id = entry_id
+        self.title = title
+        self.summary = summary
+        self.published = published
+
+    @classmethod
+    def from_result(cls, result: "arxiv.Result") -> "Article":
+        """Keep the fields of an arXiv result that feed tasks use."""
+        return cls(result.entry_id, result.title, result.summary, result.published)
+
+    def dump(self) -> Dict[str, Any]:
+        """Serializable metadata of the article."""
+        return {
+            "entry_id": self.entry_id,
+            "title": self.title,
+            "summary": self.summary,
+            "published": self.published.isoformat(),
+        }
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "Article":
+        """Restore an article from the metadata returned by `dump`."""
+        return cls(
+            state["entry_id"],
+            state["title"],
+            state["summary"],
+            datetime.fromisoformat(state["published"]),
+        )
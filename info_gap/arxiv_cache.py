@@ -0,0 +1,257 @@
+"""Persistent cache of arXiv search results."""
+
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Generator, List, Optional, Tuple
+import arxiv  # type: ignore
+
+
+def placeholders(values: List[str]) -> str:
+    """SQL placeholders for a list of values."""
+    return ",".join("?" * len(values))
+
+
+class ArxivCache:
+    """Cache of arXiv search results, stored in a single SQLite file.
+
+    Metadata of every article is stored once, and search results are stored as pages
+    of entry ids keyed by query and offset. Results are sorted by submitted date, so
+    once the first page of a query was fetched or refreshed more than `ttl` seconds
+    ago, only the results newer than the cached watermark are fetched and prepended
+    to the cached ones. Deeper pages are appended without touching the others.
+    """
+
+    def __init__(self, path: str, client: arxiv.Client, page_size: int, ttl: float):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.client = client
+        self.page_size = page_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS article (
+                entry_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                published TEXT NOT NULL,
+                updated TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS search (
+                query TEXT PRIMARY KEY,
+                exhausted INTEGER NOT NULL,
+                refreshed REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS page (
+                query TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                entry_ids TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (query, offset)
+            );
+            """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(search)")]
+        if "refreshed" not in columns:
+            # Caches written before the refresh time was tracked are refreshed once
+            self.conn.execute(
+                "ALTER TABLE search ADD COLUMN refreshed REAL NOT NULL DEFAULT 0"
+            )
+        self.conn.commit()
+
+    def fetch(self, query: str, offset: int) -> List[arxiv.Result]:
+        """Fetch a page of results from the arXiv API."""
+        search = arxiv.Search(
+            query=query,
+            max_results=offset + self.page_size,
+            sort_by=arxiv.SortCriterion.SubmittedDate,
+        )
+        results = self.client.results(search, offset=offset)
+        return list(itertools.islice(results, self.page_size))
+
+    def load_pages(self, query: str) -> Tuple[List[str], float, bool]:
+        """Load the cached entry ids of a query in order, when its newest results were
+        fetched, and whether the query has no more results."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT entry_ids FROM page WHERE query = ? ORDER BY offset",
+                (query,),
+            ).fetchall()
+            search = self.conn.execute(
+                "SELECT exhausted, refreshed FROM search WHERE query = ?", (query,)
+            ).fetchone()
+        entry_ids = [entry_id for row in rows for entry_id in json.loads(row[0])]
+        if search is None:
+            return entry_ids, 0.0, False
+        return entry_ids, search[1], bool(search[0])
+
+    def save_articles(self, results: List[arxiv.Result]):
+        """Store the metadata of results, the lock must be held."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO article VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    result.entry_id,
+                    result.title,
+                    result.summary,
+                    result.published.isoformat(),
+                    result.updated.isoformat(),
+                )
+                for result in results
+            ],
+        )
+
+    def save_pages(
+        self,
+        query: str,
+        entry_ids: List[str],
+        results: List[arxiv.Result],
+        exhausted: bool,
+    ):
+        """Replace the cached pages of a query after fetching its newest results, store
+        the metadata of new results."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search VALUES (?, ?, ?)",
+                (query, int(exhausted), now),
+            )
+            self.save_articles(results)
+            self.conn.execute("DELETE FROM page WHERE query = ?", (query,))
+            self.conn.executemany(
+                "INSERT INTO page VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        query,
+                        offset,
+                        json.dumps(entry_ids[offset : offset + self.page_size]),
+                        now,
+                    )
+                    for offset in range(0, len(entry_ids), self.page_size)
+                ],
+            )
+            self.conn.commit()
+
+    def append_page(
+        self, query: str, offset: int, results: List[arxiv.Result], exhausted: bool
+    ):
+        """Add a page of results after the cached ones; the first page of a query also
+        sets when its newest results were fetched."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO search VALUES (?, ?, ?) ON CONFLICT (query) "
+                "DO UPDATE SET exhausted = excluded.exhausted",
+                (query, int(exhausted), now),
+            )
+            if offset == 0:
+                self.conn.execute(
+                    "UPDATE search SET refreshed = ? WHERE query = ?", (now, query)
+                )
+            self.save_articles(results)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO page VALUES (?, ?, ?, ?)",
+                (
+                    query,
+                    offset,
+                    json.dumps([result.entry_id for result in results]),
+                    now,
+                ),
+            )
+            self.conn.commit()
+
+    def load_articles(self, entry_ids: List[str]) -> Dict[str, arxiv.Result]:
+        """Load cached articles by entry id."""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM article WHERE entry_id IN ({placeholders(entry_ids)})",
+                entry_ids,
+            ).fetchall()
+        return {
+            row[0]: arxiv.Result(
+                entry_id=row[0],
+                title=row[1],
+                summary=row[2],
+                published=datetime.fromisoformat(row[3]),
+                updated=datetime.fromisoformat(row[4]),
+            )
+            for row in rows
+        }
+
+    def watermark(self, entry_ids: List[str]) -> Optional[datetime]:
+        """Submitted date of the newest cached result."""
+        if not entry_ids:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(published) FROM article "
+                f"WHERE entry_id IN ({placeholders(entry_ids)})",
+                entry_ids,
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    def refresh(self, query: str, entry_ids: List[str], exhausted: bool) -> List[str]:
+        """Fetch the results newer than the watermark and prepend them to the cache."""
+        watermark = self.watermark(entry_ids)
+        known = set(entry_ids)
+        fresh: List[arxiv.Result] = []
+        offset = 0
+        while True:
+            page = self.fetch(query, offset)
+            newer = [
+                result
+                for result in page
+                if result.entry_id not in known
+                and (watermark is None or result.published > watermark)
+            ]
+            fresh.extend(newer)
+            if len(newer) < len(page) or len(page) < self.page_size:
+                break
+            offset += self.page_size
+        logging.debug("ARXIV CACHE REFRESH: %s, %d new results", query, len(fresh))
+        entry_ids = [result.entry_id for result in fresh] + entry_ids
+        self.save_pages(query, entry_ids, fresh, exhausted)
+        return entry_ids
+
+    def results(
+        self,
+        query: str,
+        max_results: int,
+        offset: int = 0,
+        max_age: Optional[float] = None,
+    ) -> Generator[arxiv.Result, None, None]:
+        """Results of a query sorted by submitted date, served from disk when cached.
+
+        The first `offset` results are skipped, to resume a search. Cached pages older
+        than `max_age` seconds, `ttl` by default, are refreshed first.
+        """
+        entry_ids, fetched, exhausted = self.load_pages(query)
+        max_age = self.ttl if max_age is None else max_age
+        if entry_ids and time.time() - fetched > max_age:
+            entry_ids = self.refresh(query, entry_ids, exhausted)
+
+        # Serve the cached pages
+        served = offset
+        for start in range(offset, min(len(entry_ids), max_results), self.page_size):
+            page_ids = entry_ids[start : min(start + self.page_size, max_results)]
+            articles = self.load_articles(page_ids)
+            for entry_id in page_ids:
+                if entry_id in articles:
+                    yield articles[entry_id]
+            served = start + len(page_ids)
+
+        # Fetch the pages beyond the cache, unless the query has no more results
+        while served < max_results and not exhausted:
+            start = len(entry_ids)
+            page = self.fetch(query, start)
+            exhausted = len(page) < self.page_size
+            entry_ids = entry_ids + [result.entry_id for result in page]
+            self.append_page(query, start, page, exhausted)
+            for index, result in enumerate(page, start=start):
+                if served <= index < max_results:
+                    yield result
+            served = max(served, min(start + len(page), max_results))
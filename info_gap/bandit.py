@@ -0,0 +1,48 @@
+"""Acceptance rate of search queries, to page the queries that yield accepted articles."""
+
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Dict
+from info_gap.config import BANDIT_EXPLORATION
+from info_gap.query import canonical_query
+
+
+class QueryBandit:
+    """Verdicts on the articles found by each query of a request.
+
+    The acceptance rate of a query is smoothed by a uniform prior, so a query without
+    verdicts has a rate of one half. Searches are ranked by the upper confidence bound
+    of their rate (UCB1), which favours queries with few verdicts yet.
+    """
+
+    judged: Dict[str, Counter]
+    accepted: Dict[str, Counter]
+
+    def __init__(self, exploration: float = BANDIT_EXPLORATION):
+        self.exploration = exploration
+        self.judged = defaultdict(Counter)
+        self.accepted = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def record(self, query: str, request_name: str, accepted: bool):
+        """Record a verdict on an article found by a query."""
+        key = canonical_query(query)
+        with self.lock:
+            self.judged[request_name][key] += 1
+            self.accepted[request_name][key] += int(accepted)
+
+    def rate(self, key: str, request_name: str) -> float:
+        """Smoothed acceptance rate of a query, by its canonical form."""
+        with self.lock:
+            judged = self.judged[request_name][key]
+            accepted = self.accepted[request_name][key]
+        return (accepted + 1) / (judged + 2)
+
+    def upper_bound(self, key: str, request_name: str) -> float:
+        """Upper confidence bound of the acceptance rate of a query."""
+        with self.lock:
+            judged = self.judged[request_name][key]
+            total = sum(self.judged[request_name].values())
+        bonus = self.exploration * math.sqrt(math.log(total + 1) / (judged + 1))
+        return min(1.0, self.rate(key, request_name) + bonus)
@@ -0,0 +1,113 @@
+"""Persistent cache of LLM completions."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class CompletionCache:
+    """Content-addressed cache of completions, stored in a single SQLite file.
+
+    Entries older than `max_age` seconds are ignored and evicted, and the least
+    recently used entries are evicted once there are more than `max_entries`.
+    """
+
+    hits: int
+    misses: int
+
+    # Evict stale entries every this many insertions
+    EVICT_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int, max_age: float):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS completion (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS completion_accessed ON completion (accessed)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def key(
+        model: str,
+        messages: List[Any],
+        temperature: float,
+        stop_chars: Optional[int] = None,
+    ) -> str:
+        """Hash the parameters that determine a completion, with the length after which
+        a streamed reply may be cut short."""
+        parameters: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if stop_chars is not None:
+            parameters["stop_chars"] = stop_chars
+        content = json.dumps(
+            parameters,
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(content.encode("UTF-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, `None` if missing or expired."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM completion WHERE key = ? AND created >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE completion SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completion VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self.puts += 1
+            if self.puts % self.EVICT_INTERVAL == 0:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        """Delete expired entries, then the least recently used ones over the limit."""
+        self.conn.execute(
+            "DELETE FROM completion WHERE created < ?", (now - self.max_age,)
+        )
+        self.conn.execute(
+            """DELETE FROM completion WHERE key IN (
+                SELECT key FROM completion ORDER BY accessed DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters of this process."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,33 +1,72 @@
-"""Configuration for OpenAI and arXiv APIs."""
+"""Configuration for OpenAI and arXiv APIs.
+
+Settings are plain values read from the environment; clients, caches and the log
+directory are created on first use by `info_gap.context.RuntimeContext`.
+"""
 
 import os
-import time
-from openai import OpenAI
-import instructor
-import arxiv  # type: ignore
 from dotenv import load_dotenv
 
 # Load environment
 load_dotenv()
 
-# Initialize Ollama client
-MODEL = "llama3"
-LLM_OPENAI = OpenAI(
-    base_url=os.getenv("OPENAI_API_URL", "https://api.openai.com/v1"),
-    api_key=os.getenv("OPENAI_API_KEY", "sk_1234567890abcdef1234567890abcdef"),
-)
-LLM_CLIENT = instructor.from_openai(
-    LLM_OPENAI,
-    mode=instructor.Mode.JSON,
+# Ollama endpoint, `LLM_MAX_RETRIES` are retries within the OpenAI client
+MODEL = os.getenv("MODEL", "llama3")
+OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "sk_1234567890abcdef1234567890abcdef")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Replies as JSON objects of a schema instead of text patterns, and the attempts to
+# repair a malformed reply by sending it back with the error only
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "0") == "1"
+REPAIR_ATTEMPTS = int(os.getenv("REPAIR_ATTEMPTS", "2"))
+
+# Stream feed replies and stop a rejection after `FAST_REJECT_CHARS` characters of
+# reason, accepted articles still get their full reason
+FAST_REJECT = os.getenv("FAST_REJECT", "0") == "1"
+FAST_REJECT_CHARS = int(os.getenv("FAST_REJECT_CHARS", "80"))
+
+# Completion cache, set `COMPLETION_CACHE_PATH` to empty to disable
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "cache/completion.sqlite3")
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "100000"))
+COMPLETION_CACHE_MAX_AGE = float(
+    os.getenv("COMPLETION_CACHE_MAX_AGE", str(30 * 24 * 3600))
 )
 
-# Initialize log path
-CURRENT_DATETIME = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-LOG_PATH = f"log/{CURRENT_DATETIME}"
-os.makedirs(LOG_PATH, exist_ok=True)
+# Result sinks: records are flushed every `SINK_FLUSH_RECORDS` records or
+# `SINK_FLUSH_SECONDS` seconds, and files past `SINK_ROTATE_BYTES` are gzipped (0 never)
+SINK_FLUSH_RECORDS = int(os.getenv("SINK_FLUSH_RECORDS", "64"))
+SINK_FLUSH_SECONDS = float(os.getenv("SINK_FLUSH_SECONDS", "5"))
+SINK_FSYNC = os.getenv("SINK_FSYNC", "0") == "1"
+SINK_ROTATE_BYTES = int(os.getenv("SINK_ROTATE_BYTES", "0"))
+
+# Deduplication store shared across runs, empty `DEDUP_PATH` keeps it in memory
+DEDUP_PATH = os.getenv("DEDUP_PATH", "cache/dedup.sqlite3")
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "1000000"))
+DEDUP_ERROR_RATE = float(os.getenv("DEDUP_ERROR_RATE", "0.001"))
 
-# Initialize arXiv client
-ARXIV_CLIENT = arxiv.Client()
+# Directory of the timestamped log directories of runs
+LOG_DIR = os.getenv("LOG_DIR", "log")
+
+# arXiv API and result cache, empty `ARXIV_CACHE_PATH` disables the cache;
+# `ARXIV_API_URL` points the client to another endpoint, e.g. a mirror
+ARXIV_PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "50"))
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+ARXIV_DELAY_SECONDS = float(os.getenv("ARXIV_DELAY_SECONDS", "3"))
+ARXIV_CACHE_PATH = os.getenv("ARXIV_CACHE_PATH", "cache/arxiv.sqlite3")
+ARXIV_CACHE_TTL = float(os.getenv("ARXIV_CACHE_TTL", str(24 * 3600)))
+
+# Local snapshot of arXiv metadata ingested with `python -m info_gap.snapshot`, which
+# answers searches offline when set; with `ARXIV_SNAPSHOT_LIVE`, the results submitted
+# after the snapshot are still fetched from the API
+ARXIV_SNAPSHOT_PATH = os.getenv("ARXIV_SNAPSHOT_PATH", "")
+ARXIV_SNAPSHOT_LIVE = os.getenv("ARXIV_SNAPSHOT_LIVE", "1") == "1"
+
+# Watch mode: queries of every request are kept across runs with their yield and the
+# submitted date of their newest result, and the good ones are searched again every
+# `WATCH_INTERVAL` seconds for newer results; empty `WATCH_PATH` keeps them in memory
+WATCH_PATH = os.getenv("WATCH_PATH", "cache/watch.sqlite3")
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", str(6 * 3600)))
 QUERY_RULE = """
 If you want to find paper about `Keyword One`, your query is: `"Keyword One"`;
 If you want to find paper about `Keyword One` AND `Keyword Two`, your query is: `"Keyword One" AND "Keyword Two"`; 
@@ -37,4 +76,82 @@ You can use parenthesis to group the queries!
 Keywords should be concise and relevant to the topic you are interested in, 
 typically a single word or a short phrase.
 """
-MAX_RESULTS = 100
+
+# Priority a search loses when a past query's terms are all in its query
+QUERY_OVERLAP_DEMOTION = int(os.getenv("QUERY_OVERLAP_DEMOTION", "16"))
+
+# Brainstorming asks for `BRAINSTORM_QUERIES` queries per reply and samples
+# `BRAINSTORM_SAMPLES` replies per completion (text replies only); with several
+# queries per completion, a query is dropped if the Jaccard similarity of its keywords,
+# with their operators and negations, to a query already run reaches `QUERY_SIMILARITY`
+BRAINSTORM_QUERIES = int(os.getenv("BRAINSTORM_QUERIES", "1"))
+BRAINSTORM_SAMPLES = int(os.getenv("BRAINSTORM_SAMPLES", "1"))
+QUERY_SIMILARITY = float(os.getenv("QUERY_SIMILARITY", "0.8"))
+
+# Query yield: a search stops paging, and lets brainstorming go on, once the smoothed
+# acceptance rate of its articles falls below `YIELD_THRESHOLD`; searches lose up to
+# `BANDIT_PRIORITY_SCALE` priority by the upper confidence bound of their rate
+YIELD_THRESHOLD = float(os.getenv("YIELD_THRESHOLD", "0.1"))
+BANDIT_EXPLORATION = float(os.getenv("BANDIT_EXPLORATION", "0.5"))
+BANDIT_ARMS = int(os.getenv("BANDIT_ARMS", "1"))
+BANDIT_PRIORITY_SCALE = float(os.getenv("BANDIT_PRIORITY_SCALE", "50"))
+
+# Default budget of results per search, and pages fetched ahead of the current one
+MAX_RESULTS = int(os.getenv("MAX_RESULTS", "100"))
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "1"))
+
+# Number of articles judged per completion, 1 disables batching
+FEED_BATCH_SIZE = int(os.getenv("FEED_BATCH_SIZE", "1"))
+
+# Pre-ranking: feed priority gains score times the scale, articles scoring below the
+# threshold are skipped; an empty `PRERANK_THRESHOLD` disables skipping
+PRERANK_PRIORITY_SCALE = float(os.getenv("PRERANK_PRIORITY_SCALE", "50"))
+PRERANK_THRESHOLD = (
+    float(os.environ["PRERANK_THRESHOLD"]) if os.getenv("PRERANK_THRESHOLD") else None
+)
+
+# Concurrency limits per resource for the async scheduler
+CONCURRENCY = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "8")),
+    "arxiv": int(os.getenv("ARXIV_CONCURRENCY", "1")),
+}
+
+# Adaptive concurrency: the limit of a resource starts at `CONCURRENCY` and moves
+# between 1 and `MAX_CONCURRENCY`, backing off when the endpoint throttles or when
+# recent calls take `LATENCY_TOLERANCE` times the median latency of the last
+# `LATENCY_WINDOW` calls with replies of a similar length
+MAX_CONCURRENCY = {
+    "llm": int(os.getenv("MAX_LLM_CONCURRENCY", str(4 * CONCURRENCY["llm"]))),
+    "arxiv": int(os.getenv("MAX_ARXIV_CONCURRENCY", str(CONCURRENCY["arxiv"]))),
+}
+LATENCY_TOLERANCE = float(os.getenv("LATENCY_TOLERANCE", "2"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "100"))
+
+# Rate limits in calls per second per resource, 0 is unlimited; the arXiv client
+# already waits 3 seconds between its requests
+RATE_LIMIT = {
+    "llm": float(os.getenv("LLM_RATE_LIMIT", "0")),
+    "arxiv": float(os.getenv("ARXIV_RATE_LIMIT", "0")),
+}
+
+# Retries of tasks failing with a transient error, with jittered exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", "60"))
+
+# Maximum backlog of queued tasks per task type
+MAX_BACKLOG = {
+    "GenerateFeedTask": int(os.getenv("MAX_FEED_BACKLOG", "500")),
+    "SearchTask": int(os.getenv("MAX_SEARCH_BACKLOG", "50")),
+}
+MAX_BACKLOG["BatchGenerateFeedTask"] = max(
+    1, MAX_BACKLOG["GenerateFeedTask"] // max(1, FEED_BATCH_SIZE)
+)
+
+# Interval in seconds between metrics snapshots written to the log directory
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "30"))
+
+# Lease of a task taken from the durable queue, renewed by heartbeats, and the wait
+# before polling again when every queued task is leased by other workers
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "300"))
+TASK_POLL_SECONDS = float(os.getenv("TASK_POLL_SECONDS", "1"))
@@ -0,0 +1,383 @@
+"""Runtime context holding the clients, caches and output of a run."""
+
+import atexit
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from info_gap.config import (
+    ARXIV_API_URL,
+    ARXIV_CACHE_PATH,
+    ARXIV_CACHE_TTL,
+    ARXIV_DELAY_SECONDS,
+    ARXIV_PAGE_SIZE,
+    ARXIV_SNAPSHOT_PATH,
+    COMPLETION_CACHE_MAX_AGE,
+    COMPLETION_CACHE_MAX_ENTRIES,
+    COMPLETION_CACHE_PATH,
+    DEDUP_CAPACITY,
+    DEDUP_ERROR_RATE,
+    DEDUP_PATH,
+    LLM_MAX_RETRIES,
+    LOG_DIR,
+    MODEL,
+    OPENAI_API_KEY,
+    OPENAI_API_URL,
+    WATCH_PATH,
+)
+
+if TYPE_CHECKING:
+    import arxiv  # type: ignore
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+    from info_gap.arxiv_cache import ArxivCache
+    from info_gap.bandit import QueryBandit
+    from info_gap.cache import CompletionCache
+    from info_gap.deduplicate import DedupStore, PendingArticles
+    from info_gap.metrics import Metrics
+    from info_gap.query import QueryHistory
+    from info_gap.rank import PreRanker
+    from info_gap.sink import ResultSink
+    from info_gap.snapshot import ArxivSnapshot
+    from info_gap.task.completion_task import PromptTokens
+    from info_gap.task.search import SearchTask
+    from info_gap.watch import WatchStore
+
+T = TypeVar("T")
+
+# pylint: disable=import-outside-toplevel
+
+
+class RuntimeContext:
+    """Clients, caches and output paths of a run, each created on first use.
+
+    Settings default to `info_gap.config`. Several contexts can coexist, e.g. for
+    different endpoints or models: code looks up the current one with `get_context`,
+    and `use` makes a context current in the calling thread or asyncio task. The state
+    of a run, e.g. its running searches and the yield of its queries, belongs to its
+    context; only the limits of an endpoint are shared by the contexts calling it.
+    """
+
+    resources: Dict[str, Any]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model: str = MODEL,
+        openai_api_url: str = OPENAI_API_URL,
+        openai_api_key: str = OPENAI_API_KEY,
+        completion_cache_path: str = COMPLETION_CACHE_PATH,
+        arxiv_api_url: str = ARXIV_API_URL,
+        arxiv_cache_path: str = ARXIV_CACHE_PATH,
+        arxiv_snapshot_path: str = ARXIV_SNAPSHOT_PATH,
+        dedup_path: str = DEDUP_PATH,
+        watch_path: str = WATCH_PATH,
+        log_dir: str = LOG_DIR,
+        share_searches: bool = True,
+    ):
+        self.model = model
+        self.openai_api_url = openai_api_url
+        self.openai_api_key = openai_api_key
+        self.completion_cache_path = completion_cache_path
+        self.arxiv_api_url = arxiv_api_url
+        self.arxiv_cache_path = arxiv_cache_path
+        self.arxiv_snapshot_path = arxiv_snapshot_path
+        self.dedup_path = dedup_path
+        self.watch_path = watch_path
+        self.log_dir = log_dir
+        # Requests join the searches of the same query running in this process
+        self.share_searches = share_searches
+        self.resources = {}
+        self.lock = threading.RLock()
+        CONTEXTS.add(self)
+
+    def lazy(self, name: str, create: Callable[[], T]) -> T:
+        """Get a resource, creating it on first use."""
+        with self.lock:
+            if name not in self.resources:
+                self.resources[name] = create()
+            return self.resources[name]
+
+    def endpoint(self, resource: str) -> str:
+        """URL of the endpoint behind a resource, empty for local resources."""
+        return {"llm": self.openai_api_url, "arxiv": self.arxiv_api_url}.get(
+            resource, ""
+        )
+
+    @property
+    def openai(self) -> "OpenAI":
+        """Synchronous OpenAI client."""
+
+        def create():
+            from openai import OpenAI
+
+            return OpenAI(
+                base_url=self.openai_api_url,
+                api_key=self.openai_api_key,
+                max_retries=LLM_MAX_RETRIES,
+            )
+
+        return self.lazy("openai", create)
+
+    @property
+    def async_openai(self) -> "AsyncOpenAI":
+        """Asynchronous OpenAI client."""
+
+        def create():
+            from openai import AsyncOpenAI
+
+            return AsyncOpenAI(
+                base_url=self.openai_api_url,
+                api_key=self.openai_api_key,
+                max_retries=LLM_MAX_RETRIES,
+            )
+
+        return self.lazy("async_openai", create)
+
+    @property
+    def completion_cache(self) -> Optional["CompletionCache"]:
+        """Completion cache, `None` if disabled."""
+
+        def create():
+            from info_gap.cache import CompletionCache
+
+            if not self.completion_cache_path:
+                return None
+            return CompletionCache(
+                self.completion_cache_path,
+                max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+                max_age=COMPLETION_CACHE_MAX_AGE,
+            )
+
+        return self.lazy("completion_cache", create)
+
+    @property
+    def arxiv(self) -> "arxiv.Client":
+        """arXiv API client."""
+
+        def create():
+            import arxiv  # type: ignore
+
+            client = arxiv.Client(
+                page_size=ARXIV_PAGE_SIZE, delay_seconds=ARXIV_DELAY_SECONDS
+            )
+            client.query_url_format = self.arxiv_api_url + "?{}"
+            return client
+
+        return self.lazy("arxiv", create)
+
+    @property
+    def arxiv_cache(self) -> Optional["ArxivCache"]:
+        """Cache of arXiv search results, `None` if disabled."""
+
+        def create():
+            from info_gap.arxiv_cache import ArxivCache
+
+            if not self.arxiv_cache_path:
+                return None
+            return ArxivCache(
+                self.arxiv_cache_path,
+                client=self.arxiv,
+                page_size=ARXIV_PAGE_SIZE,
+                ttl=ARXIV_CACHE_TTL,
+            )
+
+        return self.lazy("arxiv_cache", create)
+
+    @property
+    def arxiv_snapshot(self) -> Optional["ArxivSnapshot"]:
+        """Local snapshot of arXiv metadata, `None` if not set."""
+
+        def create():
+            if not self.arxiv_snapshot_path:
+                return None
+            from info_gap.snapshot import ArxivSnapshot
+
+            return ArxivSnapshot(self.arxiv_snapshot_path)
+
+        return self.lazy("arxiv_snapshot", create)
+
+    @property
+    def dedup_store(self) -> "DedupStore":
+        """Deduplication store, in memory if no path is set."""
+
+        def create():
+            from info_gap.deduplicate import DedupStore
+
+            return DedupStore(
+                self.dedup_path or ":memory:", DEDUP_CAPACITY, DEDUP_ERROR_RATE
+            )
+
+        return self.lazy("dedup_store", create)
+
+    @property
+    def pending_articles(self) -> "PendingArticles":
+        """Articles queued for judging in this run, not yet in the dedup store."""
+
+        def create():
+            from info_gap.deduplicate import PendingArticles
+
+            return PendingArticles()
+
+        return self.lazy("pending_articles", create)
+
+    @property
+    def watch_store(self) -> "WatchStore":
+        """Store of the queries watched for new articles, in memory if no path is set."""
+
+        def create():
+            from info_gap.watch import WatchStore
+
+            return WatchStore(self.watch_path or ":memory:")
+
+        return self.lazy("watch_store", create)
+
+    @property
+    def active_searches(self) -> Dict[str, "SearchTask"]:
+        """Searches still paging, by canonical query."""
+        return self.lazy("active_searches", dict)
+
+    @property
+    def metrics(self) -> "Metrics":
+        """Metrics of the run."""
+
+        def create():
+            from info_gap.metrics import Metrics
+
+            return Metrics()
+
+        return self.lazy("metrics", create)
+
+    @property
+    def prompt_tokens(self) -> "PromptTokens":
+        """Tokens per character of the prompts sent to the model."""
+
+        def create():
+            from info_gap.task.completion_task import PromptTokens
+
+            return PromptTokens()
+
+        return self.lazy("prompt_tokens", create)
+
+    @property
+    def query_bandit(self) -> "QueryBandit":
+        """Acceptance rate of the queries of each request."""
+
+        def create():
+            from info_gap.bandit import QueryBandit
+
+            return QueryBandit()
+
+        return self.lazy("query_bandit", create)
+
+    @property
+    def query_history(self) -> "QueryHistory":
+        """Terms of the queries run for each request, in this run or before."""
+
+        def create():
+            from info_gap.query import QueryHistory
+
+            # Queries of past runs are kept in the watch store
+            return QueryHistory(
+                lambda name: [
+                    watched.query for watched in self.watch_store.queries(name)
+                ]
+            )
+
+        return self.lazy("query_history", create)
+
+    @property
+    def rankers(self) -> Dict[str, "PreRanker"]:
+        """Pre-rankers of the requests, by request name."""
+        return self.lazy("rankers", dict)
+
+    @property
+    def feed_prompts(
+        self,
+    ) -> Dict[Tuple[str, bool], Tuple["ChatCompletionMessageParam", ...]]:
+        """Prompts of feed tasks, by request name and structured output mode."""
+        return self.lazy("feed_prompts", dict)
+
+    @property
+    def log_path(self) -> str:
+        """Timestamped log directory of the run, created on first use."""
+
+        def create():
+            current_datetime = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+            path = f"{self.log_dir}/{current_datetime}"
+            os.makedirs(path, exist_ok=True)
+            return path
+
+        return self.lazy("log_path", create)
+
+    def sink(self, name: str) -> "ResultSink":
+        """Sink of an output stream, written to `<log_path>/<name>.jsonl`."""
+
+        def create():
+            from info_gap.sink import ResultSink
+
+            return ResultSink(f"{self.log_path}/{name}.jsonl")
+
+        return self.lazy(f"sink:{name}", create)
+
+    def flush(self):
+        """Write the records buffered by the sinks."""
+        with self.lock:
+            for name, resource in self.resources.items():
+                if name.startswith("sink:"):
+                    resource.flush()
+
+    def close(self):
+        """Flush and close the sinks."""
+        with self.lock:
+            for name in [name for name in self.resources if name.startswith("sink:")]:
+                self.resources.pop(name).close()
+
+    @contextmanager
+    def use(self) -> Iterator["RuntimeContext"]:
+        """Make this context the current one within the block."""
+        token = CURRENT_CONTEXT.set(self)
+        try:
+            yield self
+        finally:
+            CURRENT_CONTEXT.reset(token)
+
+
+CONTEXTS: "weakref.WeakSet[RuntimeContext]" = weakref.WeakSet()
+CURRENT_CONTEXT: ContextVar[Optional[RuntimeContext]] = ContextVar(
+    "runtime_context", default=None
+)
+DEFAULT_CONTEXT: Optional[RuntimeContext] = None
+DEFAULT_CONTEXT_LOCK = threading.Lock()
+
+
+def get_context() -> RuntimeContext:
+    """The current context, or the default one configured from the environment."""
+    global DEFAULT_CONTEXT  # pylint: disable=global-statement
+    context = CURRENT_CONTEXT.get()
+    if context is not None:
+        return context
+    with DEFAULT_CONTEXT_LOCK:
+        if DEFAULT_CONTEXT is None:
+            DEFAULT_CONTEXT = RuntimeContext()
+        return DEFAULT_CONTEXT
+
+
+@atexit.register
+def close_contexts():
+    """Flush and close the sinks of all contexts."""
+    for context in list(CONTEXTS):
+        context.close()
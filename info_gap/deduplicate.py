@@ -1,22 +1,183 @@
-"""Sets for deduplication."""
+"""Stores for deduplication."""
 
-from typing import Set
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+from info_gap.context import get_context
+from info_gap.query import canonical_query
 
-query_set: Set[str] = set()
-article_set: Set[str] = set()
 
+class BloomFilter:
+    """Bloom filter of strings with a fixed memory footprint."""
 
-def dedup_query(query: str) -> bool:
-    """Deduplicate query."""
-    if query in query_set:
-        return False
-    query_set.add(query)
-    return True
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
 
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("UTF-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(
+            digest[8:], "little"
+        )
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
 
-def dedup_article(article: str) -> bool:
-    """Deduplicate article."""
-    if article in article_set:
-        return False
-    article_set.add(article)
-    return True
+    def add(self, key: str):
+        """Add a key."""
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class DedupStore:
+    """Deduplication store, a Bloom filter in front of an exact SQLite store.
+
+    Keys the filter has probably seen are confirmed with a read, the others go straight
+    to an atomic insert. The database runs in WAL mode, so several worker processes can
+    share it; the filter only saves work and never decides alone.
+    """
+
+    def __init__(self, path: str, capacity: int, error_rate: float):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS seen (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )""")
+        self.bloom = BloomFilter(capacity, error_rate)
+        for namespace, key in self.conn.execute("SELECT namespace, key FROM seen"):
+            self.bloom.add(f"{namespace}\0{key}")
+
+    def add_many(self, namespace: str, keys: List[str]) -> List[bool]:
+        """Add keys in one transaction, return for each whether it is new."""
+        result = []
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key in keys:
+                    bloom_key = f"{namespace}\0{key}"
+                    if (
+                        bloom_key in self.bloom
+                        and self.conn.execute(
+                            "SELECT 1 FROM seen WHERE namespace = ? AND key = ?",
+                            (namespace, key),
+                        ).fetchone()
+                    ):
+                        result.append(False)
+                        continue
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO seen VALUES (?, ?)", (namespace, key)
+                    )
+                    self.bloom.add(bloom_key)
+                    result.append(cursor.rowcount == 1)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def add(self, namespace: str, key: str) -> bool:
+        """Add a key, return whether it is new."""
+        return self.add_many(namespace, [key])[0]
+
+    def contains_many(self, namespace: str, keys: List[str]) -> List[bool]:
+        """Whether each key was added, by this process or another one."""
+        # The filter misses the keys of other processes, only SQLite can tell
+        found = set()
+        with self.lock:
+            # Stay below the limit of SQLite on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                found.update(
+                    key
+                    for (key,) in self.conn.execute(
+                        "SELECT key FROM seen WHERE namespace = ? AND key IN "
+                        f"({', '.join('?' * len(chunk))})",
+                        (namespace, *chunk),
+                    )
+                )
+        return [key in found for key in keys]
+
+
+class PendingArticles:
+    """Articles queued for judging in this run, by request, kept in memory.
+
+    The articles of a request are only added to the dedup store once judged, so the
+    backlog of a run that stops, and the articles of a task dropped after failed
+    repairs, are queued again by the next run; meanwhile this keeps the run from
+    queueing them twice.
+    """
+
+    keys: Set[Tuple[str, str]]
+
+    def __init__(self):
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    def add_many(
+        self, store: DedupStore, request_name: str, articles: List[str]
+    ) -> List[bool]:
+        """Add articles neither judged nor pending, return for each whether it is new."""
+        result = []
+        with self.lock:
+            judged = store.contains_many(f"article:{request_name}", articles)
+            for article, seen in zip(articles, judged):
+                key = (request_name, article)
+                new = not seen and key not in self.keys
+                if new:
+                    self.keys.add(key)
+                result.append(new)
+        return result
+
+    def judged(self, store: DedupStore, request_name: str, articles: List[str]):
+        """Record the articles as judged in the dedup store."""
+        with self.lock:
+            store.add_many(f"article:{request_name}", articles)
+            self.keys.difference_update((request_name, article) for article in articles)
+
+
+def dedup_query(query: str, request_name: str) -> bool:
+    """Deduplicate query of a request by its canonical form."""
+    return get_context().dedup_store.add(
+        f"query:{request_name}", canonical_query(query)
+    )
+
+
+def dedup_article(article: str, request_name: Optional[str] = None) -> bool:
+    """Deduplicate article for a request, or globally if no request is given."""
+    return dedup_articles([article], request_name)[0]
+
+
+def dedup_articles(
+    articles: List[str], request_name: Optional[str] = None
+) -> List[bool]:
+    """Deduplicate a page of articles at once, for a request or globally.
+
+    An article stays new to a request until `judged_articles` records its verdict.
+    """
+    context = get_context()
+    if request_name is None:
+        return context.dedup_store.add_many("article", articles)
+    return context.pending_articles.add_many(
+        context.dedup_store, request_name, articles
+    )
+
+
+def judged_articles(articles: List[str], request_name: str):
+    """Record that articles were judged for a request, they are never queued again."""
+    context = get_context()
+    context.pending_articles.judged(context.dedup_store, request_name, articles)
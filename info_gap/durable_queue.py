@@ -0,0 +1,196 @@
+"""Durable task queue shared by several worker processes."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from info_gap.config import MAX_BACKLOG
+from info_gap.model import Request
+from info_gap.task.base_task import BaseTask
+
+
+class DurableTaskQueue:
+    """Task queue persisted in a SQLite file in WAL mode.
+
+    Workers lease the task of highest priority for a while and extend the lease with
+    heartbeats; tasks whose lease expired, e.g. because the worker died, are leased
+    again. Finishing a task removes it and adds its subtasks in one transaction, so a
+    restarted run resumes from the persisted frontier. Articles count as seen by a
+    request only once judged, so a search leased again after its worker died still
+    produces the feed tasks of its page. A task to retry keeps a lease until its
+    backoff is over.
+    """
+
+    requests: Dict[str, Request]
+
+    def __init__(self, path: str, max_backlog: Optional[Dict[str, int]] = None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_backlog = {**MAX_BACKLOG, **(max_backlog or {})}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS request (
+                id TEXT PRIMARY KEY,
+                body TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS task (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS task_priority ON task (priority DESC, id);
+            """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(task)")]
+        if "attempts" not in columns:
+            self.conn.execute(
+                "ALTER TABLE task ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM task").fetchone()[0]
+
+    def _store_request(self, request: Request) -> str:
+        """Store a request once, return its id."""
+        body = request.model_dump_json()
+        request_id = hashlib.sha256(body.encode("UTF-8")).hexdigest()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO request VALUES (?, ?)", (request_id, body)
+        )
+        self.requests.setdefault(request_id, request)
+        return request_id
+
+    def _load_request(self, request_id: str) -> Request:
+        """Load a request, sharing one `Request` object per request."""
+        if request_id not in self.requests:
+            body = self.conn.execute(
+                "SELECT body FROM request WHERE id = ?", (request_id,)
+            ).fetchone()[0]
+            self.requests[request_id] = Request.model_validate_json(body)
+        return self.requests[request_id]
+
+    def _encode(self, task: BaseTask) -> Tuple[str, int, str]:
+        """Encode a task as a row, storing its requests once."""
+        state = task.dump()
+        if "request" in state:
+            state["request_id"] = self._store_request(state.pop("request"))
+        if "requests" in state:
+            state["request_ids"] = [
+                self._store_request(request) for request in state.pop("requests")
+            ]
+        return type(task).__name__, task.priority, json.dumps(state)
+
+    def _decode(self, kind: str, payload: str) -> BaseTask:
+        """Decode a task from a row."""
+        state = json.loads(payload)
+        if "request_id" in state:
+            state["request"] = self._load_request(state.pop("request_id"))
+        if "request_ids" in state:
+            state["requests"] = [
+                self._load_request(request_id)
+                for request_id in state.pop("request_ids")
+            ]
+        return BaseTask.types[kind].load(state)
+
+    def push(self, task: BaseTask):
+        """Add a task to the queue."""
+        self.complete(None, [task])
+
+    def paused_kinds(self) -> List[str]:
+        """Kinds of tasks that produce a task type whose backlog is full."""
+        backlog = dict(
+            self.conn.execute(
+                "SELECT kind, COUNT(*) FROM task WHERE lease_owner IS NULL "
+                "GROUP BY kind"
+            ).fetchall()
+        )
+        full = {
+            kind
+            for kind, limit in self.max_backlog.items()
+            if backlog.get(kind, 0) >= limit
+        }
+        return [
+            kind
+            for kind in backlog
+            if kind in BaseTask.types and full & set(BaseTask.types[kind].produces)
+        ]
+
+    def lease(self, worker: str, seconds: float) -> Optional[Tuple[int, BaseTask]]:
+        """Lease the task of highest priority, `None` if no task is available."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                paused = self.paused_kinds()
+                row = self.conn.execute(
+                    "SELECT id, kind, payload, attempts FROM task "
+                    "WHERE (lease_owner IS NULL OR lease_expires < ?) "
+                    f"AND kind NOT IN ({','.join('?' * len(paused))}) "
+                    "ORDER BY priority DESC, id LIMIT 1",
+                    (now, *paused),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE task SET lease_owner = ?, lease_expires = ? "
+                        "WHERE id = ?",
+                        (worker, now + seconds, row[0]),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            task = self._decode(row[1], row[2])
+            task.attempts = row[3]
+            return row[0], task
+
+    def heartbeat(self, worker: str, task_id: int, seconds: float):
+        """Extend the lease of a task held by the worker."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE task SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+                (time.time() + seconds, task_id, worker),
+            )
+
+    def complete(
+        self,
+        task_id: Optional[int],
+        subtasks: List[BaseTask],
+        retry_delay: Optional[float] = None,
+    ):
+        """Remove a finished task and add its subtasks atomically.
+
+        With `retry_delay`, the task is kept instead and leased again by any worker
+        after that many seconds.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if task_id is not None and retry_delay is not None:
+                    self.conn.execute(
+                        "UPDATE task SET lease_owner = 'retry', lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (time.time() + retry_delay, task_id),
+                    )
+                elif task_id is not None:
+                    self.conn.execute("DELETE FROM task WHERE id = ?", (task_id,))
+                self.conn.executemany(
+                    "INSERT INTO task (kind, priority, payload) VALUES (?, ?, ?)",
+                    [self._encode(subtask) for subtask in subtasks],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
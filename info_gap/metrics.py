@@ -0,0 +1,301 @@
+"""Runtime metrics of tasks."""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds of latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class Histogram:
+    """Histogram of observed durations."""
+
+    counts: List[int]
+    total: float
+    count: int
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Record a value."""
+        self.total += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Pairs of (upper bound, number of values below it)."""
+        result, running = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the histogram to a JSON-serializable dict."""
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else None,
+            "buckets": {str(bound): n for bound, n in self.cumulative()},
+        }
+
+
+class TaskMetrics:
+    """Metrics of a single task class."""
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.responses = 0
+        self.parse_failures = 0
+        self.repaired = 0
+        self.repair_prompt_tokens = 0
+        self.repair_completion_tokens = 0
+        self.early_stops = 0
+        self.queries = 0
+        self.unique_queries = 0
+        self.queue_wait = Histogram()
+        self.latency = Histogram()
+        self.arxiv_fetch = Histogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the metrics to a JSON-serializable dict."""
+        tokens = self.prompt_tokens + self.completion_tokens
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "responses": self.responses,
+            "parse_failures": self.parse_failures,
+            "parse_failure_rate": (
+                round(self.parse_failures / self.responses, 6)
+                if self.responses
+                else None
+            ),
+            "repaired": self.repaired,
+            "repair_prompt_tokens": self.repair_prompt_tokens,
+            "repair_completion_tokens": self.repair_completion_tokens,
+            "early_stops": self.early_stops,
+            "queries": self.queries,
+            "unique_queries": self.unique_queries,
+            "unique_queries_per_1k_tokens": (
+                round(self.unique_queries * 1000 / tokens, 6) if tokens else None
+            ),
+            "queue_wait_seconds": self.queue_wait.to_dict(),
+            "latency_seconds": self.latency.to_dict(),
+            "arxiv_fetch_seconds": self.arxiv_fetch.to_dict(),
+        }
+
+
+class Metrics:
+    """Metrics of a run, grouped by task class, kept by its runtime context."""
+
+    tasks: Dict[str, TaskMetrics]
+    limits: Dict[str, int]
+
+    def __init__(self):
+        self.tasks = defaultdict(TaskMetrics)
+        self.limits = {}
+        self.accepted = 0
+        self.rejected = 0
+        self.first_accepted: Optional[float] = None
+        self.started = time.time()
+        self.last_dump = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record_wait(self, task_class: str, seconds: float):
+        """Record how long a task waited in the queue."""
+        with self.lock:
+            self.tasks[task_class].queue_wait.observe(seconds)
+
+    def record_run(self, task_class: str, seconds: float, error: bool = False):
+        """Record the execution latency of a task."""
+        with self.lock:
+            metrics = self.tasks[task_class]
+            metrics.runs += 1
+            metrics.errors += int(error)
+            metrics.latency.observe(seconds)
+
+    def record_retry(self, task_class: str):
+        """Record that a failed task is queued to run again."""
+        with self.lock:
+            self.tasks[task_class].retries += 1
+
+    def record_limit(self, resource: str, limit: int):
+        """Record the current concurrency limit of a resource."""
+        with self.lock:
+            self.limits[resource] = limit
+
+    def record_tokens(
+        self, task_class: str, prompt: int, completion: int, repair: bool = False
+    ):
+        """Record tokens reported in the `usage` field of a completion, those spent
+        repairing malformed replies are also counted apart."""
+        with self.lock:
+            metrics = self.tasks[task_class]
+            metrics.prompt_tokens += prompt
+            metrics.completion_tokens += completion
+            if repair:
+                metrics.repair_prompt_tokens += prompt
+                metrics.repair_completion_tokens += completion
+
+    def record_parse(self, task_class: str, failed: bool):
+        """Record whether a reply is parsed at the first attempt."""
+        with self.lock:
+            metrics = self.tasks[task_class]
+            metrics.responses += 1
+            metrics.parse_failures += int(failed)
+
+    def record_repair(self, task_class: str):
+        """Record that a malformed reply is repaired."""
+        with self.lock:
+            self.tasks[task_class].repaired += 1
+
+    def record_early_stop(self, task_class: str):
+        """Record that a streamed reply is stopped once its verdict is decided."""
+        with self.lock:
+            self.tasks[task_class].early_stops += 1
+
+    def record_queries(self, task_class: str, queries: int, unique: int):
+        """Record the queries of a brainstormed reply, and how many of them are
+        neither duplicates nor near-duplicates of queries already run."""
+        with self.lock:
+            metrics = self.tasks[task_class]
+            metrics.queries += queries
+            metrics.unique_queries += unique
+
+    def record_fetch(self, task_class: str, seconds: float):
+        """Record the latency of fetching a search result from arXiv."""
+        with self.lock:
+            self.tasks[task_class].arxiv_fetch.observe(seconds)
+
+    def record_verdict(self, accepted: bool):
+        """Record whether an article is accepted."""
+        with self.lock:
+            if accepted:
+                self.accepted += 1
+                if self.first_accepted is None:
+                    self.first_accepted = time.time() - self.started
+            else:
+                self.rejected += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Take a JSON-serializable snapshot of all metrics."""
+        with self.lock:
+            tokens = sum(
+                m.prompt_tokens + m.completion_tokens for m in self.tasks.values()
+            )
+            return {
+                "timestamp": time.time(),
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "tokens": tokens,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "accepted_per_1k_tokens": (
+                    round(self.accepted * 1000 / tokens, 6) if tokens else None
+                ),
+                "first_accepted_seconds": (
+                    round(self.first_accepted, 3)
+                    if self.first_accepted is not None
+                    else None
+                ),
+                "concurrency_limits": dict(self.limits),
+                "tasks": {name: m.to_dict() for name, m in self.tasks.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            lines.append(f"info_gap_accepted_total {self.accepted}")
+            lines.append(f"info_gap_rejected_total {self.rejected}")
+            for resource, limit in self.limits.items():
+                lines.append(
+                    f'info_gap_concurrency_limit{{resource="{resource}"}} {limit}'
+                )
+            for name, m in self.tasks.items():
+                label = f'task="{name}"'
+                lines.append(f"info_gap_task_runs_total{{{label}}} {m.runs}")
+                lines.append(f"info_gap_task_errors_total{{{label}}} {m.errors}")
+                lines.append(f"info_gap_task_retries_total{{{label}}} {m.retries}")
+                lines.append(
+                    f"info_gap_prompt_tokens_total{{{label}}} {m.prompt_tokens}"
+                )
+                lines.append(
+                    f"info_gap_completion_tokens_total{{{label}}} {m.completion_tokens}"
+                )
+                lines.append(f"info_gap_responses_total{{{label}}} {m.responses}")
+                lines.append(
+                    f"info_gap_parse_failures_total{{{label}}} {m.parse_failures}"
+                )
+                lines.append(f"info_gap_repaired_total{{{label}}} {m.repaired}")
+                lines.append(f"info_gap_early_stops_total{{{label}}} {m.early_stops}")
+                lines.append(f"info_gap_queries_total{{{label}}} {m.queries}")
+                lines.append(
+                    f"info_gap_unique_queries_total{{{label}}} {m.unique_queries}"
+                )
+                lines.append(
+                    f"info_gap_repair_tokens_total{{{label}}} "
+                    f"{m.repair_prompt_tokens + m.repair_completion_tokens}"
+                )
+                for metric, histogram in (
+                    ("info_gap_queue_wait_seconds", m.queue_wait),
+                    ("info_gap_task_latency_seconds", m.latency),
+                    ("info_gap_arxiv_fetch_seconds", m.arxiv_fetch),
+                ):
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else str(bound)
+                        lines.append(f'{metric}_bucket{{{label},le="{le}"}} {count}')
+                    lines.append(f"{metric}_sum{{{label}}} {histogram.total}")
+                    lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write a snapshot as JSON."""
+        with open(path, "w", encoding="UTF-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        self.last_dump = time.monotonic()
+
+    def maybe_dump(self, path: str, interval: float):
+        """Write a snapshot if the last one is older than `interval` seconds."""
+        if time.monotonic() - self.last_dump >= interval:
+            self.dump(path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """Serve metrics in Prometheus text format on localhost in a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handler of metrics requests."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Respond with the current metrics."""
+                body = metrics.to_prometheus().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                """Silence the access log."""
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -1,8 +1,13 @@
 """Model of the application."""
 
-from typing import List
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Literal, Optional
 from pydantic import BaseModel, Field
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
 
 
 class Example(BaseModel):
@@ -25,8 +30,15 @@ class Example(BaseModel):
         description="The reason for accept status.",
     )
 
-    def to_message(self) -> List[ChatCompletionMessageParam]:
-        """Convert the example to a chat completion message param."""
+    def to_message(
+        self, structured: bool = False
+    ) -> List["ChatCompletionMessageParam"]:
+        """Convert the example to a chat completion message param, with a JSON reply
+        in structured output mode."""
+        if structured:
+            reply = Proof(accepted=self.accepted, reason=self.reason).model_dump_json()
+        else:
+            reply = f"""{'Yes!' if self.accepted else 'No!'} {self.reason}"""
         return [
             {
                 "role": "user",
@@ -34,7 +46,7 @@ class Example(BaseModel):
             },
             {
                 "role": "assistant",
-                "content": f"""{'Yes!' if self.accepted else 'No!'} {self.reason}""",
+                "content": reply,
             },
         ]
 
@@ -42,6 +54,10 @@ class Example(BaseModel):
 class Request(BaseModel):
     """Model of the request."""
 
+    name: str = Field(
+        "default",
+        description="Name of the request, namespacing its deduplication and outputs.",
+    )
     this_paper_should_be: str = Field(
         ...,
         description="This paper should be ...",
@@ -66,14 +82,45 @@ class Search(BaseModel):
     query: str = Field(..., description="The search query.")
 
 
+class Searches(BaseModel):
+    """Model of several different search queries."""
+
+    queries: List[str] = Field(..., description="The search queries.")
+
+
 class Proof(BaseModel):
     """Model of a proof of relevancy."""
 
-    title: str = Field(
+    accepted: bool = Field(
         ...,
-        description="Title of the article.",
+        description="Whether the article is relevant.",
     )
     reason: str = Field(
         ...,
         description="Reason for relevancy or non-relevancy.",
     )
+
+
+class QueryRecord(BaseModel):
+    """Record of a search query that is run."""
+
+    query: str = Field(..., description="The search query.")
+    canonical: str = Field(..., description="Canonical form of the query.")
+    timestamp: datetime = Field(..., description="When the query was brainstormed.")
+
+
+class ArticleRecord(BaseModel):
+    """Record of an article in the output streams."""
+
+    article_id: str = Field(..., description="arXiv entry id of the article.")
+    title: str = Field(..., description="Title of the article.")
+    verdict: Optional[Literal["accepted", "rejected", "pruned"]] = Field(
+        None,
+        description="Verdict on the article, none if it is only found.",
+    )
+    reason: Optional[str] = Field(None, description="Reason for the verdict.")
+    query: Optional[str] = Field(None, description="Query that found the article.")
+    published: Optional[datetime] = Field(
+        None, description="When the article was submitted."
+    )
+    timestamp: datetime = Field(..., description="When the record was made.")
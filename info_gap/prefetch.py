@@ -0,0 +1,61 @@
+"""Background prefetch of search result pages."""
+
+import contextvars
+import queue
+import threading
+from typing import Callable, Generic, List, Optional, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class Prefetcher(Generic[T]):
+    """Fetch pages in a background thread, up to `depth` pages ahead of the consumer.
+
+    A page shorter than `page_size` is the last one. With `depth` 0, pages are fetched
+    on demand in the calling thread.
+    """
+
+    pages: "queue.Queue[Union[List[T], BaseException]]"
+
+    def __init__(self, fetch: Callable[[], List[T]], page_size: int, depth: int):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.depth = depth
+        self.pages = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        if depth > 0:
+            # The worker runs in the context of the caller, e.g. its runtime context
+            self.thread = threading.Thread(
+                target=contextvars.copy_context().run, args=(self.worker,), daemon=True
+            )
+            self.thread.start()
+
+    def worker(self):
+        """Fetch pages until the last one, or until stopped."""
+        while not self.stopped.is_set():
+            try:
+                page: Union[List[T], BaseException] = self.fetch()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                page = e
+            while not self.stopped.is_set():
+                try:
+                    self.pages.put(page, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(page, BaseException) or len(page) < self.page_size:
+                return
+
+    def next_page(self) -> List[T]:
+        """Get the next page, an error raised while fetching it is re-raised."""
+        if self.thread is None:
+            return self.fetch()
+        page = self.pages.get()
+        if isinstance(page, BaseException):
+            raise page
+        return page
+
+    def close(self):
+        """Stop fetching ahead."""
+        self.stopped.set()
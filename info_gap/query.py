@@ -0,0 +1,274 @@
+"""Parser and canonical form of arXiv search queries."""
+
+import re
+from dataclasses import dataclass
+from collections import defaultdict
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from info_gap.error import ValidationError
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:"(?P<phrase>[^"]*)"|(?P<open>\()|(?P<close>\))"""
+    r"""|(?P<op>ANDNOT|AND|OR)(?=[\s("]|$)|(?P<word>[^\s()"]+))"""
+)
+
+
+@dataclass(frozen=True)
+class Term:
+    """A keyword or quoted phrase."""
+
+    text: str
+
+
+@dataclass(frozen=True)
+class Not:
+    """A negated query, only appears inside `And`."""
+
+    child: "Node"
+
+
+@dataclass(frozen=True)
+class And:
+    """Conjunction of queries, negated children come from `ANDNOT`."""
+
+    children: Tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    """Disjunction of queries."""
+
+    children: Tuple["Node", ...]
+
+
+Node = Union[Term, Not, And, Or]
+
+
+def tokenize(query: str) -> List[Tuple[str, str]]:
+    """Split a query into (kind, value) tokens."""
+    tokens, position = [], 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN_PATTERN.match(query, position)
+        if match is None or match.end() == position:
+            raise ValidationError(f"Cannot parse query '{query}' at {position}.")
+        kind = match.lastgroup or ""
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser, `OR` binds looser than `AND` and `ANDNOT`.
+
+    Adjacent terms without an operator are joined with `AND`.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self) -> Tuple[str, str]:
+        """Look at the next token."""
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return ("end", "")
+
+    def take(self) -> Tuple[str, str]:
+        """Consume the next token."""
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        """Parse the whole query."""
+        node = self.parse_or()
+        if self.peek()[0] != "end":
+            raise ValidationError(
+                f"Unexpected '{self.peek()[1]}' in query '{self.query}'."
+            )
+        return node
+
+    def parse_or(self) -> Node:
+        """Parse a disjunction."""
+        children = [self.parse_and()]
+        while self.peek() == ("op", "OR"):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self) -> Node:
+        """Parse a conjunction, including `ANDNOT`."""
+        children = [self.parse_atom()]
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in ("AND", "ANDNOT"):
+                self.take()
+                child = self.parse_atom()
+                children.append(Not(child) if value == "ANDNOT" else child)
+            elif kind in ("phrase", "word", "open"):
+                children.append(self.parse_atom())
+            else:
+                break
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_atom(self) -> Node:
+        """Parse a term or a parenthesized query."""
+        kind, value = self.take()
+        if kind in ("phrase", "word"):
+            return Term(value)
+        if kind == "open":
+            node = self.parse_or()
+            if self.take()[0] != "close":
+                raise ValidationError(f"Unbalanced parenthesis in '{self.query}'.")
+            return node
+        raise ValidationError(f"Expected a keyword in query '{self.query}'.")
+
+
+def parse_query(query: str) -> Node:
+    """Parse a query in the syntax of `QUERY_RULE`."""
+    return Parser(query).parse()
+
+
+def canonicalize(node: Node) -> Node:
+    """Normalize case and whitespace, flatten nesting, sort and deduplicate children."""
+    if isinstance(node, Term):
+        return Term(" ".join(node.text.lower().split()))
+    if isinstance(node, Not):
+        return Not(canonicalize(node.child))
+    children: List[Node] = []
+    for child in (canonicalize(child) for child in node.children):
+        # `And` inside `And` and `Or` inside `Or` can be flattened
+        if type(child) is type(node):
+            children.extend(child.children)  # type: ignore[union-attr]
+        else:
+            children.append(child)
+    unique = sorted(set(children), key=render)
+    if len(unique) == 1 and not isinstance(unique[0], Not):
+        return unique[0]
+    return type(node)(tuple(unique))
+
+
+def render(node: Node) -> str:
+    """Render a node back to the query syntax."""
+    if isinstance(node, Term):
+        return f'"{node.text}"'
+    if isinstance(node, Not):
+        return f"NOT {render(node.child)}"
+    if isinstance(node, Or):
+        return " OR ".join(render_operand(child) for child in node.children)
+    positive = [child for child in node.children if not isinstance(child, Not)]
+    negative = [child.child for child in node.children if isinstance(child, Not)]
+    text = " AND ".join(render_operand(child) for child in positive)
+    if negative:
+        if len(positive) > 1:
+            text = f"({text})"
+        text += "".join(f" ANDNOT {render_operand(child)}" for child in negative)
+    return text
+
+
+def render_operand(node: Node) -> str:
+    """Render a node, parenthesized unless it is a single term."""
+    return render(node) if isinstance(node, Term) else f"({render(node)})"
+
+
+def canonical_query(query: str) -> str:
+    """Canonical form of a query, equal for semantically duplicate queries."""
+    return render(canonicalize(parse_query(query)))
+
+
+def positive_terms(node: Node) -> FrozenSet[str]:
+    """Terms that a matching article may contain, negated terms are left out."""
+    if isinstance(node, Term):
+        return frozenset([node.text])
+    if isinstance(node, Not):
+        return frozenset()
+    return frozenset().union(*(positive_terms(child) for child in node.children))
+
+
+def term_contexts(node: Node, path: str = "") -> FrozenSet[str]:
+    """Terms with their sign and the operators above them, e.g. `AND/NOT "survey"`, so
+    that queries combining the same terms in another way differ."""
+    if isinstance(node, Term):
+        return frozenset([f'{path}"{node.text}"'])
+    if isinstance(node, Not):
+        return term_contexts(node.child, f"{path}NOT ")
+    operator = "AND" if isinstance(node, And) else "OR"
+    return frozenset().union(
+        *(term_contexts(child, f"{path}{operator}/") for child in node.children)
+    )
+
+
+class QueryHistory:
+    """Terms of queries already run per request, to estimate overlap of a new query.
+
+    The queries of past runs are loaded with `load` the first time a request is seen.
+    """
+
+    term_sets: Dict[str, List[FrozenSet[str]]]
+    contexts: Dict[str, List[FrozenSet[str]]]
+    loaded: Set[str]
+
+    def __init__(self, load: Optional[Callable[[str], Iterable[str]]] = None):
+        self.term_sets = defaultdict(list)
+        self.contexts = defaultdict(list)
+        self.loaded = set()
+        self.load = load
+
+    def _load(self, request_name: str):
+        """Load the queries of past runs for a request, once."""
+        if request_name not in self.loaded:
+            self.loaded.add(request_name)
+            for query in self.load(request_name) if self.load else []:
+                self.add(query, request_name)
+
+    def add(self, query: str, request_name: str):
+        """Remember a query that is run for a request."""
+        node = canonicalize(parse_query(query))
+        self.term_sets[request_name].append(positive_terms(node))
+        self.contexts[request_name].append(term_contexts(node))
+
+    def overlap(self, query: str, request_name: str) -> float:
+        """Largest share of a past query's terms that the new query also uses.
+
+        1 means a past query's terms are subsumed by the new query, so its results are
+        likely already seen.
+        """
+        self._load(request_name)
+        terms = positive_terms(canonicalize(parse_query(query)))
+        return max(
+            (
+                len(past & terms) / len(past)
+                for past in self.term_sets[request_name]
+                if past
+            ),
+            default=0.0,
+        )
+
+    def similarity(self, query: str, request_name: str) -> float:
+        """Largest Jaccard similarity of the query's terms, in their context, to those
+        of a past query.
+
+        1 means a past query has the same terms under the same operators, negated
+        terms included.
+        """
+        self._load(request_name)
+        contexts = term_contexts(canonicalize(parse_query(query)))
+        return max(
+            (
+                len(past & contexts) / len(past | contexts)
+                for past in self.contexts[request_name]
+                if past | contexts
+            ),
+            default=0.0,
+        )
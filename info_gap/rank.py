@@ -0,0 +1,101 @@
+"""Lexical relevance pre-ranking of articles."""
+
+import re
+from typing import TYPE_CHECKING, Dict, List
+from info_gap.context import get_context
+from info_gap.model import Request
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# numpy is imported on first use, to keep it out of the startup path
+# pylint: disable=import-outside-toplevel
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    """a about all an and are as at be by can for from has have in into is it its of
+    on or our paper papers that the their these this to we which with""".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of a text, stop words removed and plurals crudely stemmed."""
+    return [
+        (
+            token[:-1]
+            if len(token) > 3 and token.endswith("s") and token[-2] != "s"
+            else token
+        )
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class PreRanker:
+    """TF-IDF relevance pre-scorer of articles for a request.
+
+    The request description and accepted examples are positive documents, rejected
+    examples are negative ones. A page of articles is scored in one vectorized batch
+    as its cosine similarity to the positive centroid minus that to the negative one.
+    """
+
+    positives: List[List[str]]
+    negatives: List[List[str]]
+
+    def __init__(self, request: Request, negative_weight: float = 0.5):
+        self.positives = [tokenize(request.this_paper_should_be)] + [
+            tokenize(f"{example.title} {example.summary}")
+            for example in request.examples
+            if example.accepted
+        ]
+        self.negatives = [
+            tokenize(f"{example.title} {example.summary}")
+            for example in request.examples
+            if not example.accepted
+        ]
+        self.negative_weight = negative_weight
+
+    def score(self, texts: List[str]) -> "np.ndarray":
+        """Score texts, higher is more likely relevant, in [-1, 1]."""
+        import numpy as np
+
+        if not texts:
+            return np.zeros(0)
+        documents = self.positives + self.negatives + [tokenize(t) for t in texts]
+        vocabulary: Dict[str, int] = {}
+        rows, columns = [], []
+        for row, document in enumerate(documents):
+            for token in document:
+                rows.append(row)
+                columns.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        # Term frequencies, sublinear, weighted by smoothed inverse document frequency
+        counts = np.zeros((len(documents), max(1, len(vocabulary))))
+        np.add.at(counts, (rows, columns), 1.0)
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        weights = np.log1p(counts) * idf
+        weights /= np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+
+        positive_count, negative_count = len(self.positives), len(self.negatives)
+        articles = weights[positive_count + negative_count :]
+        scores = articles @ unit(weights[:positive_count].mean(axis=0))
+        if negative_count:
+            negatives = weights[positive_count : positive_count + negative_count]
+            scores -= self.negative_weight * (articles @ unit(negatives.mean(axis=0)))
+        return scores
+
+
+def unit(vector: "np.ndarray") -> "np.ndarray":
+    """Normalize a vector to unit length."""
+    import numpy as np
+
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def get_ranker(request: Request) -> PreRanker:
+    """Get the pre-ranker of a request in the current context, fitted on first use."""
+    rankers = get_context().rankers
+    if request.name not in rankers:
+        rankers[request.name] = PreRanker(request)
+    return rankers[request.name]
@@ -0,0 +1,259 @@
+"""Rate limits, adaptive concurrency and retry policy of remote endpoints."""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+from info_gap.config import (
+    CONCURRENCY,
+    LATENCY_TOLERANCE,
+    LATENCY_WINDOW,
+    MAX_CONCURRENCY,
+    RATE_LIMIT,
+    RETRY_BASE_SECONDS,
+    RETRY_MAX_SECONDS,
+)
+from info_gap.context import get_context
+
+# HTTP statuses worth retrying, and those telling us to slow down
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` calls per second in bursts of up to `burst` calls.
+
+    A rate of 0 is unlimited. Callers reserve a token and wait until it is due, so
+    waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, return the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """Wait for a token."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        """Wait for a token without blocking the event loop."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of an endpoint, by additive increase, multiplicative decrease.
+
+    Every successful call adds `1 / limit`, so the limit grows by one per round of
+    calls. The limit is cut by `backoff` when the endpoint throttles, or when the
+    last round of calls is `tolerance` times slower than usual, at most once per
+    round of calls. Latency grows with the work a call does, e.g. its completion
+    tokens, so a call is compared to the median of the last `window` calls of a
+    similar size; a single slow call or a fast outlier does not move the limit.
+    """
+
+    latencies: Dict[int, Deque[float]]
+    ratios: Deque[float]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        initial: int,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        backoff: float = 0.5,
+        tolerance: float = LATENCY_TOLERANCE,
+        window: int = LATENCY_WINDOW,
+    ):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(initial, maximum or initial)
+        self.value = float(initial)
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.window = max(10, window)
+        self.latencies = {}
+        self.ratios = deque(maxlen=max(3, self.maximum))
+        self.since_decrease = initial
+        self.lock = threading.Lock()
+        get_context().metrics.record_limit(name, self.limit)
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight."""
+        return max(self.minimum, int(self.value))
+
+    def _decrease(self):
+        if self.since_decrease < self.limit:
+            return
+        self.since_decrease = 0
+        self.value = max(float(self.minimum), self.value * self.backoff)
+        get_context().metrics.record_limit(self.name, self.limit)
+
+    def _overloaded(self, latency: float, units: float) -> bool:
+        """Record a latency, return whether the last round of calls is much slower
+        than the usual calls of their size."""
+        # Sizes are bucketed by powers of two
+        history = self.latencies.setdefault(
+            max(0, int(units)).bit_length(), deque(maxlen=self.window)
+        )
+        if len(history) >= 10:
+            baseline = sorted(history)[len(history) // 2]
+            self.ratios.append(latency / baseline if baseline > 0 else 1.0)
+        history.append(latency)
+        # A round of fewer than 3 calls is too few to tell
+        recent = sorted(list(self.ratios)[-max(3, self.limit) :])
+        return len(recent) >= 3 and recent[len(recent) // 2] > self.tolerance
+
+    def on_success(self, latency: Optional[float] = None, units: float = 1.0):
+        """Adjust the limit after a successful call that took `latency` seconds for
+        `units` of work."""
+        with self.lock:
+            self.since_decrease += 1
+            if latency is not None and self._overloaded(latency, units):
+                self._decrease()
+                return
+            self.value = min(float(self.maximum), self.value + 1 / self.value)
+            get_context().metrics.record_limit(self.name, self.limit)
+
+    def on_error(self, error: BaseException):
+        """Adjust the limit after a failed call."""
+        with self.lock:
+            self.since_decrease += 1
+            if is_throttle(error):
+                self._decrease()
+
+
+# The OpenAI and arXiv clients are looked up in `sys.modules` rather than imported: an
+# error can only come from a client that is already imported.
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    """HTTP status of an error raised by the OpenAI or arXiv client, if any."""
+    openai, arxiv = sys.modules.get("openai"), sys.modules.get("arxiv")
+    if openai is not None and isinstance(error, openai.APIStatusError):
+        return error.status_code
+    if arxiv is not None and isinstance(error, arxiv.HTTPError):
+        return error.status
+    return None
+
+
+def is_throttle(error: BaseException) -> bool:
+    """Whether the endpoint asks us to slow down."""
+    return status_of(error) in THROTTLE_STATUS
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether the call failed transiently and may succeed if tried again."""
+    openai, arxiv = sys.modules.get("openai"), sys.modules.get("arxiv")
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return True
+    if arxiv is not None and isinstance(error, arxiv.UnexpectedEmptyPageError):
+        return True
+    return status_of(error) in RETRYABLE_STATUS
+
+
+def retry_delay(
+    error: BaseException,
+    attempt: int,
+    base: float = RETRY_BASE_SECONDS,
+    cap: float = RETRY_MAX_SECONDS,
+) -> float:
+    """Seconds to wait before retry `attempt` (from 0), with full jitter.
+
+    A `Retry-After` header sent along the error is respected.
+    """
+    # A task that always queues itself again keeps counting attempts
+    delay = random.uniform(0, min(cap, base * 2 ** min(attempt, 32)))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(delay, min(cap, float(retry_after))) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+class Call:
+    """A tracked call, with the units of work it did, e.g. completion tokens, to
+    compare the latency of calls of different sizes."""
+
+    def __init__(self):
+        self.units = 1.0
+
+
+@contextmanager
+def track(resource: str, latency: bool = True) -> Iterator[Call]:
+    """Feed the outcome of a call to the adaptive limiter of its resource.
+
+    Set `latency` to `False` when the call may be served locally, e.g. from a cache,
+    so that only errors are taken into account.
+    """
+    limiter = get_limiter(resource)
+    call = Call()
+    started = time.monotonic()
+    try:
+        yield call
+    except Exception as e:
+        if limiter is not None:
+            limiter.on_error(e)
+        raise
+    if limiter is not None:
+        elapsed = time.monotonic() - started
+        limiter.on_success(elapsed if latency else None, call.units)
+
+
+def get_limiter(resource: str) -> Optional[AdaptiveLimiter]:
+    """Adaptive limiter of a resource at the endpoint of the current context, `None`
+    if its concurrency is not limited."""
+    if resource not in CONCURRENCY:
+        return None
+    key = (resource, get_context().endpoint(resource))
+    with REGISTRY_LOCK:
+        if key not in LIMITERS:
+            LIMITERS[key] = AdaptiveLimiter(
+                resource,
+                CONCURRENCY[resource],
+                maximum=MAX_CONCURRENCY.get(resource, CONCURRENCY[resource]),
+            )
+        return LIMITERS[key]
+
+
+def get_rate_limiter(resource: str) -> TokenBucket:
+    """Token bucket of a resource at the endpoint of the current context."""
+    key = (resource, get_context().endpoint(resource))
+    with REGISTRY_LOCK:
+        if key not in RATE_LIMITERS:
+            rate = RATE_LIMIT.get(resource, 0.0)
+            RATE_LIMITERS[key] = TokenBucket(rate, burst=max(1.0, rate))
+        return RATE_LIMITERS[key]
+
+
+# Limits are shared by the contexts calling the same endpoint, by resource and URL
+LIMITERS: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+RATE_LIMITERS: Dict[Tuple[str, str], TokenBucket] = {}
+REGISTRY_LOCK = threading.Lock()
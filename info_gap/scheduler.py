@@ -1,36 +1,290 @@
 """Scheduler of tasks."""
 
+import asyncio
 import logging
-from typing import List
+import time
+import os
+import socket
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from info_gap.config import (
+    METRICS_INTERVAL,
+    RETRY_MAX_ATTEMPTS,
+    TASK_LEASE_SECONDS,
+    TASK_POLL_SECONDS,
+)
+from info_gap.context import RuntimeContext, get_context
+from info_gap.durable_queue import DurableTaskQueue
+from info_gap.error import ValidationError
+from info_gap.ratelimit import get_limiter, is_retryable, retry_delay
 from info_gap.task.base_task import BaseTask
+from info_gap.task_queue import TaskQueue
 
 
 class Scheduler:
-    """Scheduler of tasks."""
+    """Scheduler of tasks, running them in a runtime context, by default the current
+    one."""
 
-    tasks: List[BaseTask]
+    queue: TaskQueue
     error_counter: int
+    context: RuntimeContext
 
-    def __init__(self):
-        self.tasks = []
+    def __init__(
+        self,
+        max_backlog: Optional[Dict[str, int]] = None,
+        context: Optional[RuntimeContext] = None,
+    ):
+        self.queue = TaskQueue(max_backlog)
         self.error_counter = 0
+        self.context = context or get_context()
 
     def add_task(self, task: BaseTask):
         """Add a task to the scheduler."""
-        self.tasks.append(task)
+        self.queue.push(task)
 
-    def run(self):
-        """Run the scheduler."""
-        while self.tasks:
-            self.tasks.sort(key=lambda task: task.priority, reverse=True)
-            task = self.tasks.pop(0)
-            try:
-                print(f'🔥 Running task "{task.name}" [{task.priority}]')
-                subtasks = task.run()
-                for subtask in subtasks:
+    def handle_error(
+        self, task: BaseTask, e: Exception, requeued: bool = False
+    ) -> Optional[float]:
+        """Count and report an error raised by a task, return the delay before it is
+        retried, or `None` if it is dropped.
+
+        Transient errors of the endpoints are retried with backoff; a task that queued
+        itself again is always retried, with a backoff instead of right away. Invalid
+        responses and other errors are final.
+        """
+        self.error_counter += 1
+        if isinstance(e, ValidationError):
+            error_msg = f'🙅 Invalid response #{self.error_counter}: "{e}", dropping!'
+        elif is_retryable(e) and (requeued or task.attempts < RETRY_MAX_ATTEMPTS):
+            delay = retry_delay(e, task.attempts)
+            task.attempts += 1
+            self.context.metrics.record_retry(type(task).__name__)
+            error_msg = (
+                f'🔁 Error #{self.error_counter}: "{e}", '
+                f"retry {task.attempts} in {delay:.1f}s!"
+            )
+            print(error_msg)
+            logging.debug(error_msg)
+            return delay
+        else:
+            error_msg = f'😭 Error #{self.error_counter}: "{e}", aborting!'
+        print(error_msg)
+        logging.debug(error_msg)
+        return None
+
+    def dump_metrics(self, force: bool = False):
+        """Write a metrics snapshot to the log path, periodically unless forced."""
+        path = f"{self.context.log_path}/metrics.json"
+        if force:
+            self.context.metrics.dump(path)
+        else:
+            self.context.metrics.maybe_dump(path, METRICS_INTERVAL)
+
+    def execute(self, task: BaseTask) -> Tuple[List[BaseTask], Optional[float]]:
+        """Run a single task, return the subtasks it generated before any error, and
+        the delay before retrying it if it failed transiently."""
+        task_class = type(task).__name__
+        started = time.monotonic()
+        if task.enqueued_at:
+            self.context.metrics.record_wait(task_class, started - task.enqueued_at)
+        subtasks: List[BaseTask] = []
+        delay = None
+        error = False
+        try:
+            print(f'🔥 Running task "{task.name}" [{task.priority}]')
+            for subtask in task.run():
+                subtasks.append(subtask)
+            task.attempts = 0
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            error = True
+            delay = self.handle_error(
+                task, e, requeued=any(subtask is task for subtask in subtasks)
+            )
+            if delay is not None:
+                # The task is queued again after the delay, not right away
+                subtasks = [subtask for subtask in subtasks if subtask is not task]
+        self.context.metrics.record_run(task_class, time.monotonic() - started, error)
+        return subtasks, delay
+
+    def run(self, max_tasks: Optional[int] = None):
+        """Run the scheduler until no task is left, or `max_tasks` tasks ran."""
+        with self.context.use():
+            self.run_tasks(max_tasks)
+
+    def run_tasks(self, max_tasks: Optional[int]):
+        """Run tasks in the current context."""
+        executed = 0
+        while self.queue and (max_tasks is None or executed < max_tasks):
+            task = self.queue.pop()
+            if task is None:
+                # Only retries waiting for their backoff, or paused producers, remain
+                wait = self.queue.wait_time()
+                if wait is None:
+                    break
+                time.sleep(wait)
+                continue
+            subtasks, delay = self.execute(task)
+            executed += 1
+            for subtask in subtasks:
+                self.add_task(subtask)
+            if delay is not None:
+                self.queue.push(task, delay)
+            self.dump_metrics()
+        self.dump_metrics(force=True)
+
+
+class AsyncScheduler(Scheduler):
+    """Scheduler that keeps many tasks in flight on an asyncio event loop.
+
+    The concurrency of a resource is given by `limits`, or adapts to the endpoint
+    by its limiter.
+    """
+
+    limits: Dict[str, int]
+    running: Dict[str, int]
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        max_backlog: Optional[Dict[str, int]] = None,
+        context: Optional[RuntimeContext] = None,
+    ):
+        super().__init__(max_backlog, context)
+        self.limits = dict(limits or {})
+        self.running = {}
+
+    def has_capacity(self, resource: str) -> bool:
+        """Whether the resource can take one more running task."""
+        limiter = get_limiter(resource)
+        if resource in self.limits:
+            limit = self.limits[resource]
+        elif limiter is not None:
+            limit = limiter.limit
+        else:
+            return True
+        return self.running.get(resource, 0) < limit
+
+    def next_task(self) -> Optional[BaseTask]:
+        """Pop the task of highest priority whose resource has spare capacity."""
+        resources = [r for r in self.queue.heaps if self.has_capacity(r)]
+        return self.queue.pop(resources)
+
+    async def run_task(self, task: BaseTask):
+        """Run a single task and collect its subtasks."""
+        task_class = type(task).__name__
+        started = time.monotonic()
+        self.context.metrics.record_wait(task_class, started - task.enqueued_at)
+        error = False
+        requeued = False
+        delay = None
+        try:
+            print(f'🔥 Running task "{task.name}" [{task.priority}]')
+            async for subtask in task.arun():
+                if subtask is task:
+                    # Queued once the task is done, after a delay if it failed
+                    requeued = True
+                else:
                     self.add_task(subtask)
-            except Exception as e:  # pylint: disable=broad-exception-caught
-                self.error_counter += 1
-                error_msg = f'😭 Error #{self.error_counter}: "{e}", aborting!'
-                print(error_msg)
-                logging.debug(error_msg)
+            task.attempts = 0
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            error = True
+            delay = self.handle_error(task, e, requeued)
+        finally:
+            self.running[task.resource] -= 1
+            self.context.metrics.record_run(
+                task_class, time.monotonic() - started, error
+            )
+        if delay is not None:
+            self.queue.push(task, delay)
+        elif requeued:
+            self.add_task(task)
+
+    async def run(self, max_tasks: Optional[int] = None):  # type: ignore[override]
+        """Run the scheduler until no task is left, or `max_tasks` tasks started."""
+        with self.context.use():
+            await self.run_tasks(max_tasks)
+
+    async def run_tasks(self, max_tasks: Optional[int]):  # type: ignore[override]
+        """Run tasks in the current context, asyncio tasks inherit it."""
+        in_flight: Set[asyncio.Task] = set()
+        started = 0
+        while self.queue or in_flight:
+            while (max_tasks is None or started < max_tasks) and (
+                task := self.next_task()
+            ) is not None:
+                self.running[task.resource] = self.running.get(task.resource, 0) + 1
+                in_flight.add(asyncio.create_task(self.run_task(task)))
+                started += 1
+            wait = self.queue.wait_time()
+            if not in_flight:
+                if wait is None or started == max_tasks:
+                    break
+                await asyncio.sleep(wait)
+                continue
+            _, in_flight = await asyncio.wait(
+                in_flight, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+            )
+            self.dump_metrics()
+        self.dump_metrics(force=True)
+
+
+class DurableScheduler(Scheduler):
+    """Worker that runs tasks leased from a durable queue shared with other workers.
+
+    Searches are not shared between requests: the search a request would join is
+    stored in the queue, and the worker leasing it holds another copy. The runtime
+    context of a worker is built with `share_searches=False`, by default from the
+    environment.
+    """
+
+    durable: DurableTaskQueue
+    worker: str
+
+    def __init__(
+        self,
+        durable: DurableTaskQueue,
+        lease_seconds: float = TASK_LEASE_SECONDS,
+        context: Optional[RuntimeContext] = None,
+    ):
+        if context is None:
+            context = RuntimeContext(share_searches=False)
+        elif context.share_searches:
+            raise ValueError("A worker needs a context built with share_searches=False")
+        super().__init__(context=context)
+        self.durable = durable
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+
+    def add_task(self, task: BaseTask):
+        """Add a task to the durable queue."""
+        self.durable.push(task)
+
+    def heartbeat(self, task_id: int, done: threading.Event):
+        """Extend the lease of a running task until it is done."""
+        while not done.wait(self.lease_seconds / 3):
+            self.durable.heartbeat(self.worker, task_id, self.lease_seconds)
+
+    def run_tasks(self, max_tasks: Optional[int]):
+        """Run leased tasks until the durable queue is empty, or `max_tasks` ran."""
+        executed = 0
+        while max_tasks is None or executed < max_tasks:
+            leased = self.durable.lease(self.worker, self.lease_seconds)
+            if leased is None:
+                # Other workers may still add subtasks of the tasks they hold
+                if not self.durable:
+                    break
+                time.sleep(TASK_POLL_SECONDS)
+                continue
+            task_id, task = leased
+            done = threading.Event()
+            threading.Thread(
+                target=self.heartbeat, args=(task_id, done), daemon=True
+            ).start()
+            try:
+                subtasks, delay = self.execute(task)
+            finally:
+                done.set()
+            self.durable.complete(task_id, subtasks, retry_delay=delay)
+            executed += 1
+            self.dump_metrics()
+        self.dump_metrics(force=True)
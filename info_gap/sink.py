@@ -0,0 +1,101 @@
+"""Buffered JSON Lines sinks of results."""
+
+import gzip
+import os
+import shutil
+import threading
+import time
+from typing import List
+from pydantic import BaseModel
+from info_gap.context import get_context
+from info_gap.config import (
+    SINK_FLUSH_RECORDS,
+    SINK_FLUSH_SECONDS,
+    SINK_FSYNC,
+    SINK_ROTATE_BYTES,
+)
+
+
+class ResultSink:
+    """Buffered writer of one output stream, one JSON record per line.
+
+    Records are written every `flush_records` records or `flush_seconds` seconds,
+    followed by an fsync if `fsync` is set. Once the file grows past `rotate_bytes`,
+    it is compressed with gzip and a new file is started; 0 disables rotation.
+    """
+
+    buffer: List[str]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        path: str,
+        flush_records: int = SINK_FLUSH_RECORDS,
+        flush_seconds: float = SINK_FLUSH_SECONDS,
+        fsync: bool = SINK_FSYNC,
+        rotate_bytes: int = SINK_ROTATE_BYTES,
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        # Number the compressed files after those of earlier runs
+        self.rotations = 0
+        while os.path.exists(f"{path}.{self.rotations + 1}.gz"):
+            self.rotations += 1
+        self.lock = threading.Lock()
+        self.file = open(
+            path, "a", encoding="UTF-8"
+        )  # pylint: disable=consider-using-with
+
+    def write(self, record: BaseModel):
+        """Buffer a record, flushing when the buffer is full or old enough."""
+        with self.lock:
+            self.buffer.append(record.model_dump_json() + "\n")
+            if (
+                len(self.buffer) >= self.flush_records
+                or time.monotonic() - self.last_flush >= self.flush_seconds
+            ):
+                self._flush()
+
+    def flush(self):
+        """Write buffered records to the file."""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+        if self.rotate_bytes and self.file.tell() >= self.rotate_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """Compress the current file and start a new one."""
+        self.file.close()
+        self.rotations += 1
+        with open(self.path, "rb") as source, gzip.open(
+            f"{self.path}.{self.rotations}.gz", "wb"
+        ) as target:
+            shutil.copyfileobj(source, target)
+        self.file = open(
+            self.path, "w", encoding="UTF-8"
+        )  # pylint: disable=consider-using-with
+
+    def close(self):
+        """Flush and close the file."""
+        with self.lock:
+            self._flush()
+            self.file.close()
+
+
+def get_sink(name: str) -> ResultSink:
+    """Get the sink of an output stream in the log directory of the current context."""
+    return get_context().sink(name)
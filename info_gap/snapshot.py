@@ -0,0 +1,277 @@
+"""Local arXiv metadata snapshot, searched offline with an inverted index.
+
+The bulk metadata snapshot of arXiv, one JSON object per line, is ingested once into
+a directory of memory-mapped columns:
+
+    python -m info_gap.snapshot arxiv-metadata-oai-snapshot.json snapshot/ --categories cs.
+
+Queries in the syntax of `QUERY_RULE` are answered from it, newest first.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import arxiv  # type: ignore
+import numpy as np
+from info_gap.query import And, Node, Not, Or, Term, parse_query
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Text columns of an article
+COLUMNS = ("entry_id", "title", "summary")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens of a text."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def submitted(record: Dict) -> datetime:
+    """Submitted date of the first version of a snapshot record."""
+    return parsedate_to_datetime(record["versions"][0]["created"]).astimezone(
+        timezone.utc
+    )
+
+
+def mapped(path: str, dtype) -> np.ndarray:
+    """Read-only memory map of a binary file, which cannot map an empty one."""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class StringColumn:
+    """Strings stored as one UTF-8 blob and the offsets of each string in it."""
+
+    def __init__(self, directory: str, name: str):
+        self.blob = mapped(f"{directory}/{name}.bin", np.uint8)
+        self.offsets = np.load(f"{directory}/{name}.offsets.npy", mmap_mode="r")
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.blob[start:end]).decode("UTF-8")
+
+    @staticmethod
+    def write(directory: str, name: str, offsets: array):
+        """Write the offsets of a column whose blob is already written."""
+        np.save(f"{directory}/{name}.offsets.npy", np.frombuffer(offsets, np.int64))
+
+
+def ingest(
+    source: str, directory: str, categories: Optional[Sequence[str]] = None
+) -> int:
+    """Ingest a bulk metadata snapshot, optionally only the articles in categories
+    starting with one of `categories`; return the number of articles."""
+    os.makedirs(directory, exist_ok=True)
+    postings: Dict[str, array] = defaultdict(lambda: array("i"))
+    published = array("q")
+    offsets = {column: array("q", [0]) for column in COLUMNS}
+    blobs = {
+        column: open(  # pylint: disable=consider-using-with
+            f"{directory}/{column}.bin", "wb"
+        )
+        for column in COLUMNS
+    }
+    count = 0
+    try:
+        with open(source, encoding="UTF-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if categories and not any(
+                    category.startswith(tuple(categories))
+                    for category in record["categories"].split()
+                ):
+                    continue
+                # The API reports the latest version in the entry id
+                values = {
+                    "entry_id": f"http://arxiv.org/abs/{record['id']}"
+                    f"{record['versions'][-1]['version']}",
+                    "title": " ".join(record["title"].split()),
+                    "summary": " ".join(record["abstract"].split()),
+                }
+                for column, value in values.items():
+                    data = value.encode("UTF-8")
+                    blobs[column].write(data)
+                    offsets[column].append(offsets[column][-1] + len(data))
+                published.append(int(submitted(record).timestamp()))
+                for token in set(tokenize(f"{values['title']} {values['summary']}")):
+                    postings[token].append(count)
+                count += 1
+    finally:
+        for blob in blobs.values():
+            blob.close()
+
+    for column in COLUMNS:
+        StringColumn.write(directory, column, offsets[column])
+    np.save(f"{directory}/published.npy", np.frombuffer(published, np.int64))
+
+    # Postings of every token, concatenated in one array, with their bounds by token
+    vocabulary = {}
+    with open(f"{directory}/postings.bin", "wb") as f:
+        start = 0
+        for token in sorted(postings):
+            ids = postings.pop(token)
+            f.write(ids.tobytes())
+            vocabulary[token] = (start, start + len(ids))
+            start += len(ids)
+    with open(f"{directory}/vocabulary.json", "w", encoding="UTF-8") as f:
+        json.dump(vocabulary, f, separators=(",", ":"))
+    return count
+
+
+class ArxivSnapshot:
+    """Search over an ingested snapshot.
+
+    Every token of a title or abstract points to the articles containing it. A query
+    first narrows to the articles with all tokens of its terms, then each candidate,
+    newest first, is checked for the exact phrases as they are consumed, so a search
+    only reads the text of the results it returns.
+    """
+
+    vocabulary: Dict[str, Tuple[int, int]]
+
+    def __init__(self, directory: str):
+        self.columns = {column: StringColumn(directory, column) for column in COLUMNS}
+        self.published = np.load(f"{directory}/published.npy", mmap_mode="r")
+        self.postings = mapped(f"{directory}/postings.bin", np.int32)
+        with open(f"{directory}/vocabulary.json", encoding="UTF-8") as f:
+            self.vocabulary = {
+                token: (start, end) for token, (start, end) in json.load(f).items()
+            }
+        self.newest = (
+            datetime.fromtimestamp(int(self.published.max()), timezone.utc)
+            if len(self.published)
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.published)
+
+    def posting(self, token: str) -> np.ndarray:
+        """Articles containing a token, in ascending order."""
+        start, end = self.vocabulary.get(token, (0, 0))
+        return self.postings[start:end]
+
+    def candidates(self, node: Node) -> np.ndarray:
+        """Articles that may match a query, a superset of the matches."""
+        if isinstance(node, Term):
+            tokens = tokenize(node.text)
+            if not tokens:
+                return np.arange(len(self), dtype=np.int32)
+            result = self.posting(tokens[0])
+            for token in tokens[1:]:
+                result = np.intersect1d(result, self.posting(token), assume_unique=True)
+            return result
+        if isinstance(node, Or):
+            result = np.empty(0, dtype=np.int32)
+            for child in node.children:
+                result = np.union1d(result, self.candidates(child))
+            return result
+        if isinstance(node, And):
+            positive = [child for child in node.children if not isinstance(child, Not)]
+            result = self.candidates(positive[0])
+            for child in positive[1:]:
+                result = np.intersect1d(
+                    result, self.candidates(child), assume_unique=True
+                )
+            for child in node.children:
+                # An article with the token of a single word certainly matches it
+                if isinstance(child, Not) and isinstance(child.child, Term):
+                    tokens = tokenize(child.child.text)
+                    if len(tokens) == 1:
+                        result = np.setdiff1d(
+                            result, self.posting(tokens[0]), assume_unique=True
+                        )
+            return result
+        raise TypeError(node)
+
+    @classmethod
+    def exact(cls, node: Node) -> bool:
+        """Whether the candidates of a query are exactly its matches, as for queries
+        of single words."""
+        if isinstance(node, Term):
+            return len(tokenize(node.text)) == 1
+        if isinstance(node, Not):
+            return False
+        if isinstance(node, And):
+            # Only negated words are subtracted from the candidates
+            return all(
+                (
+                    isinstance(child.child, Term) and cls.exact(child.child)
+                    if isinstance(child, Not)
+                    else cls.exact(child)
+                )
+                for child in node.children
+            )
+        return all(cls.exact(child) for child in node.children)
+
+    @classmethod
+    def matches(cls, node: Node, text: str) -> bool:
+        """Whether a text, as its tokens joined by spaces, matches a query."""
+        if isinstance(node, Term):
+            return f" {' '.join(tokenize(node.text))} " in text
+        if isinstance(node, Not):
+            return not cls.matches(node.child, text)
+        if isinstance(node, And):
+            return all(cls.matches(child, text) for child in node.children)
+        return any(cls.matches(child, text) for child in node.children)
+
+    def article(self, index: int) -> arxiv.Result:
+        """Article of the snapshot as an arXiv result."""
+        return arxiv.Result(
+            entry_id=self.columns["entry_id"][index],
+            title=self.columns["title"][index],
+            summary=self.columns["summary"][index],
+            published=datetime.fromtimestamp(int(self.published[index]), timezone.utc),
+        )
+
+    def search(self, query: str) -> Iterator[int]:
+        """Indices of the articles matching a query, newest first."""
+        node = parse_query(query)
+        candidates = self.candidates(node)
+        order = np.argsort(-self.published[candidates], kind="stable")
+        if self.exact(node):
+            yield from candidates[order].tolist()
+            return
+        for index in candidates[order].tolist():
+            title, summary = (
+                self.columns["title"][index],
+                self.columns["summary"][index],
+            )
+            if self.matches(node, f" {' '.join(tokenize(f'{title} {summary}'))} "):
+                yield index
+
+    def results(
+        self, query: str, max_results: int, offset: int = 0
+    ) -> Iterator[arxiv.Result]:
+        """Results of a query sorted by submitted date, skipping the first `offset`."""
+        for index in itertools.islice(self.search(query), offset, max_results):
+            yield self.article(index)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ingest a snapshot from the command line."""
+    parser = argparse.ArgumentParser(description="Ingest an arXiv metadata snapshot.")
+    parser.add_argument("source", help="JSON lines snapshot of arXiv metadata")
+    parser.add_argument("directory", help="directory of the ingested snapshot")
+    parser.add_argument(
+        "--categories",
+        nargs="*",
+        help="only ingest articles in categories with these prefixes, e.g. cs.",
+    )
+    args = parser.parse_args(argv)
+    count = ingest(args.source, args.directory, args.categories)
+    print(f"📚 Ingested {count} articles into {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 """Module for base class."""
 
-from typing import Iterable
+import asyncio
+from typing import Any, AsyncIterator, ClassVar, Dict, Iterable, Tuple, Type
 
 
 class BaseTask:
@@ -9,10 +10,57 @@ class BaseTask:
     name: str
     priority: int
 
+    # Task classes by name, to load serialized tasks.
+    types: ClassVar[Dict[str, Type["BaseTask"]]] = {}
+
+    # Resource occupied while running, concurrency is limited per resource.
+    resource: str = "local"
+
+    # Task types this task produces, it is paused while their backlog is full.
+    produces: Tuple[str, ...] = ()
+
+    # Monotonic time when the task was last queued.
+    enqueued_at: float = 0.0
+
+    # Number of times the task failed transiently in a row and was queued again.
+    attempts: int = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        BaseTask.types[cls.__name__] = cls
+
     def __init__(self, name: str, priority: int):
         self.name = name
         self.priority = priority
 
+    @property
+    def owner(self) -> str:
+        """Name of the request the task works for, capacity is shared among them."""
+        request = getattr(self, "request", None)
+        return request.name if request is not None else ""
+
+    def waiting(self) -> bool:
+        """Whether the task waits for a condition of its own before it may run."""
+        return False
+
+    def dump(self) -> Dict[str, Any]:
+        """Serializable state of the task, `request` may be a `Request` model."""
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "BaseTask":
+        """Restore a task from the state returned by `dump`."""
+        raise NotImplementedError
+
     def run(self) -> Iterable["BaseTask"]:
         """Run the task, return subtasks it generates."""
         raise NotImplementedError
+
+    async def arun(self) -> AsyncIterator["BaseTask"]:
+        """Run the task asynchronously, yield subtasks it generates.
+
+        By default every step of `run` is executed in a worker thread.
+        """
+        iterator = iter(self.run())
+        while (subtask := await asyncio.to_thread(next, iterator, None)) is not None:
+            yield subtask
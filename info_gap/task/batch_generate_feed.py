@@ -0,0 +1,109 @@
+"""Task for generating feed cards of several articles in one completion."""
+
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+import re
+from info_gap.article import Article
+from info_gap.model import Request
+from info_gap.task.base_task import BaseTask
+from info_gap.task.completion_task import CompletionTask
+from info_gap.task.generate_feed import GenerateFeedTask, feed_prompt, save_proof
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+
+class BatchGenerateFeedTask(CompletionTask):
+    """Task for judging several articles of the same request in one completion.
+
+    The system prompt and examples are sent once for the whole batch. Articles whose
+    answer cannot be parsed fall back to a `GenerateFeedTask` each.
+    """
+
+    request: Request
+    articles: List[Article]
+    query: Optional[str]
+
+    def __init__(
+        self,
+        request: Request,
+        articles: List[Article],
+        priority: int = 100,
+        query: Optional[str] = None,
+    ):
+        self.request = request
+        self.articles = articles
+        self.query = query
+        super().__init__(
+            name=f"BatchGenerateFeedTask({len(articles)} articles)",
+            priority=priority,
+            temperature=0,
+        )
+
+    def messages(self) -> List["ChatCompletionMessageParam"]:
+        """Prompt of the request followed by the numbered articles."""
+        numbered = "\n".join(
+            f"""{index}. Title: '{article.title}' Abstract: '{article.summary}'"""
+            for index, article in enumerate(self.articles, start=1)
+        )
+        return [
+            *feed_prompt(self.request),
+            {
+                "role": "system",
+                "content": """Several numbered articles follow. Answer for every article on its own line, starting with its number, e.g. '1. Yes! ...' or '2. No! ...'.""",
+            },
+            {
+                "role": "user",
+                "content": f"""Please answer the question for these articles:\n{numbered}""",
+            },
+        ]
+
+    def dump(self) -> Dict[str, Any]:
+        """Serializable state of the task."""
+        return {
+            "request": self.request,
+            "articles": [article.dump() for article in self.articles],
+            "priority": self.priority,
+            "query": self.query,
+        }
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "BatchGenerateFeedTask":
+        """Restore a task from the state returned by `dump`."""
+        return cls(
+            request=state["request"],
+            articles=[Article.load(article) for article in state["articles"]],
+            priority=state["priority"],
+            query=state["query"],
+        )
+
+    @staticmethod
+    def parse_answers(response: str) -> Dict[int, Tuple[bool, str]]:
+        """Parse numbered answers into a map of number to (accepted, reason)."""
+        pattern = r"^\s*(\d+)[.):]\s*(Yes|No)! (.+?)\s*(?=^\s*\d+[.):]|\Z)"
+        return {
+            int(match.group(1)): (match.group(2) == "Yes", match.group(3))
+            for match in re.finditer(pattern, response, re.MULTILINE | re.DOTALL)
+        }
+
+    def parse_response(self, response: str) -> Iterable["BaseTask"]:
+        """Parse the response, articles without a valid answer are judged one by one."""
+        answers = self.parse_answers(response)
+        for index, article in enumerate(self.articles, start=1):
+            if index in answers:
+                accepted, reason = answers[index]
+                save_proof(
+                    self.request,
+                    article,
+                    accepted=accepted,
+                    reason=reason,
+                    query=self.query,
+                )
+            else:
+                yield GenerateFeedTask(
+                    request=self.request,
+                    article=article,
+                    priority=self.priority,
+                    query=self.query,
+                )
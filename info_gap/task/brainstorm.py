@@ -1,94 +1,241 @@
 """Task for brainstorming search query."""
 
-from typing import Iterable
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence
 import re
+from pydantic import BaseModel
 from info_gap.error import ValidationError
 from info_gap.task.base_task import BaseTask
-from info_gap.task.completion_task import CompletionTask
+from info_gap.task.completion_task import CompletionTask, json_instruction
 from info_gap.task.search import SearchTask
-from info_gap.model import Request, Search
-from info_gap.config import LOG_PATH, QUERY_RULE
+from info_gap.model import QueryRecord, Request, Search, Searches
+from info_gap.config import (
+    BANDIT_ARMS,
+    BRAINSTORM_QUERIES,
+    BRAINSTORM_SAMPLES,
+    QUERY_OVERLAP_DEMOTION,
+    QUERY_RULE,
+    QUERY_SIMILARITY,
+    YIELD_THRESHOLD,
+)
 from info_gap.deduplicate import dedup_query
+from info_gap.context import get_context
+from info_gap.query import canonical_query
+from info_gap.sink import get_sink
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+# Example requests and their queries, the first ones are shown
+EXAMPLES = (
+    (
+        "quantum computing",
+        (
+            '"quantum compute" OR "quantum computing"',
+            '"quantum algorithm"',
+            '"quantum circuit" AND "simulation"',
+        ),
+    ),
+    (
+        "COVID-19",
+        ('"COVID-19" AND "virus"', '"SARS-CoV-2"', '"pandemic" AND "epidemiology"'),
+    ),
+    (
+        "RLHF in image generation",
+        (
+            '("RLHF" AND "image generation") ANDNOT "NLP"',
+            '"human feedback" AND "diffusion model"',
+            '"reward model" AND "text-to-image"',
+        ),
+    ),
+)
+
+# Format of a text reply
+REPLY_FORMAT = (
+    "Sure! I want to search with keyword `your_keyword`."
+    if BRAINSTORM_QUERIES <= 1
+    else "Sure! I want to search with keyword `your_first_keyword`, "
+    "keyword `your_second_keyword`, ..."
+)
 
 
 class BrainStormTask(CompletionTask):
-    """Task for brainstorming search query."""
+    """Task for brainstorming search query.
+
+    A new query is brainstormed once no search of the request yields enough accepted
+    articles any more. A completion may propose several queries, `BRAINSTORM_QUERIES`
+    per reply times `BRAINSTORM_SAMPLES` replies; only those unlike the queries already
+    run are searched.
+    """
 
     request: Request
 
+    produces = ("SearchTask",)
+
+    response_model = Search if BRAINSTORM_QUERIES <= 1 else Searches
+
+    # Brainstorming samples at temperature 1, a cached reply would repeat itself.
+    use_cache = False
+
     def __init__(self, request: Request):
         self.request = request
-        super().__init__(
-            name="BrainStormTask",
-            priority=32,
-            temperature=1,
-            history=[
-                {
-                    "role": "system",
-                    "content": """You are a world class arXiv search agent. Read the user request and formulate a search query.""",
-                },
-                {
-                    "role": "system",
-                    "content": f"""The rule for a search query is: '{QUERY_RULE}'""",
-                },
-                {
-                    "role": "system",
-                    "content": """Please format your reply STRICTLY as: 'Sure! I want to search with keyword `your_keyword`.'""",
-                },
-                {
-                    "role": "user",
-                    "content": "Can you find me some papers about quantum computing?",
-                },
-                {
-                    "role": "assistant",
-                    "content": """Sure! I want to search with keyword `"quantum compute" OR "quantum computing"`.""",
-                },
+        history: List["ChatCompletionMessageParam"] = [
+            {
+                "role": "system",
+                "content": """You are a world class arXiv search agent. Read the user request and formulate a search query.""",
+            },
+            {
+                "role": "system",
+                "content": f"""The rule for a search query is: '{QUERY_RULE}'""",
+            },
+            {
+                "role": "system",
+                "content": self.instruction(),
+            },
+        ]
+        for topic, queries in EXAMPLES:
+            history.append(
                 {
                     "role": "user",
-                    "content": "Can you find me some papers about COVID-19?",
-                },
-                {
-                    "role": "assistant",
-                    "content": """Sure! I want to search with keyword `"COVID-19" AND "virus"`.""",
-                },
-                {
-                    "role": "user",
-                    "content": "Can you find me some papers about RLHF in image generation?",
-                },
-                {
-                    "role": "assistant",
-                    "content": """Sure! I want to search with keyword `("RLHF" AND "image generation") ANDNOT "NLP"`.""",
-                },
-                {
-                    "role": "user",
-                    "content": f"""Can you find me some papers {self.request.this_paper_should_be}?""",
-                },
+                    "content": f"Can you find me some papers about {topic}?",
+                }
+            )
+            history.append(
                 {
                     "role": "assistant",
-                    "content": """Sure! I want to """,
-                },
-            ],
+                    "content": self.reply(queries[:BRAINSTORM_QUERIES]),
+                }
+            )
+        history.append(
+            {
+                "role": "user",
+                "content": f"""Can you find me some papers {self.request.this_paper_should_be}?""",
+            }
         )
+        if not self.structured:
+            # Start the reply for the model, a JSON reply is constrained already
+            history.append({"role": "assistant", "content": "Sure! I want to "})
+        super().__init__(
+            name=f"BrainStormTask({request.name})",
+            priority=32,
+            temperature=1,
+            history=history,
+        )
+
+    def instruction(self) -> str:
+        """Instruction on the number and format of the queries in a reply."""
+        if self.structured:
+            assert self.response_model is not None
+            instruction = json_instruction(self.response_model)
+        else:
+            instruction = f"""Please format your reply STRICTLY as: '{REPLY_FORMAT}'"""
+        if BRAINSTORM_QUERIES > 1:
+            instruction += f" Suggest {BRAINSTORM_QUERIES} different queries."
+        return instruction
+
+    def reply(self, queries: Sequence[str]) -> str:
+        """Reply searching with queries, in the format asked."""
+        if self.structured and BRAINSTORM_QUERIES <= 1:
+            return Search(query=queries[0]).model_dump_json()
+        if self.structured:
+            return Searches(queries=list(queries)).model_dump_json()
+        keywords = ", ".join(f"keyword `{query}`" for query in queries)
+        return f"""Sure! I want to search with {keywords}."""
+
+    @property
+    def samples(self) -> int:
+        """Replies sampled per completion, a JSON reply has to be parsed alone."""
+        return 1 if self.structured else BRAINSTORM_SAMPLES
+
+    def dump(self) -> Dict[str, Any]:
+        """Serializable state of the task."""
+        return {"request": self.request, "priority": self.priority}
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "BrainStormTask":
+        """Restore a task from the state returned by `dump`."""
+        task = cls(request=state["request"])
+        task.priority = state["priority"]
+        return task
 
     def parse_response(self, response: str) -> Iterable["BaseTask"]:
         """Parse the response."""
-        pattern = r"search with keyword `(.+?)`"
-        match = re.search(pattern, response)
-        if match:
-            query = match.group(1)
-            search = Search(query=query)
-            if dedup_query(search.query):
-                with open(f"{LOG_PATH}/query.txt", "a", encoding="UTF-8") as f:
-                    f.write(search.model_dump_json(indent=2) + "\n")
-
-                # For every 4 articles searched, we brainstorm a new search query.
-                self.priority -= 4
-                yield SearchTask(request=self.request, search=search)
+        pattern = r"keyword `(.+?)`"
+        queries = re.findall(pattern, response)
+        if not queries:
+            raise ValidationError(f"""Pattern '{pattern}' is not found in the reply.""")
+        yield from self.start_searches(queries)
+
+    def parse_output(self, output: BaseModel) -> Iterable["BaseTask"]:
+        """Start the searches of the queries in a JSON reply."""
+        if isinstance(output, Searches):
+            yield from self.start_searches(output.queries)
         else:
-            raise ValidationError(
-                f"""Pattern '{pattern}' is not found in your response '{response}'."""
+            assert isinstance(output, Search)
+            yield from self.start_searches([output.query])
+
+    def start_searches(self, queries: List[str]) -> Iterable["BaseTask"]:
+        """Start the searches of new queries, dropping the duplicates and, when a
+        completion proposes several queries, those too similar to a query already run.
+        """
+        valid, errors = [], []
+        for query in queries:
+            try:
+                canonical_query(query)
+                valid.append(query)
+            except ValidationError as e:
+                errors.append(e)
+        if not valid:
+            # Nothing can be searched, ask for a repair of the reply
+            raise errors[0] if errors else ValidationError("The reply has no query.")
+
+        history = get_context().query_history
+        # Several queries per completion tend to repeat each other, a single one is
+        # only demoted by the overlap with past queries
+        diverse = BRAINSTORM_QUERIES * self.samples > 1
+        unique = 0
+        for query in valid:
+            # Checked first, a dropped query is not recorded as run
+            if (
+                diverse
+                and history.similarity(query, self.request.name) >= QUERY_SIMILARITY
+            ):
+                continue
+            if not dedup_query(query, self.request.name):
+                continue
+            unique += 1
+            get_sink(f"{self.request.name}/query").write(
+                QueryRecord(
+                    query=query,
+                    canonical=canonical_query(query),
+                    timestamp=datetime.now(timezone.utc),
+                )
             )
 
+            # Demote the search if past queries already cover its keywords
+            demotion = round(
+                history.overlap(query, self.request.name) * QUERY_OVERLAP_DEMOTION
+            )
+            history.add(query, self.request.name)
+            yield from SearchTask.start(self.request, Search(query=query), demotion)
+        get_context().metrics.record_queries(type(self).__name__, len(queries), unique)
+
+    def reply_format(self) -> Optional[str]:
+        """Format of a reply."""
+        return f"""Reply STRICTLY as: '{REPLY_FORMAT}'"""
+
+    def waiting(self) -> bool:
+        """Wait while a search of the request still yields accepted articles."""
+        context = get_context()
+        yielding = sum(
+            context.query_bandit.rate(key, self.request.name) >= YIELD_THRESHOLD
+            for key, search in context.active_searches.items()
+            if any(request.name == self.request.name for request in search.requests)
+        )
+        return yielding >= BANDIT_ARMS
+
     def after_run(self) -> Iterable[BaseTask]:
         """After run, add another brainstorm as subtask."""
         yield self
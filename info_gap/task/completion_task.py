@@ -1,54 +1,448 @@
 """Module for base class."""
 
+import json
 import logging
-from typing import Iterable, List, Optional
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from info_gap.config import LLM_OPENAI, MODEL
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    ClassVar,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+import pydantic
+from info_gap.config import FAST_REJECT_CHARS, REPAIR_ATTEMPTS, STRUCTURED_OUTPUT
+from info_gap.context import get_context
+from info_gap.error import ValidationError
+from info_gap.ratelimit import get_rate_limiter, track
 from info_gap.task.base_task import BaseTask
 
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+    from openai.types.completion_usage import CompletionUsage
+
+
+# Rough number of characters per token, until the endpoint reports prompt tokens
+CHARS_PER_TOKEN = 4
+
+
+def prompt_chars(messages: List["ChatCompletionMessageParam"]) -> int:
+    """Number of characters in the contents of a conversation."""
+    return sum(len(str(message.get("content") or "")) for message in messages)
+
+
+class PromptTokens:
+    """Tokens per character of prompts, learned from the usage of completions, to
+    estimate the prompt tokens of a stream cut before its usage is sent."""
+
+    def __init__(self):
+        self.chars = 0
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def observe(self, messages: List["ChatCompletionMessageParam"], tokens: int):
+        """Record the prompt tokens reported for a conversation."""
+        with self.lock:
+            self.chars += prompt_chars(messages)
+            self.tokens += tokens
+
+    def estimate(self, messages: List["ChatCompletionMessageParam"]) -> int:
+        """Estimated prompt tokens of a conversation."""
+        with self.lock:
+            ratio = self.tokens / self.chars if self.chars else 1 / CHARS_PER_TOKEN
+        return round(prompt_chars(messages) * ratio)
+
+
+def json_instruction(model: Type[pydantic.BaseModel]) -> str:
+    """Instruction to reply with a JSON object of a model."""
+    schema = json.dumps(model.model_json_schema(), separators=(",", ":"))
+    return f"Reply with a JSON object only, following this JSON schema: {schema}"
+
+
+def brief(error: pydantic.ValidationError) -> str:
+    """Short description of the first problems of a reply that fails validation."""
+    return "; ".join(
+        f"{'.'.join(map(str, problem['loc'])) or 'reply'}: {problem['msg']}"
+        for problem in error.errors()[:3]
+    )
+
+
+class StreamedReply:
+    """Reply accumulated from the chunks of a streamed completion."""
+
+    def __init__(self):
+        self.content = ""
+        self.chunks = 0
+        self.usage: Optional["CompletionUsage"] = None
+        self.stopped = False
+
+    def add(
+        self, chunk: "ChatCompletionChunk", stop_early: Callable[[str], bool]
+    ) -> bool:
+        """Add a chunk, return whether `stop_early` finds the reply decided."""
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return False
+        self.content += chunk.choices[0].delta.content
+        self.chunks += 1
+        self.stopped = stop_early(self.content)
+        return self.stopped
+
+    def record(self, task_class: str, messages: List["ChatCompletionMessageParam"]):
+        """Record the tokens of the reply; usage is only sent at the end of a stream,
+        so a reply cut short counts a token per chunk and estimates the prompt."""
+        context = get_context()
+        if self.stopped:
+            context.metrics.record_early_stop(task_class)
+        if self.usage is not None:
+            context.prompt_tokens.observe(messages, self.usage.prompt_tokens)
+            context.metrics.record_tokens(
+                task_class, self.usage.prompt_tokens, self.usage.completion_tokens
+            )
+        else:
+            context.metrics.record_tokens(
+                task_class, context.prompt_tokens.estimate(messages), self.chunks
+            )
+
 
 class CompletionTask(BaseTask):
-    """Base class for all completion tasks."""
+    """Base class for all completion tasks.
+
+    A reply is parsed from text by `parse_response`, or, in structured output mode, is
+    a JSON object of `response_model` handled by `parse_output`. A reply that cannot
+    be parsed is sent back alone with the error, without the prompt, to be rewritten
+    up to `REPAIR_ATTEMPTS` times.
 
-    history: List[ChatCompletionMessageParam]
+    A task may stream its replies, and stop a stream as soon as `stop_early` finds the
+    partial reply decided.
+    """
+
+    history: Sequence["ChatCompletionMessageParam"]
     temperature: float
 
+    resource = "llm"
+
+    # Whether completions may be served from the cache, opt out for non-deterministic tasks.
+    use_cache: bool = True
+
+    # Model of the reply in structured output mode, `None` if the task only parses text.
+    response_model: ClassVar[Optional[Type[pydantic.BaseModel]]] = None
+
     def __init__(  # pylint: disable=too-many-arguments
         self,
         name: str,
         priority: int,
         temperature: float,
-        history: Optional[List[ChatCompletionMessageParam]] = None,
+        history: Sequence["ChatCompletionMessageParam"] = (),
     ):
         super().__init__(name, priority)
-        self.history = history or []
+        self.history = history
         self.temperature = temperature
 
+    def messages(self) -> List["ChatCompletionMessageParam"]:
+        """Messages of the completion, assembled when the task runs so queued tasks
+        do not hold their own copy of shared prompts."""
+        return list(self.history)
+
+    @property
+    def structured(self) -> bool:
+        """Whether replies are JSON objects of `response_model`."""
+        return STRUCTURED_OUTPUT and self.response_model is not None
+
     def parse_response(self, _: str) -> Iterable["BaseTask"]:
         """Parse the response."""
         raise NotImplementedError
 
+    def parse_output(self, _: pydantic.BaseModel) -> Iterable["BaseTask"]:
+        """Handle a reply of `response_model` in structured output mode."""
+        raise NotImplementedError
+
+    def reply_format(self) -> Optional[str]:
+        """Format of a text reply, to repair replies; `None` disables repairs."""
+        return None
+
+    @property
+    def samples(self) -> int:
+        """Replies sampled per completion, joined by newlines in one response."""
+        return 1
+
+    @property
+    def streaming(self) -> bool:
+        """Whether replies are streamed, to be stopped once `stop_early` decides."""
+        return False
+
+    def stop_early(self, _: str) -> bool:
+        """Whether a partial reply is enough to parse, stopping the stream."""
+        return False
+
     def after_run(self) -> Iterable["BaseTask"]:
         """Task to run after self is done."""
         yield from []
 
+    def parse(self, response: str) -> List[BaseTask]:
+        """Parse a reply into subtasks, raise `ValidationError` if it is malformed."""
+        if not self.structured:
+            return list(self.parse_response(response))
+        assert self.response_model is not None
+        # Tolerate text or code fences around the object
+        start, end = response.find("{"), response.rfind("}")
+        try:
+            output = self.response_model.model_validate_json(
+                response[start : end + 1] if 0 <= start < end else response
+            )
+        except pydantic.ValidationError as e:
+            raise ValidationError(f"Invalid JSON reply: {brief(e)}") from e
+        return list(self.parse_output(output))
+
+    def repair_messages(
+        self, response: str, error: ValidationError
+    ) -> Optional[List["ChatCompletionMessageParam"]]:
+        """Short conversation asking to rewrite a malformed reply, `None` if the reply
+        cannot be repaired."""
+        if self.structured:
+            assert self.response_model is not None
+            reply_format: Optional[str] = json_instruction(self.response_model)
+        else:
+            reply_format = self.reply_format()
+        if reply_format is None:
+            return None
+        return [
+            {
+                "role": "system",
+                "content": f"""Rewrite the reply below to fix the error, keeping its content. {reply_format}""",
+            },
+            {
+                "role": "user",
+                "content": f"""Reply: {response}\nError: {error.message}""",
+            },
+        ]
+
+    def _repairs(
+        self, response: str
+    ) -> Generator[List["ChatCompletionMessageParam"], str, List[BaseTask]]:
+        """Parse a reply, yielding the messages of each repair completion it needs and
+        receiving its reply, until one parses."""
+        task_class = type(self).__name__
+        metrics = get_context().metrics
+        try:
+            subtasks = self.parse(response)
+            metrics.record_parse(task_class, failed=False)
+            return subtasks
+        except ValidationError as e:
+            error = e
+        metrics.record_parse(task_class, failed=True)
+        for _ in range(REPAIR_ATTEMPTS):
+            messages = self.repair_messages(response, error)
+            if messages is None:
+                break
+            response = yield messages
+            try:
+                subtasks = self.parse(response)
+                metrics.record_repair(task_class)
+                return subtasks
+            except ValidationError as e:
+                error = e
+        raise error
+
+    def parse_with_repair(self, response: str) -> List[BaseTask]:
+        """Parse a reply, repairing it if it is malformed."""
+        repairs = self._repairs(response)
+        try:
+            messages = next(repairs)
+            while True:
+                messages = repairs.send(self._complete(messages, repair=True))
+        except StopIteration as stop:
+            return stop.value
+
+    async def aparse_with_repair(self, response: str) -> List[BaseTask]:
+        """Asynchronous version of `parse_with_repair`."""
+        repairs = self._repairs(response)
+        try:
+            messages = next(repairs)
+            while True:
+                messages = repairs.send(await self._acomplete(messages, repair=True))
+        except StopIteration as stop:
+            return stop.value
+
     def run(self) -> Iterable[BaseTask]:
         """Implemented by running completion. You no longer need to override this method."""
         try:
-            history: List[ChatCompletionMessageParam] = self.history.copy()
-            completion = self._complete(history)
-            result = self.parse_response(completion)
-            yield from result
+            completion = self._complete(self.messages())
+            yield from self.parse_with_repair(completion)
         finally:
             yield from self.after_run()
 
-    def _complete(self, messages: List[ChatCompletionMessageParam]) -> str:
-        """Run the completion with given history."""
+    async def arun(self) -> AsyncIterator[BaseTask]:
+        """Asynchronous version of `run`, the completion does not block the event loop."""
+        try:
+            completion = await self._acomplete(self.messages())
+            for subtask in await self.aparse_with_repair(completion):
+                yield subtask
+        finally:
+            for subtask in self.after_run():
+                yield subtask
+
+    def _cache_key(
+        self,
+        messages: List["ChatCompletionMessageParam"],
+        temperature: float,
+        streamed: bool,
+    ) -> Optional[str]:
+        """Key of the completion in the cache, `None` if it should not be cached."""
+        context = get_context()
+        if context.completion_cache is None or not self.use_cache:
+            return None
+        # A streamed reply may be cut short, its key includes where
+        return context.completion_cache.key(
+            context.model,
+            messages,
+            temperature,
+            FAST_REJECT_CHARS if streamed else None,
+        )
+
+    def _cached(
+        self, messages: List["ChatCompletionMessageParam"], repair: bool
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Key of a completion in the cache, and its cached reply if any."""
         logging.debug("REQUEST: %s", messages)
-        result = LLM_OPENAI.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=self.temperature,
+        cache = get_context().completion_cache
+        temperature = 0 if repair else self.temperature
+        key = self._cache_key(messages, temperature, self.streaming and not repair)
+        cached = cache.get(key) if cache and key else None
+        if cached is not None:
+            logging.debug("CACHED RESPONSE: %s", cached)
+        return key, cached
+
+    def _store(self, key: Optional[str], content: str) -> str:
+        """Cache the reply of a completion and return it."""
+        logging.debug("RESPONSE: %s", content)
+        cache = get_context().completion_cache
+        if cache and key:
+            cache.put(key, content)
+        return content
+
+    def _arguments(
+        self, messages: List["ChatCompletionMessageParam"], repair: bool, stream: bool
+    ) -> Dict[str, Any]:
+        """Arguments of a completion request, deterministic for repairs."""
+        arguments: Dict[str, Any] = {
+            "model": get_context().model,
+            "messages": messages,
+            "temperature": 0 if repair else self.temperature,
+        }
+        if stream:
+            arguments.update(stream=True, stream_options={"include_usage": True})
+        else:
+            arguments.update(self._response_format())
+        return arguments
+
+    def _complete(
+        self, messages: List["ChatCompletionMessageParam"], repair: bool = False
+    ) -> str:
+        """Run the completion with given history, deterministically for repairs."""
+        key, cached = self._cached(messages, repair)
+        if cached is not None:
+            return cached
+        get_rate_limiter(self.resource).acquire()
+        with track(self.resource) as call:
+            if self.streaming and not repair:
+                content = self._stream(messages)
+            else:
+                result = get_context().openai.chat.completions.create(
+                    **self._arguments(messages, repair, stream=False)
+                )
+                content = self._record(messages, result, repair)
+            # Latency grows with the reply, the limiter compares replies of a similar size
+            call.units = len(content) / CHARS_PER_TOKEN
+        return self._store(key, content)
+
+    async def _acomplete(
+        self, messages: List["ChatCompletionMessageParam"], repair: bool = False
+    ) -> str:
+        """Run the completion with given history asynchronously."""
+        key, cached = self._cached(messages, repair)
+        if cached is not None:
+            return cached
+        await get_rate_limiter(self.resource).aacquire()
+        with track(self.resource) as call:
+            if self.streaming and not repair:
+                content = await self._astream(messages)
+            else:
+                result = await get_context().async_openai.chat.completions.create(
+                    **self._arguments(messages, repair, stream=False)
+                )
+                content = self._record(messages, result, repair)
+            call.units = len(content) / CHARS_PER_TOKEN
+        return self._store(key, content)
+
+    def _record(
+        self,
+        messages: List["ChatCompletionMessageParam"],
+        result: "ChatCompletion",
+        repair: bool,
+    ) -> str:
+        """Record the tokens of a completion and return its content."""
+        content = "\n".join(choice.message.content or "" for choice in result.choices)
+        if result.usage is not None:
+            context = get_context()
+            context.prompt_tokens.observe(messages, result.usage.prompt_tokens)
+            context.metrics.record_tokens(
+                type(self).__name__,
+                result.usage.prompt_tokens,
+                result.usage.completion_tokens,
+                repair=repair,
+            )
+        return content
+
+    def _stream(self, messages: List["ChatCompletionMessageParam"]) -> str:
+        """Stream a reply until `stop_early` decides it."""
+        stream = get_context().openai.chat.completions.create(
+            **self._arguments(messages, repair=False, stream=True)
         )
-        logging.debug("RESPONSE: %s", result.choices[0].message.content)
-        return result.choices[0].message.content or ""
+        reply = StreamedReply()
+        try:
+            for chunk in stream:
+                if reply.add(chunk, self.stop_early):
+                    break
+        finally:
+            # Closing the connection stops the generation on the endpoint
+            stream.close()
+        reply.record(type(self).__name__, messages)
+        return reply.content
+
+    async def _astream(self, messages: List["ChatCompletionMessageParam"]) -> str:
+        """Asynchronous version of `_stream`."""
+        stream = await get_context().async_openai.chat.completions.create(
+            **self._arguments(messages, repair=False, stream=True)
+        )
+        reply = StreamedReply()
+        try:
+            async for chunk in stream:
+                if reply.add(chunk, self.stop_early):
+                    break
+        finally:
+            await stream.close()
+        reply.record(type(self).__name__, messages)
+        return reply.content
+
+    def _response_format(self) -> Dict[str, Any]:
+        """Extra arguments of a completion, JSON mode for structured outputs and the
+        number of replies sampled."""
+        arguments: Dict[str, Any] = {}
+        if self.structured:
+            arguments["response_format"] = {"type": "json_object"}
+        if self.samples > 1:
+            arguments["n"] = self.samples
+        return arguments
@@ -1,74 +1,177 @@
 """Task for generating feed card."""
 
-from typing import Iterable
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 import re
-import arxiv  # type: ignore
-from info_gap.config import LOG_PATH
+from pydantic import BaseModel
+from info_gap.article import Article
+from info_gap.config import FAST_REJECT, FAST_REJECT_CHARS
+from info_gap.context import get_context
+from info_gap.deduplicate import judged_articles
 from info_gap.error import ValidationError
-from info_gap.model import Proof, Request
+from info_gap.model import ArticleRecord, Proof, Request
+from info_gap.sink import get_sink
 from info_gap.task.base_task import BaseTask
-from info_gap.task.completion_task import CompletionTask
+from info_gap.task.completion_task import CompletionTask, json_instruction
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+
+def feed_prompt(
+    request: Request, structured: bool = False
+) -> Tuple["ChatCompletionMessageParam", ...]:
+    """System prompts and examples shared by all feed tasks of a request, asking
+    for JSON replies in structured output mode.
+
+    The messages are built once per request and shared by its tasks, do not modify
+    them.
+    """
+    prompts = get_context().feed_prompts
+    key = (request.name, structured)
+    if key in prompts:
+        return prompts[key]
+    if structured:
+        reply_format = f"""If true, the reason is: '{request.accepted_reason_format}' Otherwise, the reason is: '{request.unaccepted_reason_format}' {json_instruction(Proof)}"""
+    else:
+        reply_format = f"""If true, please format your reply as: 'Yes! {request.accepted_reason_format}' Otherwise, please format your reply as: 'No! {request.unaccepted_reason_format}'"""
+    prompts[key] = (
+        {
+            "role": "system",
+            "content": """You are a world class arXiv paper reader. Please read the question below, and answer the question for each requested article.""",
+        },
+        {
+            "role": "system",
+            "content": f"""Is this paper {request.this_paper_should_be}? {reply_format}""",
+        },
+        # Read examples
+        *[
+            message
+            for example in request.examples
+            for message in example.to_message(structured)
+        ],
+    )
+    return prompts[key]
+
+
+def save_proof(
+    request: Request,
+    article: Article,
+    accepted: bool,
+    reason: str,
+    query: Optional[str],
+):
+    """Save the reason why an article is relevant to a request or not."""
+    get_context().metrics.record_verdict(accepted)
+    judged_articles([article.entry_id], request.name)
+    if query is not None:
+        get_context().query_bandit.record(query, request.name, accepted)
+        get_context().watch_store.record_verdict(query, request.name, accepted)
+    record = ArticleRecord(
+        article_id=article.entry_id,
+        title=article.title,
+        verdict="accepted" if accepted else "rejected",
+        reason=reason,
+        query=query,
+        published=article.published,
+        timestamp=datetime.now(timezone.utc),
+    )
+    get_sink(f"{request.name}/{'proof' if accepted else 'anti-proof'}").write(record)
 
 
 class GenerateFeedTask(CompletionTask):
     """Task for generating feed card."""
 
     request: Request
-    article: arxiv.Result
+    article: Article
+    query: Optional[str]
+
+    response_model = Proof
 
-    def __init__(self, request: Request, article: arxiv.Result):
+    def __init__(
+        self,
+        request: Request,
+        article: Article,
+        priority: int = 100,
+        query: Optional[str] = None,
+    ):
         self.request = request
         self.article = article
+        self.query = query
         super().__init__(
             name=f"GenerateFeedTask({self.article.title})",
-            priority=100,
+            priority=priority,
             temperature=0,
-            history=[
-                {
-                    "role": "system",
-                    "content": """You are a world class arXiv paper reader. Please read the question below, and answer the question for each requested article.""",
-                },
-                {
-                    "role": "system",
-                    "content": f"""Is this paper {request.this_paper_should_be}? If true, please format your reply as: 'Yes! {request.accepted_reason_format}' Otherwise, please format your reply as: 'No! {request.unaccepted_reason_format}'""",
-                },
-                # Read examples
-                *[
-                    message
-                    for example in request.examples
-                    for message in example.to_message()
-                ],
-                {
-                    "role": "user",
-                    "content": f"""Please answer the question for this article: Title: '{article.title}' Abstract: '{article.summary}'""",
-                },
-            ],
+        )
+
+    def messages(self) -> List["ChatCompletionMessageParam"]:
+        """Prompt of the request followed by the article."""
+        return [
+            *feed_prompt(self.request, self.structured),
+            {
+                "role": "user",
+                "content": f"""Please answer the question for this article: Title: '{self.article.title}' Abstract: '{self.article.summary}'""",
+            },
+        ]
+
+    def dump(self) -> Dict[str, Any]:
+        """Serializable state of the task."""
+        return {
+            "request": self.request,
+            "article": self.article.dump(),
+            "priority": self.priority,
+            "query": self.query,
+        }
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "GenerateFeedTask":
+        """Restore a task from the state returned by `dump`."""
+        return cls(
+            request=state["request"],
+            article=Article.load(state["article"]),
+            priority=state["priority"],
+            query=state["query"],
         )
 
     def parse_response(self, response: str) -> Iterable["BaseTask"]:
         """Parse the response."""
-        pattern = r"Yes! (.+)"
-        match = re.match(pattern, response)
-
-        # Attempt to match `Yes!` first
-        if match:
-            reason = match.group(1)
-            proof = Proof(reason=reason, title=self.article.title)
-            with open(f"{LOG_PATH}/proof.txt", "a", encoding="UTF-8") as f:
-                f.write(f"{proof.model_dump_json(indent=2)}\n\n")
-            yield from []
-        else:
-            pattern = r"No! (.+)"
+        # Attempt to match `Yes!` first, if not, attempt to match `No!`
+        for accepted, pattern in ((True, r"Yes! (.+)"), (False, r"No! (.+)")):
             match = re.match(pattern, response)
-
-            # If not, attempt to match `No!`
             if match:
-                reason = match.group(1)
-                proof = Proof(reason=reason, title=self.article.title)
-                with open(f"{LOG_PATH}/anti-proof.txt", "a", encoding="UTF-8") as f:
-                    f.write(f"{proof.model_dump_json(indent=2)}\n\n")
-                yield from []
-            else:
-                raise ValidationError(
-                    f"Your response '{response}' does not start with 'Yes!' or 'No!'."
+                yield from self.parse_output(
+                    Proof(accepted=accepted, reason=match.group(1))
                 )
+                return
+        # The reply is sent along with the error for repair, do not repeat it
+        raise ValidationError("The reply does not start with 'Yes!' or 'No!'.")
+
+    def parse_output(self, output: BaseModel) -> Iterable["BaseTask"]:
+        """Save the verdict on the article."""
+        assert isinstance(output, Proof)
+        save_proof(
+            self.request,
+            self.article,
+            accepted=output.accepted,
+            reason=output.reason,
+            query=self.query,
+        )
+        yield from []
+
+    @property
+    def streaming(self) -> bool:
+        """Stream text replies in fast reject mode, a cut JSON object would not parse."""
+        return FAST_REJECT and not self.structured
+
+    def stop_early(self, partial: str) -> bool:
+        """Stop a rejection once its reason is long enough."""
+        return (
+            partial.startswith("No! ")
+            and len(partial) >= len("No! ") + FAST_REJECT_CHARS
+        )
+
+    def reply_format(self) -> Optional[str]:
+        """Format of a reply."""
+        return f"""Reply STRICTLY as: 'Yes! {self.request.accepted_reason_format}' or 'No! {self.request.unaccepted_reason_format}'"""
@@ -1,52 +1,392 @@
 """Task for running search query."""
 
-from typing import Iterable, Generator, Optional
+import asyncio
+from datetime import datetime, timezone
+import itertools
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 import arxiv  # type: ignore
-from info_gap.model import Request, Search
+from info_gap.article import Article
+from info_gap.model import ArticleRecord, Request, Search
+from info_gap.prefetch import Prefetcher
 from info_gap.task.base_task import BaseTask
+from info_gap.task.batch_generate_feed import BatchGenerateFeedTask
 from info_gap.task.generate_feed import GenerateFeedTask
-from info_gap.config import LOG_PATH, ARXIV_CLIENT, MAX_RESULTS
-from info_gap.deduplicate import dedup_article
+from info_gap.config import (
+    ARXIV_PAGE_SIZE,
+    ARXIV_SNAPSHOT_LIVE,
+    BANDIT_PRIORITY_SCALE,
+    MAX_RESULTS,
+    FEED_BATCH_SIZE,
+    PREFETCH_DEPTH,
+    PRERANK_PRIORITY_SCALE,
+    PRERANK_THRESHOLD,
+    YIELD_THRESHOLD,
+)
+from info_gap.context import get_context
+from info_gap.deduplicate import dedup_articles, judged_articles
+from info_gap.query import canonical_query
+from info_gap.rank import get_ranker
+from info_gap.ratelimit import get_rate_limiter, track
+from info_gap.sink import get_sink
+
+if TYPE_CHECKING:
+    from info_gap.snapshot import ArxivSnapshot
 
 
 class SearchTask(BaseTask):
-    """Task for running search query."""
+    """Task for running search query, one page of results per run.
+
+    The next pages are prefetched in the background while the current one is judged.
+    Several requests can share a search, every page fans out to feed tasks of each.
+    The priority of the next page follows the acceptance rate of the articles found so
+    far, and a request stops paging once the rate falls below `YIELD_THRESHOLD`. A
+    search `since` a date stops at the first result submitted before it. With a local
+    snapshot of arXiv, only the results newer than the snapshot come from the API.
+    """
 
-    request: Request
+    requests: List[Request]
     search: Search
+    max_results: int
+    batch_size: int
+    offset: int
+    demotion: int
+    since: Optional[datetime]
+
+    result_iterator: Optional[Iterator[arxiv.Result]] = None
+    prefetcher: Optional[Prefetcher[arxiv.Result]] = None
 
-    result_generator: Optional[Generator[arxiv.Result, None, None]] = None
+    resource = "arxiv"
+    produces = ("GenerateFeedTask", "BatchGenerateFeedTask")
 
-    def __init__(self, request: Request, search: Search):
-        self.request = request
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        requests: List[Request],
+        search: Search,
+        max_results: int = MAX_RESULTS,
+        batch_size: int = FEED_BATCH_SIZE,
+        prefetch_depth: int = PREFETCH_DEPTH,
+        offset: int = 0,
+        demotion: int = 0,
+        since: Optional[datetime] = None,
+    ):
+        self.requests = requests
         self.search = search
-        super().__init__(name=f"SearchTask({self.search.query})", priority=36)
+        self.key = canonical_query(search.query)
+        self.max_results = max_results
+        self.batch_size = batch_size
+        self.prefetch_depth = prefetch_depth
+        self.offset = offset
+        self.demotion = demotion
+        self.since = since
+        super().__init__(
+            name=f"SearchTask({self.search.query})", priority=36 - demotion
+        )
 
-    def init_generator(self):
-        """Initialize the generator for search results."""
+    def dump(self) -> Dict[str, Any]:
+        """Serializable state of the task, including the pagination offset."""
+        return {
+            "requests": self.requests,
+            "search": self.search.model_dump(),
+            "max_results": self.max_results,
+            "batch_size": self.batch_size,
+            "offset": self.offset,
+            "demotion": self.demotion,
+            "since": self.since.isoformat() if self.since else None,
+            "priority": self.priority,
+        }
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "SearchTask":
+        """Restore a task from the state returned by `dump`.
+
+        A restored task runs a single page before it is stored again, so it fetches no
+        page ahead: nothing would consume it, nor stop the fetching thread.
+        """
+        task = cls(
+            requests=state["requests"],
+            search=Search.model_validate(state["search"]),
+            max_results=state["max_results"],
+            batch_size=state["batch_size"],
+            prefetch_depth=0,
+            offset=state["offset"],
+            demotion=state.get("demotion", 0),
+            since=(
+                datetime.fromisoformat(state["since"]) if state.get("since") else None
+            ),
+        )
+        task.priority = state["priority"]
+        return task
+
+    @classmethod
+    def start(
+        cls, request: Request, search: Search, demotion: int = 0
+    ) -> Iterable["SearchTask"]:
+        """Search for a request, joining an active search of the same query if any.
+
+        A request joining late gets a search of the pages it missed, which are served
+        from the arXiv cache.
+        """
+        key = canonical_query(search.query)
+        if not get_context().share_searches:
+            yield cls(requests=[request], search=search, demotion=demotion)
+            return
+        active_searches = get_context().active_searches
+        active = active_searches.get(key)
+        if active is None:
+            active_searches[key] = cls(
+                requests=[request], search=search, demotion=demotion
+            )
+            yield active_searches[key]
+            return
+        active.requests.append(request)
+        if active.offset:
+            yield cls(
+                requests=[request],
+                search=search,
+                max_results=active.offset,
+                demotion=demotion,
+            )
+
+    @classmethod
+    def watch(cls, request: Request) -> Iterable["SearchTask"]:
+        """Search the known good queries of a request again, for the results newer
+        than their watermark."""
+        for watched in get_context().watch_store.queries(request.name):
+            if watched.rate >= YIELD_THRESHOLD:
+                # New results rarely fill a page, fetching ahead would be wasted
+                yield cls(
+                    requests=[request],
+                    search=Search(query=watched.query),
+                    prefetch_depth=0,
+                    since=watched.watermark,
+                )
+
+    @property
+    def owner(self) -> str:
+        """Name of the request that started the search."""
+        return self.requests[0].name
+
+    def live_results(self, offset: int) -> Iterator[arxiv.Result]:
+        """Results of the query from the arXiv API, or its cache."""
+        context = get_context()
+        if context.arxiv_cache is not None:
+            # A watched query needs the results submitted since the last refresh
+            return context.arxiv_cache.results(
+                self.search.query,
+                self.max_results,
+                offset=offset,
+                max_age=None if self.since is None else 0,
+            )
         arxiv_search = arxiv.Search(
             query=self.search.query,
-            max_results=MAX_RESULTS,
+            max_results=self.max_results,
             sort_by=arxiv.SortCriterion.SubmittedDate,
         )
-        self.result_generator = ARXIV_CLIENT.results(arxiv_search)
+        return context.arxiv.results(arxiv_search, offset=offset)
+
+    def snapshot_results(self, snapshot: "ArxivSnapshot") -> Iterator[arxiv.Result]:
+        """Results of the query from a local snapshot, preceded by the newer ones from
+        the API."""
+        newer: Iterable[arxiv.Result] = ()
+        if ARXIV_SNAPSHOT_LIVE:
+            newer = itertools.takewhile(
+                lambda result: snapshot.newest is None
+                or result.published > snapshot.newest,
+                self.live_results(offset=0),
+            )
+        return itertools.islice(
+            itertools.chain(
+                newer, snapshot.results(self.search.query, self.max_results)
+            ),
+            self.offset,
+            self.max_results,
+        )
+
+    def init_generator(self):
+        """Initialize the generator for search results and start prefetching."""
+        snapshot = get_context().arxiv_snapshot
+        if snapshot is not None and self.since is None:
+            self.result_iterator = self.snapshot_results(snapshot)
+        else:
+            self.result_iterator = self.live_results(offset=self.offset)
+        self.prefetcher = Prefetcher(
+            self.fetch_page, page_size=ARXIV_PAGE_SIZE, depth=self.prefetch_depth
+        )
+
+    def fetch_page(self) -> List[arxiv.Result]:
+        """Fetch the next page of search results, a short page is the last one."""
+        assert self.result_iterator is not None
+        get_rate_limiter(self.resource).acquire()
+        started = time.monotonic()
+        # Pages may come from the arXiv cache, only errors tell about the endpoint
+        with track(self.resource, latency=False):
+            page = list(itertools.islice(self.result_iterator, ARXIV_PAGE_SIZE))
+        get_context().metrics.record_fetch(
+            type(self).__name__, time.monotonic() - started
+        )
+        return page
+
+    def next_page(self) -> List[arxiv.Result]:
+        """Get the next page of search results from the prefetcher."""
+        if self.prefetcher is None:
+            self.init_generator()
+            assert self.prefetcher is not None
+        try:
+            return self.prefetcher.next_page()
+        except Exception:
+            self.finish()
+            raise
+
+    def finish(self):
+        """Stop prefetching, and let later searches of the query start afresh."""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            # A retry resumes from the offset of the last page handled
+            self.prefetcher = None
+        active_searches = get_context().active_searches
+        if active_searches.get(self.key) is self:
+            del active_searches[self.key]
 
     def run(self) -> Iterable["BaseTask"]:
         """Run the task, return subtasks it generates."""
-        if self.result_generator is None:
-            # Initialize the generator if it is None
-            self.init_generator()
-            assert self.result_generator is not None
+        page = self.next_page()
+        try:
+            yield from self.handle_page(page)
+        except Exception:
+            self.finish()
+            raise
+
+    async def arun(self) -> AsyncIterator["BaseTask"]:
+        """Asynchronous version of `run`, waiting for the page in a worker thread."""
+        page = await asyncio.to_thread(self.next_page)
         try:
-            # Search and deduplicate the articles
-            result = next(self.result_generator)
-            if dedup_article(result.entry_id):
-                with open(f"{LOG_PATH}/article.txt", "a", encoding="UTF-8") as f:
-                    f.write(result.title + "\n")
-                yield GenerateFeedTask(request=self.request, article=result)
-
-            # Add task "search next page" with 1 lower priority
-            self.priority -= 1
-            yield self
-        except StopIteration:
-            yield from []
+            for subtask in self.handle_page(page):
+                yield subtask
+        except Exception:
+            self.finish()
+            raise
+
+    def save_article(  # pylint: disable=too-many-arguments
+        self,
+        stream: str,
+        article: arxiv.Result,
+        verdict: Optional[str] = None,
+        reason: Optional[str] = None,
+    ):
+        """Record an article found by this search to an output stream."""
+        get_sink(stream).write(
+            ArticleRecord(
+                article_id=article.entry_id,
+                title=article.title,
+                verdict=verdict,
+                reason=reason,
+                query=self.search.query,
+                published=article.published,
+                timestamp=datetime.now(timezone.utc),
+            )
+        )
+
+    def rank(
+        self, request: Request, articles: List[arxiv.Result]
+    ) -> List[Tuple[float, arxiv.Result]]:
+        """Score articles by lexical relevance to a request, best first, pruning those
+        below the threshold."""
+        scores = get_ranker(request).score(
+            [f"{article.title} {article.summary}" for article in articles]
+        )
+        ranked = sorted(zip(scores.tolist(), articles), key=lambda pair: -pair[0])
+        if PRERANK_THRESHOLD is None:
+            return ranked
+        kept = [pair for pair in ranked if pair[0] >= PRERANK_THRESHOLD]
+        judged_articles(
+            [article.entry_id for _, article in ranked[len(kept) :]], request.name
+        )
+        for score, article in ranked[len(kept) :]:
+            self.save_article(
+                f"{request.name}/pruned",
+                article,
+                verdict="pruned",
+                reason=f"{score:.4f}",
+            )
+        return kept
+
+    def feed_tasks(
+        self, request: Request, page: List[arxiv.Result]
+    ) -> Iterable["BaseTask"]:
+        """Turn the articles of a page that are new to a request into feed tasks."""
+        is_new = dedup_articles([result.entry_id for result in page], request.name)
+        articles = [result for result, new in zip(page, is_new) if new]
+
+        # Pre-rank the articles, likely hits are judged first and obvious misses never
+        ranked = self.rank(request, articles)
+
+        # Judge the articles one by one, or in batches of similar scores
+        for start in range(0, len(ranked), max(1, self.batch_size)):
+            chunk = ranked[start : start + max(1, self.batch_size)]
+            priority = 100 + round(chunk[0][0] * PRERANK_PRIORITY_SCALE)
+            if self.batch_size <= 1:
+                yield GenerateFeedTask(
+                    request=request,
+                    article=Article.from_result(chunk[0][1]),
+                    priority=priority,
+                    query=self.search.query,
+                )
+            else:
+                yield BatchGenerateFeedTask(
+                    request=request,
+                    articles=[Article.from_result(article) for _, article in chunk],
+                    priority=priority,
+                    query=self.search.query,
+                )
+
+    def handle_page(self, page: List[arxiv.Result]) -> Iterable["BaseTask"]:
+        """Turn a page of search results into subtasks for every request."""
+        self.offset += len(page)
+        if self.since is not None:
+            # Results are sorted by submitted date, the older ones were seen already
+            page = [result for result in page if result.published > self.since]
+        if page:
+            newest = max(result.published for result in page)
+            for request in self.requests:
+                get_context().watch_store.advance(
+                    self.search.query, request.name, newest
+                )
+
+        # Record the articles fetched for the first time
+        is_new = dedup_articles([result.entry_id for result in page])
+        for article, new in zip(page, is_new):
+            if new:
+                self.save_article("article", article)
+
+        for request in self.requests:
+            yield from self.feed_tasks(request, page)
+
+        # Requests stop paging once the query yields too few accepted articles
+        bandit = get_context().query_bandit
+        self.requests = [
+            request
+            for request in self.requests
+            if bandit.rate(self.key, request.name) >= YIELD_THRESHOLD
+        ]
+        if len(page) < ARXIV_PAGE_SIZE or not self.requests:
+            # The search is exhausted, or reached the results seen already
+            self.finish()
+            return
+
+        # Add task "search next page", ranked by the best bound of its acceptance rate
+        bound = max(
+            bandit.upper_bound(self.key, request.name) for request in self.requests
+        )
+        self.priority = 36 - self.demotion - round((1 - bound) * BANDIT_PRIORITY_SCALE)
+        yield self
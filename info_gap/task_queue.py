@@ -0,0 +1,142 @@
+"""Heap-backed ready queue of tasks."""
+
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from info_gap.config import MAX_BACKLOG
+from info_gap.task.base_task import BaseTask
+
+# Entry of a heap: (negated priority, insertion order, task)
+Entry = Tuple[int, int, BaseTask]
+
+
+class TaskQueue:
+    """Priority queue of tasks, stable for equal priorities.
+
+    Tasks are kept in one heap per resource and owner (request), so a scheduler can ask
+    for the best task among resources with spare capacity. The resource whose top task
+    has the highest priority is picked, then the owner that used it least, so capacity
+    is shared fairly among requests. Admission control pauses a producer while the
+    backlog of any task type it produces is at its limit, or while it is `waiting`.
+    Tasks pushed with a delay, e.g. retries, wait in a separate heap until they are due.
+    """
+
+    heaps: Dict[str, Dict[str, List[Entry]]]
+    served: Dict[str, Counter]
+    max_backlog: Dict[str, int]
+    backlog: Counter
+    paused: List[Entry]
+    delayed: List[Tuple[float, int, BaseTask]]
+
+    def __init__(self, max_backlog: Optional[Dict[str, int]] = None):
+        self.heaps = {}
+        self.served = {}
+        self.max_backlog = {**MAX_BACKLOG, **(max_backlog or {})}
+        self.backlog = Counter()
+        self.paused = []
+        self.delayed = []
+        self.counter = itertools.count()
+
+    def __len__(self) -> int:
+        return (
+            sum(len(heap) for owners in self.heaps.values() for heap in owners.values())
+            + len(self.paused)
+            + len(self.delayed)
+        )
+
+    def push(self, task: BaseTask, delay: float = 0.0):
+        """Add a task to the queue, ready to run after `delay` seconds."""
+        task.enqueued_at = time.monotonic() + delay
+        if delay > 0:
+            heapq.heappush(self.delayed, (task.enqueued_at, next(self.counter), task))
+        else:
+            self._push((-task.priority, next(self.counter), task))
+        self.backlog[type(task).__name__] += 1
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds until the next delayed task is due, `None` if there is none."""
+        if not self.delayed:
+            return None
+        return max(0.0, self.delayed[0][0] - time.monotonic())
+
+    def _push(self, entry: Entry):
+        task = entry[2]
+        owners = self.heaps.setdefault(task.resource, {})
+        heap = owners.setdefault(task.owner, [])
+        if not heap:
+            # An owner coming back from idle gets no credit for the time it was idle
+            served = self.served.setdefault(task.resource, Counter())
+            busy = [served[owner] for owner, other in owners.items() if other]
+            served[task.owner] = max(served[task.owner], min(busy, default=0))
+        heapq.heappush(heap, entry)
+
+    def is_paused(self, task: BaseTask) -> bool:
+        """Whether the task waits for its own condition, or produces a type of task
+        whose backlog is full."""
+        return task.waiting() or any(
+            self.backlog[produced] >= self.max_backlog.get(produced, float("inf"))
+            for produced in task.produces
+        )
+
+    def _resume(self):
+        """Move due tasks, and paused producers once consumers caught up, back to the
+        heaps."""
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self.delayed)
+            self._push((-task.priority, next(self.counter), task))
+        if not self.paused:
+            return
+        paused, self.paused = self.paused, []
+        for entry in paused:
+            if self.is_paused(entry[2]):
+                self.paused.append(entry)
+            else:
+                self._push(entry)
+
+    def _best_heap(
+        self, resources: Optional[Iterable[str]]
+    ) -> Optional[Tuple[str, str, List[Entry]]]:
+        """Find the resource whose top entry comes first, then its least served owner."""
+        candidates = {
+            resource: {owner: heap for owner, heap in owners.items() if heap}
+            for resource, owners in self.heaps.items()
+            if resources is None or resource in resources
+        }
+        candidates = {
+            resource: heaps for resource, heaps in candidates.items() if heaps
+        }
+        if not candidates:
+            return None
+        resource = min(
+            candidates,
+            key=lambda r: min(heap[0][:2] for heap in candidates[r].values()),
+        )
+        served = self.served[resource]
+        owner = min(
+            candidates[resource],
+            key=lambda o: (served[o], candidates[resource][o][0][:2]),
+        )
+        return resource, owner, candidates[resource][owner]
+
+    def pop(self, resources: Optional[Iterable[str]] = None) -> Optional[BaseTask]:
+        """Pop the task of highest priority, optionally among given resources only."""
+        self._resume()
+        if resources is not None:
+            resources = set(resources)
+        while (best := self._best_heap(resources)) is not None:
+            resource, owner, heap = best
+            entry = heapq.heappop(heap)
+            _, order, task = entry
+            if -entry[0] != task.priority:
+                # Priority changed while queued, re-insert with the same order
+                self._push((-task.priority, order, task))
+            elif self.is_paused(task):
+                self.paused.append(entry)
+            else:
+                self.backlog[type(task).__name__] -= 1
+                self.served[resource][owner] += 1
+                return task
+        return None
@@ -0,0 +1,88 @@
+"""Queries of every request kept across runs, to watch them for new articles."""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from info_gap.query import canonical_query
+
+
+class WatchedQuery(NamedTuple):
+    """A query searched for a request, and the verdicts on the articles it found."""
+
+    query: str
+    watermark: Optional[datetime]
+    judged: int
+    accepted: int
+
+    @property
+    def rate(self) -> float:
+        """Acceptance rate, smoothed by a uniform prior as in `QueryBandit`."""
+        return (self.accepted + 1) / (self.judged + 2)
+
+
+class WatchStore:
+    """Queries searched for each request in a SQLite file, with the verdicts on their
+    articles and the submitted date of their newest result, the watermark.
+
+    Results are sorted by submitted date, so watching a query again only needs the
+    results newer than its watermark.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS watched (
+                request TEXT NOT NULL,
+                key TEXT NOT NULL,
+                query TEXT NOT NULL,
+                watermark TEXT,
+                judged INTEGER NOT NULL DEFAULT 0,
+                accepted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (request, key)
+            )""")
+
+    def advance(self, query: str, request_name: str, newest: datetime):
+        """Move the watermark of a query forward to the newest result seen."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO watched (request, key, query, watermark) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (request, key) DO UPDATE SET "
+                "watermark = MAX(COALESCE(watermark, ''), excluded.watermark)",
+                (request_name, canonical_query(query), query, newest.isoformat()),
+            )
+
+    def record_verdict(self, query: str, request_name: str, accepted: bool):
+        """Count a verdict on an article found by a query."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO watched (request, key, query, judged, accepted) "
+                "VALUES (?, ?, ?, 1, ?) ON CONFLICT (request, key) DO UPDATE SET "
+                "judged = judged + 1, accepted = accepted + excluded.accepted",
+                (request_name, canonical_query(query), query, int(accepted)),
+            )
+
+    def queries(self, request_name: str) -> List[WatchedQuery]:
+        """Queries searched for a request, best acceptance rate first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT query, watermark, judged, accepted FROM watched "
+                "WHERE request = ?",
+                (request_name,),
+            ).fetchall()
+        watched = [
+            WatchedQuery(
+                query,
+                datetime.fromisoformat(watermark) if watermark else None,
+                judged,
+                accepted,
+            )
+            for query, watermark, judged, accepted in rows
+        ]
+        return sorted(watched, key=lambda watched_query: -watched_query.rate)
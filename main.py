@@ -1,20 +1,114 @@
 """Entrypoint of program."""
 
+import argparse
+import asyncio
+import importlib
 import logging
-from examples.coding_agent import REQUEST
+import time
+from typing import List
+from info_gap.config import WATCH_INTERVAL
+from info_gap.task.base_task import BaseTask
 from info_gap.task.brainstorm import BrainStormTask
-from info_gap.scheduler import Scheduler
-from info_gap.config import LOG_PATH
+from info_gap.task.search import SearchTask
+from info_gap.durable_queue import DurableTaskQueue
+from info_gap.scheduler import AsyncScheduler, DurableScheduler, Scheduler
+from info_gap.context import RuntimeContext, get_context
 
-# Redirect debug log to file
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Search arXiv for papers of a request.")
+mode = parser.add_mutually_exclusive_group()
+mode.add_argument(
+    "--async",
+    dest="use_async",
+    action="store_true",
+    help="keep many LLM and arXiv calls in flight with the asyncio scheduler",
+)
+mode.add_argument(
+    "--queue",
+    metavar="PATH",
+    help="work on a durable task queue shared with other workers, resuming its tasks",
+)
+parser.add_argument(
+    "--request",
+    metavar="MODULE",
+    action="append",
+    dest="requests",
+    help="module defining the REQUEST to serve, repeat to serve several requests "
+    "(default: examples.coding_agent)",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="search the good queries of past runs again every WATCH_INTERVAL seconds, "
+    "for papers newer than the last ones seen",
+)
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    help="serve metrics in Prometheus text format on this localhost port",
+)
+args = parser.parse_args()
+if args.watch and args.queue:
+    parser.error("--watch cannot be used with --queue")
+
+# Redirect debug log to file, workers of a durable queue do not share searches
+context = RuntimeContext(share_searches=False) if args.queue else get_context()
 logging.basicConfig(
-    filename=f"{LOG_PATH}/debug.log",
+    filename=f"{context.log_path}/debug.log",
     level=logging.DEBUG,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
-# Run application
-brainstorm_task = BrainStormTask(request=REQUEST)
-scheduler = Scheduler()
-scheduler.add_task(brainstorm_task)
-scheduler.run()
+# Serve metrics if requested
+if args.metrics_port:
+    context.metrics.serve(args.metrics_port)
+
+# Run application, brainstorming for every request
+requests = [
+    importlib.import_module(module).REQUEST
+    for module in args.requests or ["examples.coding_agent"]
+]
+names = [request.name for request in requests]
+if len(set(names)) < len(names):
+    parser.error(f"request names must be unique, got {names}")
+
+
+def run(tasks: List[BaseTask]):
+    """Run tasks until none is left, with the scheduler chosen."""
+    if args.use_async:
+        async_scheduler = AsyncScheduler()
+        for task in tasks:
+            async_scheduler.add_task(task)
+        asyncio.run(async_scheduler.run())
+    else:
+        scheduler = Scheduler()
+        for task in tasks:
+            scheduler.add_task(task)
+        scheduler.run()
+
+
+brainstorm_tasks = [BrainStormTask(request=request) for request in requests]
+if args.watch:
+    while True:
+        search_tasks: List[BaseTask] = []
+        for request in requests:
+            watched = list(SearchTask.watch(request))
+            if not watched:
+                print(f"🙈 No good query to watch for {request.name}, crawl it first")
+            search_tasks.extend(watched)
+        run(search_tasks)
+        context.flush()
+        print(f"😴 Watching again in {WATCH_INTERVAL:.0f} seconds")
+        time.sleep(WATCH_INTERVAL)
+elif args.queue:
+    durable = DurableTaskQueue(args.queue)
+    durable_scheduler = DurableScheduler(durable, context=context)
+    if not durable:
+        for task in brainstorm_tasks:
+            durable_scheduler.add_task(task)
+    durable_scheduler.run()
+else:
+    run(brainstorm_tasks)
+
+if context.completion_cache is not None:
+    print(f"📦 Completion cache: {context.completion_cache.stats()}")
@@ -0,0 +1,128 @@
+"""Fixtures shared by the tests: a runtime context in a temporary directory, and a fake
+OpenAI endpoint replying with canned text."""
+
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List
+import pytest
+from info_gap.context import RuntimeContext
+
+
+class FakeStream:
+    """Streamed reply sent in chunks of a few characters, then the usage."""
+
+    def __init__(self, reply: str, chunk_chars: int = 4):
+        self.chunks = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))],
+                usage=None,
+            )
+            for piece in (
+                reply[start : start + chunk_chars]
+                for start in range(0, len(reply), chunk_chars)
+            )
+        ]
+        self.chunks.append(
+            SimpleNamespace(
+                choices=[],
+                usage=SimpleNamespace(prompt_tokens=10, completion_tokens=len(reply)),
+            )
+        )
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed or self.sent >= len(self.chunks):
+            raise StopIteration
+        self.sent += 1
+        return self.chunks[self.sent - 1]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self)
+        except StopIteration as e:
+            raise StopAsyncIteration from e
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncFakeStream(FakeStream):
+    """Streamed reply of the asynchronous client."""
+
+    async def close(self):  # type: ignore[override]
+        self.closed = True
+
+
+class FakeLLM:
+    """OpenAI chat completions endpoint replying with the next canned reply."""
+
+    def __init__(self):
+        self.replies: List[str] = []
+        self.requests: List[Dict[str, Any]] = []
+        self.streams: List[FakeStream] = []
+
+    def reply(self, asynchronous: bool, **kwargs):
+        self.requests.append(kwargs)
+        reply = self.replies.pop(0)
+        if kwargs.get("stream"):
+            stream = (AsyncFakeStream if asynchronous else FakeStream)(reply)
+            self.streams.append(stream)
+            return stream
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=len(reply)),
+        )
+
+    def client(self):
+        """Synchronous client."""
+        return SimpleNamespace(
+            chat=SimpleNamespace(
+                completions=SimpleNamespace(
+                    create=lambda **kwargs: self.reply(False, **kwargs)
+                )
+            )
+        )
+
+    def async_client(self):
+        """Asynchronous client."""
+
+        async def create(**kwargs):
+            return self.reply(True, **kwargs)
+
+        return SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+
+
+@pytest.fixture(name="context")
+def fixture_context(tmp_path) -> RuntimeContext:
+    return RuntimeContext(
+        openai_api_url="http://llm.test/v1",
+        completion_cache_path="",
+        arxiv_cache_path="",
+        dedup_path="",
+        watch_path="",
+        log_dir=str(tmp_path / "log"),
+    )
+
+
+@pytest.fixture(name="llm")
+def fixture_llm(context) -> FakeLLM:
+    llm = FakeLLM()
+    context.resources["openai"] = llm.client()
+    context.resources["async_openai"] = llm.async_client()
+    return llm
+
+
+def records(context: RuntimeContext, stream: str) -> List[Dict[str, Any]]:
+    """Records written to an output stream of a context."""
+    context.flush()
+    with open(context.sink(stream).path, encoding="UTF-8") as f:
+        return [json.loads(line) for line in f]
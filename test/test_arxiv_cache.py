@@ -0,0 +1,86 @@
+"""Test the cache of arXiv search results."""
+
+from datetime import datetime, timedelta, timezone
+from typing import List
+import arxiv  # type: ignore
+import pytest
+from info_gap.arxiv_cache import ArxivCache
+
+
+class FakeClient:
+    """arXiv client serving a corpus newest first, counting the pages fetched."""
+
+    def __init__(self, size: int):
+        self.corpus: List[arxiv.Result] = []
+        self.fetched: List[int] = []
+        for _ in range(size):
+            self.publish()
+
+    def publish(self):
+        index = len(self.corpus)
+        published = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=index)
+        self.corpus.insert(
+            0,
+            arxiv.Result(
+                entry_id=f"http://arxiv.org/abs/{index}",
+                title=f"Title {index}",
+                summary=f"Summary {index}",
+                published=published,
+                updated=published,
+            ),
+        )
+
+    def results(self, search: arxiv.Search, offset: int = 0):
+        self.fetched.append(offset)
+        return iter(self.corpus[offset : search.max_results])
+
+
+def ids(results) -> List[int]:
+    return [int(result.entry_id.rsplit("/", 1)[1]) for result in results]
+
+
+@pytest.fixture(name="client")
+def fixture_client() -> FakeClient:
+    return FakeClient(7)
+
+
+def test_pages(tmp_path, client):
+    path = str(tmp_path / "arxiv.sqlite3")
+    assert ids(ArxivCache(path, client, 3, 60).results("q", 10)) == list(
+        range(6, -1, -1)
+    )
+    assert client.fetched == [0, 3, 6]
+    # Served from disk, the query has no more results
+    assert ids(ArxivCache(path, client, 3, 60).results("q", 10)) == list(
+        range(6, -1, -1)
+    )
+    assert client.fetched == [0, 3, 6]
+
+
+def test_offset(tmp_path, client):
+    cache = ArxivCache(str(tmp_path / "arxiv.sqlite3"), client, 3, 60)
+    assert ids(cache.results("q", 3)) == [6, 5, 4]
+    # Resuming past the cached pages fetches the next ones only
+    assert ids(cache.results("q", 10, offset=4)) == [2, 1, 0]
+    assert client.fetched == [0, 3, 6]
+    assert ids(cache.results("q", 5, offset=1)) == [5, 4, 3, 2]
+    assert client.fetched == [0, 3, 6]
+
+
+def test_refresh(tmp_path, client):
+    cache = ArxivCache(str(tmp_path / "arxiv.sqlite3"), client, 3, 60)
+    assert ids(cache.results("q", 3)) == [6, 5, 4]
+    _, refreshed, _ = cache.load_pages("q")
+    # A deeper page does not make the newest results look fresh
+    assert ids(cache.results("q", 6, offset=3)) == [3, 2, 1]
+    assert cache.load_pages("q")[1] == refreshed
+
+    client.publish()
+    client.fetched.clear()
+    # Stale pages are refreshed with the results newer than the cached ones
+    assert ids(cache.results("q", 4, max_age=-1)) == [7, 6, 5, 4]
+    assert client.fetched == [0]
+    assert cache.load_pages("q")[1] > refreshed
+    # Deeper pages follow the refreshed ones
+    assert ids(cache.results("q", 10)) == [7, 6, 5, 4, 3, 2, 1, 0]
+    assert client.fetched == [0, 7]
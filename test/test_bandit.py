@@ -0,0 +1,75 @@
+"""Test the acceptance rate of queries and how it drives paging."""
+
+from datetime import datetime, timedelta, timezone
+import arxiv  # type: ignore
+from info_gap.bandit import QueryBandit
+from info_gap.config import ARXIV_PAGE_SIZE, YIELD_THRESHOLD
+from info_gap.model import Request, Search
+from info_gap.query import canonical_query
+from info_gap.task.search import SearchTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about language model agents",
+    accepted_reason_format="It is about ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+
+def page(size: int = ARXIV_PAGE_SIZE):
+    published = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        arxiv.Result(
+            entry_id=f"http://arxiv.org/abs/{index}",
+            title=f"Language model agents {index}",
+            summary="Agents built on language models.",
+            published=published - timedelta(days=index),
+        )
+        for index in range(size)
+    ]
+
+
+def test_rate():
+    bandit = QueryBandit()
+    key = canonical_query("agents AND llm")
+    assert bandit.rate(key, "test") == 0.5
+    # Verdicts count for the canonical query, and for one request only
+    bandit.record("llm AND agents", "test", True)
+    bandit.record("agents AND llm", "test", False)
+    bandit.record("agents AND llm", "test", True)
+    assert bandit.rate(key, "test") == 3 / 5
+    assert bandit.rate(key, "other") == 0.5
+
+
+def test_upper_bound():
+    bandit = QueryBandit(exploration=0.5)
+    for index in range(40):
+        bandit.record("explored", "test", index % 4 != 0)
+    bandit.record("new", "test", False)
+    explored, new = canonical_query("explored"), canonical_query("new")
+    # A query with few verdicts gets the benefit of the doubt
+    assert bandit.rate(new, "test") < bandit.rate(explored, "test")
+    assert bandit.upper_bound(new, "test") > bandit.upper_bound(explored, "test")
+    assert bandit.upper_bound(new, "test") == 1
+
+
+def test_paging_by_yield(context):
+    task = SearchTask([REQUEST], Search(query="agents"), prefetch_depth=0)
+    other = SearchTask([REQUEST], Search(query="robots"), prefetch_depth=0)
+    with context.use():
+        for index in range(20):
+            context.query_bandit.record("agents", REQUEST.name, True)
+            context.query_bandit.record("robots", REQUEST.name, index < 5)
+        assert list(task.handle_page(page()))[-1] is task
+        assert list(other.handle_page(page()))[-1] is other
+        # The next page of the query yielding more is searched first
+        assert task.priority > other.priority
+
+        for _ in range(300):
+            context.query_bandit.record("agents", REQUEST.name, False)
+        assert context.query_bandit.rate(task.key, REQUEST.name) < YIELD_THRESHOLD
+        subtasks = list(task.handle_page(page()))
+    # The request stopped paging a query that no longer yields
+    assert task not in subtasks
+    assert task.requests == []
@@ -0,0 +1,59 @@
+"""Test parsing the numbered answers of a batch of articles."""
+
+from datetime import datetime, timezone
+from info_gap.article import Article
+from info_gap.context import RuntimeContext
+from info_gap.model import Request
+from info_gap.task.batch_generate_feed import BatchGenerateFeedTask
+from info_gap.task.generate_feed import GenerateFeedTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about testing",
+    accepted_reason_format="It tests ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+
+def article(index: int) -> Article:
+    return Article(
+        entry_id=f"http://arxiv.org/abs/{index}",
+        title=f"Title {index}",
+        summary=f"Summary {index}",
+        published=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_parse_answers():
+    response = """1. Yes! It tests parsers.
+spanning two lines
+2) No! It is about cooking.
+3: No! It is about music."""
+    assert BatchGenerateFeedTask.parse_answers(response) == {
+        1: (True, "It tests parsers.\nspanning two lines"),
+        2: (False, "It is about cooking."),
+        3: (False, "It is about music."),
+    }
+
+
+def test_missing_answers(tmp_path):
+    context = RuntimeContext(
+        completion_cache_path="",
+        arxiv_cache_path="",
+        dedup_path="",
+        watch_path="",
+        log_dir=str(tmp_path),
+    )
+    task = BatchGenerateFeedTask(REQUEST, [article(index) for index in range(1, 5)])
+    response = (
+        "1. Yes! It tests parsers.\n3. Maybe, not sure.\n4. No! It is about music."
+    )
+    with context.use():
+        subtasks = list(task.parse_response(response))
+    # Articles without a valid answer are judged one by one
+    assert all(isinstance(subtask, GenerateFeedTask) for subtask in subtasks)
+    assert [subtask.article.entry_id for subtask in subtasks] == [
+        "http://arxiv.org/abs/2",
+        "http://arxiv.org/abs/3",
+    ]
@@ -0,0 +1,70 @@
+"""Test starting the searches of brainstormed queries."""
+
+import pytest
+from info_gap.context import RuntimeContext
+from info_gap.error import ValidationError
+from info_gap.model import Request
+from info_gap.task.brainstorm import BrainStormTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about language model agents",
+    accepted_reason_format="It is about ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+
+@pytest.fixture(name="context")
+def fixture_context(tmp_path) -> RuntimeContext:
+    return RuntimeContext(
+        completion_cache_path="",
+        arxiv_cache_path="",
+        dedup_path="",
+        watch_path="",
+        log_dir=str(tmp_path),
+    )
+
+
+def searched(context, queries):
+    with context.use():
+        return [
+            task.search.query
+            for task in BrainStormTask(REQUEST).start_searches(queries)
+        ]
+
+
+def test_duplicates(context):
+    assert searched(context, ['"LLM" AND "agent"', '"agent" AND "llm"']) == [
+        '"LLM" AND "agent"'
+    ]
+    assert searched(context, ['"LLM" AND "agent"']) == []
+
+
+def test_single_query(context):
+    # A single query per completion is never dropped as similar
+    assert searched(context, ['"LLM" AND "agent" AND "code"']) == [
+        '"LLM" AND "agent" AND "code"'
+    ]
+    assert searched(context, ['"LLM" AND "agent" AND "code" AND "test"']) == [
+        '"LLM" AND "agent" AND "code" AND "test"'
+    ]
+
+
+def test_similar_queries(context, monkeypatch):
+    monkeypatch.setattr("info_gap.task.brainstorm.BRAINSTORM_QUERIES", 3)
+    queries = [
+        '"a" AND "b" AND "c" AND "d" AND "e"',
+        '"a" AND "b" AND "c" AND "d" AND "e" AND "f"',
+        '("a" AND "b" AND "c") ANDNOT "survey"',
+    ]
+    assert searched(context, queries) == [queries[0], queries[2]]
+    # The query dropped as similar is not recorded as run
+    monkeypatch.setattr("info_gap.task.brainstorm.BRAINSTORM_QUERIES", 1)
+    assert searched(context, [queries[1]]) == [queries[1]]
+
+
+def test_invalid_reply(context):
+    # Nothing can be searched, the reply is repaired
+    with pytest.raises(ValidationError):
+        searched(context, ["(unbalanced"])
@@ -0,0 +1,70 @@
+"""Test the completion cache."""
+
+import pytest
+from info_gap.cache import CompletionCache
+
+
+class Clock:
+    """Wall clock moved by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr("info_gap.cache.time", clock)
+    return clock
+
+
+def test_key():
+    messages = [{"role": "user", "content": "Hi"}]
+    key = CompletionCache.key("model", messages, 0)
+    assert key == CompletionCache.key("model", [{"content": "Hi", "role": "user"}], 0)
+    assert key != CompletionCache.key("model", messages, 1)
+    assert key != CompletionCache.key("other", messages, 0)
+    assert key != CompletionCache.key("model", messages, 0, stop_chars=80)
+
+
+def test_persistence(tmp_path, clock):
+    path = str(tmp_path / "completion.sqlite3")
+    CompletionCache(path, 10, 60).put("key", "reply")
+    cache = CompletionCache(path, 10, 60)
+    assert cache.get("key") == "reply"
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_max_age(tmp_path, clock):
+    cache = CompletionCache(str(tmp_path / "completion.sqlite3"), 10, 60)
+    cache.put("key", "reply")
+    clock.now += 59
+    assert cache.get("key") == "reply"
+    # Reading an entry does not extend its life
+    clock.now += 2
+    assert cache.get("key") is None
+
+
+def test_eviction(tmp_path, clock):
+    cache = CompletionCache(str(tmp_path / "completion.sqlite3"), 2, 60)
+    cache.EVICT_INTERVAL = 1
+    cache.put("first", "reply")
+    clock.now += 1
+    cache.put("second", "reply")
+    clock.now += 1
+    assert cache.get("first") == "reply"
+    clock.now += 1
+    # Over the limit, the least recently used entry goes
+    cache.put("third", "reply")
+    assert cache.get("second") is None
+    assert cache.get("first") == "reply"
+    assert cache.get("third") == "reply"
+    # Expired entries go at the next eviction
+    clock.now += 61
+    cache.put("fourth", "reply")
+    keys = [key for (key,) in cache.conn.execute("SELECT key FROM completion")]
+    assert keys == ["fourth"]
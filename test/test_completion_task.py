@@ -0,0 +1,74 @@
+"""Test repairing malformed replies in place."""
+
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from conftest import records
+from info_gap.article import Article
+from info_gap.config import REPAIR_ATTEMPTS
+from info_gap.error import ValidationError
+from info_gap.model import Request
+from info_gap.task.generate_feed import GenerateFeedTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about testing",
+    accepted_reason_format="It tests ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+
+def feed_task() -> GenerateFeedTask:
+    article = Article(
+        entry_id="http://arxiv.org/abs/1",
+        title="Title",
+        summary="Summary",
+        published=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+    return GenerateFeedTask(REQUEST, article)
+
+
+def test_valid_reply(context, llm):
+    llm.replies.append("Yes! It tests parsers.")
+    with context.use():
+        assert not list(feed_task().run())
+    assert len(llm.requests) == 1
+    assert [record["reason"] for record in records(context, "test/proof")] == [
+        "It tests parsers."
+    ]
+
+
+def test_repair(context, llm):
+    llm.replies.extend(["Maybe, it is about cooking.", "No! It is about cooking."])
+    with context.use():
+        assert not list(feed_task().run())
+    # The malformed reply is rewritten, deterministically, with the error
+    repair = llm.requests[1]
+    assert repair["temperature"] == 0
+    assert "Reply: Maybe, it is about cooking." in repair["messages"][-1]["content"]
+    assert "Error: The reply does not start" in repair["messages"][-1]["content"]
+    assert [record["verdict"] for record in records(context, "test/anti-proof")] == [
+        "rejected"
+    ]
+
+
+def test_repair_fails(context, llm):
+    llm.replies.extend(["Maybe."] * (1 + REPAIR_ATTEMPTS))
+    with context.use(), pytest.raises(ValidationError) as error:
+        list(feed_task().run())
+    assert len(llm.requests) == 1 + REPAIR_ATTEMPTS
+    # The error does not repeat the reply
+    assert "Maybe" not in str(error.value)
+
+
+def test_repair_async(context, llm):
+    llm.replies.extend(["Maybe.", "Yes! It tests parsers."])
+
+    async def run():
+        return [subtask async for subtask in feed_task().arun()]
+
+    with context.use():
+        assert not asyncio.run(run())
+    assert len(llm.requests) == 2
+    assert len(records(context, "test/proof")) == 1
@@ -0,0 +1,57 @@
+"""Test the deduplication store."""
+
+from info_gap.context import RuntimeContext
+from info_gap.deduplicate import (
+    BloomFilter,
+    DedupStore,
+    dedup_articles,
+    judged_articles,
+)
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(100, 0.01)
+    bloom.add("a")
+    assert "a" in bloom
+    assert sum(str(key) in bloom for key in range(100)) < 10
+
+
+def test_shared_file(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    first, second = DedupStore(path, 100, 0.01), DedupStore(path, 100, 0.01)
+    assert first.add_many("request", ["a", "b", "a"]) == [True, True, False]
+    # The second connection's filter has not seen the keys, SQLite decides
+    assert second.add_many("request", ["a", "c"]) == [False, True]
+    assert not first.add("request", "c")
+    assert second.add("other", "a")
+
+
+def test_reopen(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    DedupStore(path, 100, 0.01).add("request", "a")
+    store = DedupStore(path, 100, 0.01)
+    assert "request\0a" in store.bloom
+    assert not store.add("request", "a")
+
+
+def test_judged_articles(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+
+    def context():
+        return RuntimeContext(
+            completion_cache_path="",
+            arxiv_cache_path="",
+            dedup_path=path,
+            watch_path="",
+            log_dir=str(tmp_path),
+        )
+
+    with context().use():
+        assert dedup_articles(["a", "b"], "request") == [True, True]
+        assert dedup_articles(["a", "b"], "request") == [False, False]
+        judged_articles(["a"], "request")
+        assert dedup_articles(["a"], "request") == [False]
+    # A new run queues the articles left without a verdict again
+    with context().use():
+        assert dedup_articles(["a", "b"], "request") == [False, True]
+        assert dedup_articles(["a"], "other") == [True]
@@ -0,0 +1,157 @@
+"""Test the durable task queue and its workers."""
+
+import json
+import time
+import pytest
+from info_gap.context import RuntimeContext, get_context
+from info_gap.durable_queue import DurableTaskQueue
+from info_gap.model import Request, Search
+from info_gap.scheduler import DurableScheduler
+from info_gap.snapshot import ingest
+from info_gap.task.base_task import BaseTask
+from info_gap.task.search import SearchTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about language model agents",
+    accepted_reason_format="It is about ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+
+class Job(BaseTask):
+    """Task that only carries a name and a priority."""
+
+    def dump(self):
+        return {"name": self.name, "priority": self.priority}
+
+    @classmethod
+    def load(cls, state):
+        return cls(state["name"], state["priority"])
+
+
+class JobProducer(Job):
+    """Task that produces `Job`s."""
+
+    produces = ("Job",)
+
+
+@pytest.fixture(name="queue")
+def fixture_queue(tmp_path) -> DurableTaskQueue:
+    return DurableTaskQueue(str(tmp_path / "queue.sqlite3"), {"Job": 1})
+
+
+def test_lease_order(queue):
+    queue.push(Job("low", 1))
+    queue.push(Job("high", 2))
+    assert queue.lease("worker", 10)[1].name == "high"
+    assert queue.lease("worker", 10)[1].name == "low"
+    assert queue.lease("worker", 10) is None
+
+
+def test_lease_expiry(queue):
+    queue.push(Job("job", 1))
+    task_id, _ = queue.lease("dead", 0.05)
+    assert queue.lease("other", 10) is None
+    time.sleep(0.1)
+    # The lease of a dead worker expired, another one takes the task over
+    assert queue.lease("other", 10)[0] == task_id
+
+
+def test_heartbeat(queue):
+    queue.push(Job("job", 1))
+    task_id, _ = queue.lease("worker", 0.05)
+    queue.heartbeat("worker", task_id, 10)
+    # Only the worker holding the lease extends it
+    queue.heartbeat("other", task_id, 0)
+    time.sleep(0.1)
+    assert queue.lease("other", 10) is None
+
+
+def test_complete(queue):
+    queue.push(Job("job", 1))
+    task_id, _ = queue.lease("worker", 10)
+    queue.complete(task_id, [Job("subtask", 1)])
+    assert len(queue) == 1
+    assert queue.lease("worker", 10)[1].name == "subtask"
+
+
+def test_retry(queue):
+    queue.push(Job("job", 1))
+    task_id, _ = queue.lease("worker", 10)
+    queue.complete(task_id, [], retry_delay=0.05)
+    assert queue.lease("worker", 10) is None
+    time.sleep(0.1)
+    assert queue.lease("worker", 10)[1].attempts == 1
+
+
+def test_backlog_pause(queue):
+    queue.push(Job("first", 1))
+    queue.push(Job("second", 1))
+    queue.push(JobProducer("producer", 2))
+    # The backlog of `Job` is full, the producer waits until it is leased
+    assert queue.lease("worker", 10)[1].name == "first"
+    assert queue.lease("worker", 10)[1].name == "second"
+    assert queue.lease("worker", 10)[1].name == "producer"
+
+
+def test_reclaimed_search(tmp_path, monkeypatch):
+    # Results newer than the snapshot would come from the API
+    monkeypatch.setattr("info_gap.task.search.ARXIV_SNAPSHOT_LIVE", False)
+    source = tmp_path / "snapshot.json"
+    with open(source, "w", encoding="UTF-8") as f:
+        for index in range(3):
+            record = {
+                "id": f"000{index}",
+                "versions": [
+                    {
+                        "version": "v1",
+                        "created": f"Mon, {index + 1} Jan 2024 00:00:00 GMT",
+                    }
+                ],
+                "title": f"Language model agents {index}",
+                "abstract": "Agents built on language models.",
+                "categories": "cs.CL",
+            }
+            f.write(json.dumps(record) + "\n")
+    ingest(str(source), str(tmp_path / "snapshot"))
+
+    def context():
+        return RuntimeContext(
+            completion_cache_path="",
+            arxiv_cache_path="",
+            arxiv_snapshot_path=str(tmp_path / "snapshot"),
+            dedup_path=str(tmp_path / "dedup.sqlite3"),
+            watch_path="",
+            log_dir=str(tmp_path / "log"),
+            share_searches=False,
+        )
+
+    queue = DurableTaskQueue(str(tmp_path / "queue.sqlite3"))
+    queue.push(SearchTask([REQUEST], Search(query="agents")))
+
+    # The first worker handles the page, then dies before completing the task
+    dead = DurableScheduler(queue, lease_seconds=0.05, context=context())
+    _, task = queue.lease(dead.worker, 0.05)
+    with dead.context.use():
+        subtasks, _ = dead.execute(task)
+    assert (
+        sum(type(subtask).__name__ == "GenerateFeedTask" for subtask in subtasks) == 3
+    )
+    time.sleep(0.1)
+
+    # Another worker reclaims the search, the page still produces its feed tasks
+    worker = DurableScheduler(queue, context=context())
+    worker.worker = "other"
+    worker.run(max_tasks=1)
+    kinds = [kind for (kind,) in queue.conn.execute("SELECT kind FROM task")]
+    assert kinds.count("GenerateFeedTask") == 3
+
+
+def test_worker_context(queue):
+    # A worker builds its own context, the default one keeps sharing searches
+    assert not DurableScheduler(queue).context.share_searches
+    assert get_context().share_searches
+    with pytest.raises(ValueError):
+        DurableScheduler(queue, context=RuntimeContext())
@@ -0,0 +1,63 @@
+"""Test parsing and canonicalization of queries."""
+
+import pytest
+from info_gap.error import ValidationError
+from info_gap.query import (
+    And,
+    Not,
+    Or,
+    QueryHistory,
+    Term,
+    canonical_query,
+    parse_query,
+)
+
+
+def test_operand_order():
+    assert canonical_query('"LLM" AND agent') == canonical_query('agent AND "llm"')
+    assert canonical_query("a OR b") == canonical_query("b OR a")
+
+
+def test_nesting():
+    assert canonical_query("a AND (b AND c)") == canonical_query("(a AND b) AND c")
+    assert canonical_query("a OR (b OR a)") == canonical_query("a OR b")
+    assert canonical_query("a AND (b OR c)") != canonical_query("(a AND b) OR c")
+
+
+def test_andnot():
+    assert parse_query("a ANDNOT b") == And((Term("a"), Not(Term("b"))))
+    assert canonical_query("a ANDNOT b") == canonical_query("A  ANDNOT  B")
+    assert canonical_query("a ANDNOT b") != canonical_query("b ANDNOT a")
+
+
+def test_implicit_and():
+    assert parse_query('a "b c" OR d') == Or((And((Term("a"), Term("b c"))), Term("d")))
+
+
+@pytest.mark.parametrize("query", ["", "a AND", "(a OR b", "a OR b)", 'a "b'])
+def test_parse_errors(query):
+    with pytest.raises(ValidationError):
+        parse_query(query)
+
+
+def test_similarity():
+    history = QueryHistory()
+    history.add('"LLM" AND "agent"', "request")
+    assert history.similarity('"agent" AND "llm"', "request") == 1
+    # Other operators, or negated terms, make another query
+    assert history.similarity('"LLM" OR "agent"', "request") == 0
+    assert history.similarity('("LLM" AND "agent") ANDNOT "survey"', "request") < 0.8
+    assert history.similarity('"LLM"', "other") == 0
+
+
+def test_overlap():
+    history = QueryHistory()
+    history.add('"LLM" AND "agent"', "request")
+    assert history.overlap('"LLM" AND "agent" AND "code"', "request") == 1
+    assert history.overlap('"LLM" ANDNOT "agent"', "request") == 0.5
+
+
+def test_history_load():
+    history = QueryHistory(lambda name: ['"LLM" AND "agent"'] if name == "r" else [])
+    assert history.similarity('"agent" AND "LLM"', "r") == 1
+    assert history.similarity('"agent" AND "LLM"', "other") == 0
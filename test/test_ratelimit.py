@@ -0,0 +1,81 @@
+"""Test the retry policy and the adaptive concurrency of endpoints."""
+
+import httpx
+import openai
+from info_gap.ratelimit import AdaptiveLimiter, is_retryable, retry_delay
+
+
+def status_error(status: int, headers=None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def test_is_retryable():
+    assert is_retryable(ConnectionError())
+    assert is_retryable(TimeoutError())
+    assert is_retryable(status_error(429))
+    assert is_retryable(status_error(503))
+    assert not is_retryable(status_error(400))
+    assert not is_retryable(ValueError())
+
+
+def test_retry_delay():
+    error = ConnectionError()
+    for attempt in range(5):
+        assert 0 <= retry_delay(error, attempt, base=1, cap=10) <= min(10, 2**attempt)
+    assert retry_delay(error, 10_000, base=1, cap=10) <= 10
+
+
+def test_retry_after():
+    error = status_error(429, {"retry-after": "3"})
+    assert retry_delay(error, 0, base=1, cap=10) == 3
+    # The cap wins over the endpoint
+    assert retry_delay(status_error(429, {"retry-after": "60"}), 0, cap=10) == 10
+
+
+def test_additive_increase():
+    limiter = AdaptiveLimiter("test", 2, maximum=4)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.limit == 4
+
+
+def test_throttle():
+    limiter = AdaptiveLimiter("test", 8)
+    limiter.on_error(status_error(429))
+    assert limiter.limit == 4
+    # At most one cut per round of calls
+    limiter.on_error(status_error(429))
+    assert limiter.limit == 4
+    limiter.on_error(status_error(500))
+    assert limiter.limit == 4
+
+
+def test_latency_jitter():
+    limiter = AdaptiveLimiter("test", 4, maximum=8)
+    for index in range(100):
+        limiter.on_success(0.01 if index % 2 else 0.018)
+    assert limiter.limit == 8
+
+
+def test_latency_by_size():
+    limiter = AdaptiveLimiter("test", 4, maximum=4)
+    for _ in range(100):
+        # Long replies take longer, they are not compared with short ones
+        limiter.on_success(0.01, units=10)
+        limiter.on_success(0.1, units=1000)
+    assert limiter.limit == 4
+
+
+def test_latency_overload():
+    limiter = AdaptiveLimiter("test", 4, maximum=4)
+    for _ in range(20):
+        limiter.on_success(0.01)
+    for _ in range(2):
+        limiter.on_success(0.05)
+    assert limiter.limit == 2
+    # Once per round of calls while the endpoint stays slow
+    for _ in range(2):
+        limiter.on_success(0.05)
+    assert limiter.limit == 1
@@ -0,0 +1,80 @@
+"""Test retries of the schedulers."""
+
+import asyncio
+import json
+import pytest
+from info_gap.context import RuntimeContext
+from info_gap.scheduler import AsyncScheduler, Scheduler
+from info_gap.task.base_task import BaseTask
+
+
+class Looping(BaseTask):
+    """Task that queues itself again, like a brainstorm, and fails transiently."""
+
+    def run(self):
+        try:
+            raise ConnectionError("throttled")
+        finally:
+            yield self
+
+
+class Done(BaseTask):
+    """Task that does nothing."""
+
+    def run(self):
+        yield from ()
+
+
+def make_context(log_dir) -> RuntimeContext:
+    return RuntimeContext(
+        completion_cache_path="",
+        arxiv_cache_path="",
+        dedup_path="",
+        watch_path="",
+        log_dir=str(log_dir),
+    )
+
+
+@pytest.fixture(name="context")
+def fixture_context(tmp_path) -> RuntimeContext:
+    return make_context(tmp_path)
+
+
+def test_backoff_requeued(context):
+    scheduler = Scheduler(context=context)
+    task = Looping("looping", 0)
+    with context.use():
+        subtasks, delay = scheduler.execute(task)
+    # The task is queued after a delay instead of right away
+    assert subtasks == []
+    assert delay is not None
+    assert task.attempts == 1
+
+
+def test_backoff_requeued_async(context):
+    scheduler = AsyncScheduler(context=context)
+    task = Looping("looping", 0)
+    scheduler.running[task.resource] = 1
+    with context.use():
+        asyncio.run(scheduler.run_task(task))
+    assert scheduler.queue.pop() is None
+    assert [delayed for _, _, delayed in scheduler.queue.delayed] == [task]
+
+
+def test_metrics_by_context(tmp_path):
+    first = Scheduler(context=make_context(tmp_path / "first"))
+    second = Scheduler(context=make_context(tmp_path / "second"))
+    for index in range(3):
+        first.add_task(Done(f"done {index}", 0))
+    second.add_task(Looping("looping", 0))
+    first.run()
+    second.run(max_tasks=1)
+
+    # Each run writes its own metrics, not those of every scheduler in the process
+    with open(f"{first.context.log_path}/metrics.json", encoding="UTF-8") as f:
+        tasks = json.load(f)["tasks"]
+    assert list(tasks) == ["Done"]
+    assert tasks["Done"]["runs"] == 3
+    snapshot = second.context.metrics.snapshot()
+    assert list(snapshot["tasks"]) == ["Looping"]
+    assert snapshot["tasks"]["Looping"]["retries"] == 1
@@ -0,0 +1,59 @@
+"""Test the buffered result sinks."""
+
+import gzip
+from pydantic import BaseModel
+from info_gap.sink import ResultSink
+
+
+class Record(BaseModel):
+    """A record of a few bytes."""
+
+    index: int
+
+
+def lines(path) -> int:
+    with open(path, encoding="UTF-8") as f:
+        return len(f.readlines())
+
+
+def test_flush_records(tmp_path):
+    path = tmp_path / "sink.jsonl"
+    sink = ResultSink(str(path), flush_records=3, flush_seconds=3600, rotate_bytes=0)
+    sink.write(Record(index=0))
+    sink.write(Record(index=1))
+    assert lines(path) == 0
+    sink.write(Record(index=2))
+    assert lines(path) == 3
+    sink.write(Record(index=3))
+    sink.close()
+    assert lines(path) == 4
+
+
+def test_flush_seconds(tmp_path):
+    path = tmp_path / "sink.jsonl"
+    sink = ResultSink(str(path), flush_records=100, flush_seconds=0, rotate_bytes=0)
+    sink.write(Record(index=0))
+    assert lines(path) == 1
+    sink.close()
+
+
+def test_rotation(tmp_path):
+    path = tmp_path / "sink.jsonl"
+    sink = ResultSink(str(path), flush_records=1, rotate_bytes=30)
+    for index in range(3):
+        sink.write(Record(index=index))
+    # Three records of 12 bytes reach the limit
+    with gzip.open(f"{path}.1.gz", "rt", encoding="UTF-8") as f:
+        assert [Record.model_validate_json(line).index for line in f] == [0, 1, 2]
+    assert lines(path) == 0
+    sink.close()
+
+    # A later run does not overwrite the compressed files
+    sink = ResultSink(str(path), flush_records=1, rotate_bytes=30)
+    for index in range(3, 6):
+        sink.write(Record(index=index))
+    sink.close()
+    with gzip.open(f"{path}.1.gz", "rt", encoding="UTF-8") as f:
+        assert len(f.readlines()) == 3
+    with gzip.open(f"{path}.2.gz", "rt", encoding="UTF-8") as f:
+        assert [Record.model_validate_json(line).index for line in f] == [3, 4, 5]
@@ -0,0 +1,53 @@
+"""Test searching an ingested arXiv snapshot."""
+
+import json
+import pytest
+from info_gap.snapshot import ArxivSnapshot, ingest
+
+RECORDS = [
+    ("0001", "Mon, 1 Jan 2024 00:00:00 GMT", "Large language model agents", "cs.CL"),
+    ("0002", "Tue, 2 Jan 2024 00:00:00 GMT", "A model of large language", "cs.CL"),
+    ("0003", "Wed, 3 Jan 2024 00:00:00 GMT", "Language model agents for code", "cs.SE"),
+    ("0004", "Thu, 4 Jan 2024 00:00:00 GMT", "Large language models", "math.CO"),
+]
+
+
+@pytest.fixture(name="snapshot")
+def fixture_snapshot(tmp_path) -> ArxivSnapshot:
+    source = tmp_path / "snapshot.json"
+    with open(source, "w", encoding="UTF-8") as f:
+        for arxiv_id, created, title, categories in RECORDS:
+            record = {
+                "id": arxiv_id,
+                "versions": [{"version": "v1", "created": created}],
+                "title": title,
+                "abstract": f"Abstract of {title.lower()}.",
+                "categories": categories,
+            }
+            f.write(json.dumps(record) + "\n")
+    assert ingest(str(source), str(tmp_path / "snapshot"), ["cs."]) == 3
+    return ArxivSnapshot(str(tmp_path / "snapshot"))
+
+
+def ids(snapshot: ArxivSnapshot, query: str):
+    return [result.entry_id.rsplit("/", 1)[1] for result in snapshot.results(query, 10)]
+
+
+def test_phrase(snapshot):
+    # Newest first, and the words must be adjacent
+    assert ids(snapshot, '"language model"') == ["0003v1", "0001v1"]
+    assert ids(snapshot, '"large language"') == ["0002v1", "0001v1"]
+
+
+def test_andnot(snapshot):
+    assert ids(snapshot, "language ANDNOT agents") == ["0002v1"]
+    assert ids(snapshot, 'model ANDNOT "large language model"') == [
+        "0003v1",
+        "0002v1",
+    ]
+
+
+def test_offset(snapshot):
+    assert [result.title for result in snapshot.results("language", 2, 1)] == [
+        "A model of large language"
+    ]
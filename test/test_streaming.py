@@ -0,0 +1,100 @@
+"""Test streaming feed replies and stopping rejections early."""
+
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from conftest import records
+from info_gap.article import Article
+from info_gap.context import RuntimeContext
+from info_gap.model import Request
+from info_gap.task.generate_feed import GenerateFeedTask
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about testing",
+    accepted_reason_format="It tests ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+REJECTION = "No! It is about cooking, " + "and many other things " * 10
+ACCEPTANCE = "Yes! It tests parsers, " + "and many other things " * 10
+
+
+@pytest.fixture(autouse=True)
+def fast_reject(monkeypatch):
+    monkeypatch.setattr("info_gap.task.generate_feed.FAST_REJECT", True)
+    monkeypatch.setattr("info_gap.task.generate_feed.FAST_REJECT_CHARS", 20)
+
+
+def feed_task() -> GenerateFeedTask:
+    article = Article(
+        entry_id="http://arxiv.org/abs/1",
+        title="Title",
+        summary="Summary",
+        published=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+    return GenerateFeedTask(REQUEST, article)
+
+
+def test_stop_early():
+    task = feed_task()
+    assert task.streaming
+    assert not task.stop_early("No! Too short")
+    assert task.stop_early("No! " + "x" * 20)
+    assert not task.stop_early("Yes! " + "x" * 100)
+
+
+def test_rejection_cut(context, llm):
+    llm.replies.append(REJECTION)
+    with context.use():
+        list(feed_task().run())
+    stream = llm.streams[0]
+    # The connection is closed once the reason is long enough
+    assert stream.closed
+    assert stream.sent < len(stream.chunks) // 2
+    (record,) = records(context, "test/anti-proof")
+    assert REJECTION.startswith(f"No! {record['reason']}")
+    assert 20 <= len(record["reason"]) < 30
+
+
+def test_acceptance_full(context, llm):
+    llm.replies.append(ACCEPTANCE)
+    with context.use():
+        list(feed_task().run())
+    assert llm.streams[0].sent == len(llm.streams[0].chunks)
+    (record,) = records(context, "test/proof")
+    assert f"Yes! {record['reason']}" == ACCEPTANCE
+
+
+def test_rejection_cut_async(context, llm):
+    llm.replies.append(REJECTION)
+
+    async def run():
+        return [subtask async for subtask in feed_task().arun()]
+
+    with context.use():
+        asyncio.run(run())
+    assert llm.streams[0].closed
+    assert len(records(context, "test/anti-proof")) == 1
+
+
+def test_cached_cut(tmp_path, llm, monkeypatch):
+    context = RuntimeContext(
+        openai_api_url="http://llm.test/v1",
+        completion_cache_path=str(tmp_path / "completion.sqlite3"),
+        arxiv_cache_path="",
+        dedup_path="",
+        watch_path="",
+        log_dir=str(tmp_path / "log"),
+    )
+    context.resources["openai"] = llm.client()
+    llm.replies.extend([REJECTION, REJECTION])
+    with context.use():
+        list(feed_task().run())
+        list(feed_task().run())
+        assert len(llm.requests) == 1
+        # A reply cut at another length is not reused
+        monkeypatch.setattr("info_gap.task.completion_task.FAST_REJECT_CHARS", 40)
+        list(feed_task().run())
+    assert len(llm.requests) == 2
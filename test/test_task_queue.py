@@ -0,0 +1,63 @@
+"""Test the ready queue of tasks."""
+
+from info_gap.task.base_task import BaseTask
+from info_gap.task_queue import TaskQueue
+
+
+class Task(BaseTask):
+    """Task that only carries a name and a priority."""
+
+    blocked = False
+
+    def waiting(self) -> bool:
+        return self.blocked
+
+
+class Producer(Task):
+    """Task that produces `Task`s."""
+
+    produces = ("Task",)
+
+
+def pop_all(queue: TaskQueue):
+    names = []
+    while (task := queue.pop()) is not None:
+        names.append(task.name)
+    return names
+
+
+def test_stable_order():
+    queue = TaskQueue()
+    for name, priority in [("a", 1), ("b", 2), ("c", 1), ("d", 2)]:
+        queue.push(Task(name, priority))
+    assert pop_all(queue) == ["b", "d", "a", "c"]
+
+
+def test_priority_change():
+    queue = TaskQueue()
+    first, second = Task("first", 2), Task("second", 1)
+    queue.push(first)
+    queue.push(second)
+    first.priority = 0
+    assert pop_all(queue) == ["second", "first"]
+
+
+def test_admission():
+    queue = TaskQueue(max_backlog={"Task": 1})
+    queue.push(Task("consumer", 0))
+    queue.push(Producer("producer", 1))
+    # The backlog of `Task` is full, the producer waits for the consumer
+    assert queue.pop().name == "consumer"
+    assert queue.pop().name == "producer"
+    assert queue.pop() is None
+
+
+def test_waiting():
+    queue = TaskQueue()
+    task = Task("task", 0)
+    task.blocked = True
+    queue.push(task)
+    assert queue.pop() is None
+    assert len(queue) == 1
+    task.blocked = False
+    assert queue.pop() is task
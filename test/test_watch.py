@@ -0,0 +1,77 @@
+"""Test watching the queries of a request for articles newer than their watermark."""
+
+from datetime import datetime, timedelta, timezone
+import arxiv  # type: ignore
+from info_gap.model import Request, Search
+from info_gap.task.search import SearchTask
+from info_gap.watch import WatchStore
+
+REQUEST = Request(
+    name="test",
+    this_paper_should_be="about language model agents",
+    accepted_reason_format="It is about ...",
+    unaccepted_reason_format="It is about ...",
+    examples=[],
+)
+
+NEWEST = datetime(2024, 1, 10, tzinfo=timezone.utc)
+
+
+def page(size: int):
+    return [
+        arxiv.Result(
+            entry_id=f"http://arxiv.org/abs/{index}",
+            title=f"Language model agents {index}",
+            summary="Agents built on language models.",
+            published=NEWEST - timedelta(days=index),
+        )
+        for index in range(size)
+    ]
+
+
+def test_store(tmp_path):
+    path = str(tmp_path / "watch.sqlite3")
+    store = WatchStore(path)
+    store.advance("agents", "test", NEWEST)
+    # The watermark never moves back
+    store.advance("agents", "test", NEWEST - timedelta(days=1))
+    for accepted in (True, True, False):
+        store.record_verdict("agents", "test", accepted)
+    store.record_verdict("robots", "test", False)
+    store.record_verdict("agents", "other", False)
+
+    best, worst = WatchStore(path).queries("test")
+    assert best.query == "agents"
+    assert best.watermark == NEWEST
+    assert (best.judged, best.accepted) == (3, 2)
+    assert worst.query == "robots"
+    assert worst.watermark is None
+
+
+def test_watermark_filter(context):
+    since = NEWEST - timedelta(days=3)
+    task = SearchTask([REQUEST], Search(query="agents"), prefetch_depth=0, since=since)
+    with context.use():
+        subtasks = list(task.handle_page(page(10)))
+        (watched,) = context.watch_store.queries(REQUEST.name)
+    # Only the results submitted after the watermark are judged
+    feeds = [subtask for subtask in subtasks if subtask is not task]
+    assert sorted(feed.article.published for feed in feeds) == [
+        NEWEST - timedelta(days=index) for index in (2, 1, 0)
+    ]
+    assert task not in subtasks
+    assert watched.watermark == NEWEST
+
+
+def test_watch(context):
+    with context.use():
+        store = context.watch_store
+        store.advance("agents", REQUEST.name, NEWEST)
+        store.record_verdict("agents", REQUEST.name, True)
+        for _ in range(30):
+            store.record_verdict("robots", REQUEST.name, False)
+        (task,) = SearchTask.watch(REQUEST)
+    # Queries that stopped yielding are not watched
+    assert task.search.query == "agents"
+    assert task.since == NEWEST
+    assert task.prefetch_depth == 0